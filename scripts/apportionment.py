@@ -0,0 +1,336 @@
+#
+# Thresholds and allocation of seats with the D'Hondt method and other methods.
+#
+# Seats go to the highest quotients votes / divisor. If two quotients are equal,
+# the party with the higher number of votes wins, and if votes are equal too,
+# the party which is earlier on the list of parties.
+#
+# Other methods are kept in APPORTIONMENT_METHODS {name: allocation function}, all of them
+# take (districts x parties) votes, seats in districts and a boolean vector of eligible
+# parties. Divisor methods (D'Hondt, Sainte-Laguë / Webster, modified Sainte-Laguë,
+# Imperiali) share one quotient table kernel and differ only in divisors. Largest
+# remainder methods (Hare / Hare-Niemeyer, Droop) give floor(votes / quota) seats
+# and the rest to the largest remainders, with the same tie-breaking.
+#
+import heapq
+from functools import partial
+
+import numpy as np
+
+from constants import *
+
+
+# Parties which take part in the allocation of seats, results is a dict {party: votes}
+def select_parties_over_threshold(results, sum_of_votes):
+    parties_over_threshold = []
+    for party in LIST_OF_PARTIES:
+        if party == "MN":
+            parties_over_threshold.append(party)
+        elif party == "Inne":
+            continue
+        elif party == "TD":
+            if results[party] > COALITION_TRESHOLD * sum_of_votes:
+                parties_over_threshold.append(party)
+        elif results[party] > PARTY_TRESHOLD * sum_of_votes:
+            parties_over_threshold.append(party)
+    return parties_over_threshold
+
+
+# Fraction of all votes a party must exceed, MN is exempt and "Inne" never takes part
+def get_threshold(party):
+    if party == "MN":
+        return -np.inf
+    if party == "Inne":
+        return np.inf
+    if party == "TD":
+        return COALITION_TRESHOLD
+    return PARTY_TRESHOLD
+
+
+# Vectorized select_parties_over_threshold() for K scenarios, results is a (K x parties)
+# array in LIST_OF_PARTIES order. Returns a (K x parties) boolean array.
+def select_parties_over_threshold_array(results, sums_of_votes):
+    results = np.atleast_2d(results)
+    thresholds = np.array([get_threshold(party) for party in LIST_OF_PARTIES])
+    sums_of_votes = np.asarray(sums_of_votes, dtype=np.float64).reshape(-1, 1)
+    return results > thresholds * sums_of_votes
+
+
+# Allocate seats in one district, results is a dict {party: votes}
+def allocate_dhont(results, parties, n_seats):
+    mandates = {party: 0 for party in results}
+    if not parties:
+        return mandates
+
+    # Heap of (-quotient, -votes, position on the list, party)
+    heap = [
+        (-results[party], -results[party], i, party) for i, party in enumerate(parties)
+    ]
+    heapq.heapify(heap)
+
+    for _ in range(n_seats):
+        _, negative_votes, i, party = heapq.heappop(heap)
+        mandates[party] += 1
+        heapq.heappush(
+            heap, (-results[party] / (mandates[party] + 1), negative_votes, i, party)
+        )
+    return mandates
+
+
+# Divisors of the first n seats of a party
+def dhont_divisors(n):
+    return np.arange(1, n + 1, dtype=np.float64)
+
+
+def sainte_lague_divisors(n):
+    return 2 * np.arange(1, n + 1, dtype=np.float64) - 1
+
+
+# Sainte-Laguë with the first divisor raised to 1.4, which favours larger parties
+def modified_sainte_lague_divisors(n):
+    divisors = sainte_lague_divisors(n)
+    divisors[:1] = 1.4
+    return divisors
+
+
+def imperiali_divisors(n):
+    return np.arange(2, n + 2, dtype=np.float64)
+
+
+# Allocate seats in all districts at once.
+# votes is a (districts x parties) array, n_seats a vector of seats in districts
+# and eligible a boolean vector of parties which take part in the allocation
+# (or a (districts x parties) array, if they differ between districts).
+# Returns (districts x parties) array of seats.
+def allocate_dhont_all_districts(votes, n_seats, eligible):
+    return allocate_divisor_all_districts(votes, n_seats, eligible, dhont_divisors)
+
+
+# Allocate seats in all districts with a divisor method, divisors(n) returns
+# an increasing vector of divisors of the first n seats of a party
+def allocate_divisor_all_districts(votes, n_seats, eligible, divisors):
+    votes = np.asarray(votes, dtype=np.float64)
+    n_seats = np.asarray(n_seats)
+    eligible = np.broadcast_to(np.asarray(eligible, dtype=bool), votes.shape)
+    n_districts, n_parties = votes.shape
+    mandates = np.zeros((n_districts, n_parties), dtype=np.int64)
+
+    max_seats = int(n_seats.max()) if n_districts > 0 else 0
+    if max_seats == 0 or not eligible.any():
+        return mandates
+
+    # Quotient table (districts x parties x divisors)
+    quotients = votes[:, :, None] / divisors(max_seats)
+    quotients[~eligible] = -np.inf
+
+    # Last awarded quotient in every district: partition out the top max_seats
+    # quotients and sort only them
+    flat = quotients.reshape(n_districts, -1)
+    top = -np.partition(-flat, max_seats - 1, axis=1)[:, :max_seats]
+    top = -np.sort(-top, axis=1)
+    last_quotients = np.where(
+        n_seats > 0, top[np.arange(n_districts), np.maximum(n_seats - 1, 0)], np.inf
+    )
+
+    mandates += (quotients > last_quotients[:, None, None]).sum(axis=2)
+    ties = (quotients == last_quotients[:, None, None]).sum(axis=2)
+    remaining = n_seats - mandates.sum(axis=1)
+
+    # Quotients equal to the last awarded one get all remaining seats,
+    # unless there are more of them than seats
+    simple = ties.sum(axis=1) == remaining
+    mandates[simple] += ties[simple]
+    for district in np.flatnonzero(~simple):
+        order = sorted(
+            np.flatnonzero(ties[district]), key=lambda party: -votes[district, party]
+        )
+        for party in order:
+            seats = min(ties[district, party], remaining[district])
+            mandates[district, party] += seats
+            remaining[district] -= seats
+
+    return mandates
+
+
+def hare_quota(votes, n_seats):
+    return votes / n_seats
+
+
+def droop_quota(votes, n_seats):
+    return np.floor(votes / (n_seats + 1)) + 1
+
+
+# Allocate seats in all districts with a largest remainder method,
+# quota(votes, n_seats) returns the quota of every district
+def allocate_largest_remainder_all_districts(votes, n_seats, eligible, quota):
+    votes = np.asarray(votes, dtype=np.float64)
+    n_seats = np.asarray(n_seats)
+    eligible = np.broadcast_to(np.asarray(eligible, dtype=bool), votes.shape)
+    n_districts, n_parties = votes.shape
+
+    eligible_votes = np.where(eligible, votes, 0)
+    sums_of_votes = eligible_votes.sum(axis=1)
+    has_seats = (sums_of_votes > 0) & (n_seats > 0)
+    quotas = np.where(has_seats, quota(sums_of_votes, np.maximum(n_seats, 1)), 1)
+
+    exact = eligible_votes / quotas[:, None]
+    mandates = np.floor(exact).astype(np.int64)
+    mandates[~has_seats] = 0
+    remaining = np.where(has_seats, n_seats - mandates.sum(axis=1), 0)
+
+    # Rank parties by remainder, then by votes, then by position on the list
+    remainders = np.where(eligible, exact - mandates, -np.inf)
+    positions = np.broadcast_to(np.arange(n_parties), votes.shape)
+    order = np.lexsort((positions, -votes, -remainders), axis=1)
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, positions, axis=1)
+    mandates += ranks < remaining[:, None]
+    return mandates
+
+
+APPORTIONMENT_METHODS = {
+    "dhont": allocate_dhont_all_districts,
+    "sainte_lague": partial(
+        allocate_divisor_all_districts, divisors=sainte_lague_divisors
+    ),
+    "modified_sainte_lague": partial(
+        allocate_divisor_all_districts, divisors=modified_sainte_lague_divisors
+    ),
+    "imperiali": partial(allocate_divisor_all_districts, divisors=imperiali_divisors),
+    "hare": partial(allocate_largest_remainder_all_districts, quota=hare_quota),
+    "droop": partial(allocate_largest_remainder_all_districts, quota=droop_quota),
+}
+
+
+# Add a method to APPORTIONMENT_METHODS, function(votes, n_seats, eligible) returns
+# (districts x parties) array of seats
+def register_apportionment_method(name, function):
+    APPORTIONMENT_METHODS[name] = function
+
+
+def allocate_all_districts(votes, n_seats, eligible, method="dhont"):
+    if method not in APPORTIONMENT_METHODS:
+        raise ValueError(f"Unknown apportionment method: {method}")
+    return APPORTIONMENT_METHODS[method](votes, n_seats, eligible)
+
+
+# Allocate seats in K scenarios at once, votes is a (K x districts x parties) array
+# and eligible a (K x parties) boolean array. Returns (K x districts x parties) seats.
+def allocate_all_scenarios(votes, n_seats, eligible, method="dhont"):
+    votes = np.asarray(votes, dtype=np.float64)
+    n_scenarios, n_districts, n_parties = votes.shape
+    eligible = np.broadcast_to(
+        np.asarray(eligible, dtype=bool)[:, None, :], votes.shape
+    )
+    mandates = allocate_all_districts(
+        votes.reshape(-1, n_parties),
+        np.tile(np.asarray(n_seats), n_scenarios),
+        eligible.reshape(-1, n_parties),
+        method,
+    )
+    return mandates.reshape(votes.shape)
+
+
+# Seats of one vote state under several methods (all registered methods by default),
+# returns a dict {method: (districts x parties) array of seats}
+def allocate_all_methods(votes, n_seats, eligible, methods=None):
+    votes = np.asarray(votes, dtype=np.float64)
+    if methods is None:
+        methods = list(APPORTIONMENT_METHODS)
+    return {
+        method: allocate_all_districts(votes, n_seats, eligible, method)
+        for method in methods
+    }
+
+
+# Margins of seats in all districts, computed from the D'Hondt quotient table.
+# votes, n_seats and eligible as in allocate_dhont_all_districts(). Returns a dict with:
+# "quotients" - (districts x parties x divisors) table, -inf for ineligible parties,
+# "mandates" - seats, "last_awarded" / "next_in_line" - lowest quotient which won a seat
+# and highest which did not, with their parties ("..._party", -1 if there is none),
+# "votes_to_next_seat" - (districts x parties) votes a party has to gain to win one more
+# seat if other parties keep their votes (inf for ineligible parties),
+# "flip_margin" - minimal number of votes moved from one party ("flip_loser") to another
+# ("flip_gainer") which changes any seat in the district (inf if none does).
+# Thresholds are assumed not to change.
+def calculate_seat_margins(votes, n_seats, eligible):
+    votes = np.asarray(votes, dtype=np.float64)
+    n_seats = np.asarray(n_seats)
+    eligible = np.asarray(eligible, dtype=bool)
+    n_districts, n_parties = votes.shape
+    districts = np.arange(n_districts)
+    max_seats = int(n_seats.max()) if n_districts > 0 else 0
+
+    mandates = allocate_dhont_all_districts(votes, n_seats, eligible)
+    quotients = votes[:, :, None] / np.arange(1, max_seats + 1)
+    quotients[:, ~eligible, :] = -np.inf
+
+    # Last quotient which won a seat and next quotient of every party
+    with np.errstate(divide="ignore", invalid="ignore"):
+        last_quotients = np.where((mandates > 0) & eligible, votes / mandates, np.inf)
+    next_quotients = np.where(eligible, votes / (mandates + 1), -np.inf)
+
+    last_awarded_party = last_quotients.argmin(axis=1)
+    last_awarded = last_quotients[districts, last_awarded_party]
+    next_in_line_party = next_quotients.argmax(axis=1)
+    next_in_line = next_quotients[districts, next_in_line_party]
+    last_awarded_party[~np.isfinite(last_awarded)] = -1
+    next_in_line_party[~np.isfinite(next_in_line)] = -1
+
+    # Lowest last quotient and highest next quotient of parties other than p and q
+    # (districts x p x q)
+    others = ~np.eye(n_parties, dtype=bool)
+    others = others[:, None, :] & others[None, :, :]
+    last_of_others = np.where(others, last_quotients[:, None, None, :], np.inf).min(axis=3)
+    next_of_others = np.where(others, next_quotients[:, None, None, :], -np.inf).max(axis=3)
+
+    # Party p gains a seat when its next quotient beats the lowest last quotient of
+    # other parties
+    votes_to_next_seat = np.where(
+        eligible,
+        (mandates + 1) * np.diagonal(last_of_others, axis1=1, axis2=2) - votes,
+        np.inf,
+    )
+
+    # Moving t votes from q to p changes a seat when next quotient of p beats
+    # last quotient of q, when it beats last quotient of another party,
+    # or when last quotient of q falls below next quotient of another party
+    v_p, v_q = votes[:, :, None], votes[:, None, :]
+    m_p, m_q = mandates[:, :, None], mandates[:, None, :]
+    p_eligible = eligible[None, :, None]
+    q_has_seats = (m_q > 0) & eligible[None, None, :]
+    with np.errstate(invalid="ignore"):
+        margins = np.stack(
+            [
+                np.where(
+                    p_eligible & q_has_seats,
+                    (v_q * (m_p + 1) - v_p * m_q) / (m_p + m_q + 1),
+                    np.inf,
+                ),
+                np.where(p_eligible, (m_p + 1) * last_of_others - v_p, np.inf),
+                np.where(q_has_seats, v_q - m_q * next_of_others, np.inf),
+            ]
+        ).min(axis=0)
+    margins = np.maximum(margins, 0)
+    margins[margins > np.broadcast_to(v_q, margins.shape)] = np.inf
+    margins[:, np.arange(n_parties), np.arange(n_parties)] = np.inf
+
+    flat_margins = margins.reshape(n_districts, -1)
+    flips = flat_margins.argmin(axis=1)
+    flip_margin = flat_margins[districts, flips]
+    flip_gainer, flip_loser = np.divmod(flips, n_parties)
+    flip_gainer[~np.isfinite(flip_margin)] = -1
+    flip_loser[~np.isfinite(flip_margin)] = -1
+
+    return {
+        "quotients": quotients,
+        "mandates": mandates,
+        "last_awarded": last_awarded,
+        "last_awarded_party": last_awarded_party,
+        "next_in_line": next_in_line,
+        "next_in_line_party": next_in_line_party,
+        "votes_to_next_seat": votes_to_next_seat,
+        "flip_margin": flip_margin,
+        "flip_gainer": flip_gainer,
+        "flip_loser": flip_loser,
+    }
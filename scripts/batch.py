@@ -0,0 +1,330 @@
+#
+# Headless batch calculation of seats for many poll scenarios.
+#
+# Scenarios are read as CSV or JSON Lines from a file or stdin, one scenario per record
+# with results of parties in percent (columns / keys from LIST_OF_PARTIES, optional "id").
+# Results are written as JSON Lines in the order of input. Records are processed in chunks
+# by a pool of worker processes with a bounded number of chunks in flight, so memory
+# does not depend on the size of input.
+# Records which cannot be parsed or fitted get {"id", "error"} instead of seats.
+#
+# With --stats every result gets counters and timers (see instrumentation.py) of the
+# chunk in which it was fitted, with --profile-dir every scenario is fitted alone and
+# a cProfile report of it is written to <dir>/<id or position>.txt. Instrumented
+# scenarios are fitted the same way as the others, so their seats do not change.
+#
+# Method is one of APPORTIONMENT_METHODS (see apportionment.py) or "flis".
+#
+# Usage: python scripts/batch.py [input] [--format csv|jsonl] [--method dhont|flis|...]
+#                                [--districts] [--workers N] [--output path]
+#                                [--stats] [--profile-dir dir]
+#
+import argparse
+import csv
+import json
+import os
+import sys
+from collections import deque
+from itertools import islice
+
+from apportionment import APPORTIONMENT_METHODS
+from district_database import DistrictDatabase
+from constants import *
+
+METHODS = list(APPORTIONMENT_METHODS) + ["flis"]
+FORMATS = ["csv", "jsonl"]
+CHUNK_SIZE = 256
+EPSILON_PERCENT = 0.01
+
+# Database of the worker process, set by _init_worker()
+_worker_state = {}
+
+
+# Paths of source csv files in data_dir, as keyword arguments of DistrictDatabase
+def get_source_paths(data_dir):
+    return {
+        "districts_path": f"{data_dir}/okregi_sejm.csv",
+        "parlamentary2019_election_path": f"{data_dir}/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        "presidential2020_election_path": f"{data_dir}/districts_results_2020_AUTO.csv",
+        "list_leaders_path": f"{data_dir}/jedynki.csv",
+        "population_path": f"{data_dir}/ludnosc_2022.csv",
+        "area_path": f"{data_dir}/powierzchnia.csv",
+    }
+
+
+def load_database(data_dir, cache_path=None):
+    paths = get_source_paths(data_dir)
+    if cache_path is not None:
+        return DistrictDatabase.from_cache(cache_path, **paths)
+    return DistrictDatabase(**paths)
+
+
+def read_records(input_file, input_format):
+    if input_format == "csv":
+        yield from csv.DictReader(input_file)
+    else:
+        # Lines are parsed by parse_record(), so that a bad line fails only its record
+        for line in input_file:
+            if line.strip():
+                yield line
+
+
+# Record from read_records() as a dict
+def parse_record(record):
+    if isinstance(record, str):
+        record = json.loads(record)
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object")
+    return record
+
+
+# Poll results in percent from a record, "Inne" is the rest up to 100%
+def parse_poll(record):
+    poll_results_percent = {}
+    for party in LIST_OF_PARTIES:
+        value = record.get(party)
+        if value is None or value == "":
+            continue
+        poll_results_percent[party] = float(value)
+        if poll_results_percent[party] < 0:
+            raise ValueError(f"Negative result of {party}")
+    for party in LIST_OF_PARTIES:
+        poll_results_percent.setdefault(party, 0.0)
+    if record.get("Inne") in [None, ""]:
+        poll_results_percent["Inne"] = max(
+            0.0, 100 - sum(poll_results_percent.values())
+        )
+    return poll_results_percent
+
+
+# Calculate a record, instrumented if stats or a profile report are requested
+def calculate_record(
+    database, record, method, with_districts, with_stats=False, profile_path=None
+):
+    if not with_stats and profile_path is None:
+        return _calculate_record(database, record, method, with_districts)
+    with database.instrument(profile_output=profile_path) as stats:
+        result = _calculate_record(database, record, method, with_districts)
+    if with_stats:
+        result["stats"] = stats.as_dict()
+    return result
+
+
+def _calculate_record(database, record, method, with_districts):
+    if method != "flis":
+        return calculate_records_batched(database, [record], method, with_districts)[0]
+
+    result = {"id": None}
+    try:
+        record = parse_record(record)
+        result["id"] = record.get("id")
+        result["seats"] = database.get_number_of_mandates_flis(parse_poll(record))
+    except (TypeError, ValueError) as error:
+        result["error"] = str(error)
+    return result
+
+
+# Add seats of parties (and in districts) from a (districts x parties) array to result
+def _add_seats(result, database, mandates, with_districts):
+    result["seats"] = dict(zip(LIST_OF_PARTIES, mandates.sum(axis=0).tolist()))
+    if with_districts:
+        result["districts"] = {
+            district.get_id(): dict(zip(LIST_OF_PARTIES, district_mandates))
+            for district, district_mandates in zip(
+                database.get_districts(), mandates.tolist()
+            )
+        }
+
+
+# Calculate all records of a chunk with one DistrictDatabase.fit_polls_batched() call
+def calculate_records_batched(database, records, method, with_districts):
+    results = [{"id": None} for _ in records]
+    polls = []
+    positions = []
+    for position, record in enumerate(records):
+        try:
+            record = parse_record(record)
+            results[position]["id"] = record.get("id")
+            poll_results_percent = parse_poll(record)
+        except (TypeError, ValueError) as error:
+            results[position]["error"] = str(error)
+            continue
+        polls.append([poll_results_percent[party] for party in LIST_OF_PARTIES])
+        positions.append(position)
+
+    if polls:
+        _, mandates, converged = database.fit_polls_batched(
+            polls, EPSILON_PERCENT, method
+        )
+        for position, scenario_mandates, scenario_converged in zip(
+            positions, mandates, converged
+        ):
+            if scenario_converged:
+                _add_seats(results[position], database, scenario_mandates, with_districts)
+            else:
+                results[position]["error"] = "Poll results could not be fitted"
+    return results
+
+
+def _init_worker(data_dir, cache_path):
+    _worker_state["database"] = load_database(data_dir, cache_path)
+
+
+# Database of this process, also inherited by worker processes forked from it
+def get_worker_database():
+    return _worker_state.get("database")
+
+
+def set_worker_database(database):
+    _worker_state["database"] = database
+
+
+# Calculate records with the database of this process, see set_worker_database()
+def calculate_in_worker(records, method="dhont", with_districts=False):
+    return _calculate_chunk(records, 0, method, with_districts, False, None)
+
+
+def _calculate_chunk(
+    records, first_position, method, with_districts, with_stats, profile_dir
+):
+    database = _worker_state["database"]
+    if method != "flis" and profile_dir is None:
+        if not with_stats:
+            return calculate_records_batched(database, records, method, with_districts)
+        with database.instrument() as stats:
+            results = calculate_records_batched(
+                database, records, method, with_districts
+            )
+        for result in results:
+            result["stats"] = stats.as_dict()
+        return results
+
+    # Every scenario is calculated (and fitted) alone to get its own profile
+    results = []
+    for position, record in enumerate(records, first_position):
+        profile_path = None
+        if profile_dir is not None:
+            profile_path = os.path.join(
+                profile_dir, f"{_get_record_name(record, position)}.txt"
+            )
+        results.append(
+            calculate_record(
+                database, record, method, with_districts, with_stats, profile_path
+            )
+        )
+    return results
+
+
+# Id of a record, position if it has none or cannot be parsed
+def _get_record_name(record, position):
+    try:
+        id = parse_record(record).get("id")
+    except ValueError:
+        id = None
+    return position if id is None else id
+
+
+# (position of the first record, records) in chunks of chunk_size records
+def _chunks(records, chunk_size):
+    records = iter(records)
+    position = 0
+    while chunk := list(islice(records, chunk_size)):
+        yield position, chunk
+        position += len(chunk)
+
+
+# Results of all records in the order of input, at most 2 * n_workers chunks are
+# processed or waiting at the same time
+def calculate_records(
+    records,
+    method="dhont",
+    with_districts=False,
+    n_workers=1,
+    data_dir="./data",
+    cache_path=None,
+    chunk_size=CHUNK_SIZE,
+    with_stats=False,
+    profile_dir=None,
+):
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    options = (method, with_districts, with_stats, profile_dir)
+
+    if n_workers == 1:
+        _init_worker(data_dir, cache_path)
+        for position, chunk in _chunks(records, chunk_size):
+            yield from _calculate_chunk(chunk, position, *options)
+        return
+
+    # multiprocessing is imported only when it is needed (about 40 ms)
+    from concurrent.futures import ProcessPoolExecutor
+
+    max_workers = n_workers or os.cpu_count()
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(data_dir, cache_path),
+    ) as executor:
+        pending = deque()
+        for position, chunk in _chunks(records, chunk_size):
+            pending.append(executor.submit(_calculate_chunk, chunk, position, *options))
+            if len(pending) >= 2 * max_workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Calculate seats for poll scenarios given as CSV or JSON Lines"
+    )
+    parser.add_argument("input", nargs="?", default="-", help="input file, - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="default: by file extension")
+    parser.add_argument("--output", default="-", help="output file, - for stdout")
+    parser.add_argument("--method", choices=METHODS, default="dhont")
+    parser.add_argument(
+        "--districts", action="store_true", help="include seats in districts"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="0 for the number of processors"
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--cache", help="path of the dataset cache")
+    parser.add_argument(
+        "--stats", action="store_true", help="include counters and timers"
+    )
+    parser.add_argument("--profile-dir", help="directory of cProfile reports")
+    args = parser.parse_args(args)
+    if args.profile_dir is not None:
+        os.makedirs(args.profile_dir, exist_ok=True)
+
+    input_format = args.format
+    if input_format is None:
+        input_format = "csv" if args.input.endswith(".csv") else "jsonl"
+
+    input_file = sys.stdin if args.input == "-" else open(args.input, "r")
+    output_file = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        results = calculate_records(
+            read_records(input_file, input_format),
+            args.method,
+            args.districts,
+            args.workers,
+            args.data_dir,
+            args.cache,
+            args.chunk_size,
+            args.stats,
+            args.profile_dir,
+        )
+        for result in results:
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#
+# Benchmarks of stages of the calculation pipeline.
+#
+# Every benchmark has an untimed setup and a timed run, which are repeated --repeat
+# times. Statistics (seconds) are written as JSON. Given a baseline written by an earlier
+# run, medians are compared with it and the exit code is 1 if any stage is slower
+# by more than --tolerance.
+#
+# Usage: python scripts/benchmark.py [--repeat N] [--only NAME ...] [--output path]
+#                                    [--baseline path] [--tolerance 0.2]
+#
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from batch import get_source_paths
+from district_database import DistrictDatabase
+from district_results_generator import DistrictResultsGenerator
+
+BENCHMARK_VERSION = 1
+REPEAT = 5
+TOLERANCE = 0.2
+EPSILON_PERCENT = 0.01
+
+# Close to the results of 2019, a few iterations are enough
+EASY_POLL = {
+    "PiS": 40,
+    "KO": 27,
+    "Lewica": 12,
+    "TD": 9,
+    "Konfederacja": 7,
+    "MN": 0.17,
+    "Inne": 4.83,
+}
+# Large swings from the results of 2019 with parties just below and above thresholds,
+# about 30 iterations
+HARD_POLL = {
+    "PiS": 4.9,
+    "KO": 4.9,
+    "Lewica": 40,
+    "TD": 8.1,
+    "Konfederacja": 35,
+    "MN": 2,
+    "Inne": 5.1,
+}
+
+
+# Benchmarks {name: (setup, run)}, setup() returns the argument of run() and is not timed
+def get_benchmarks(data_dir):
+    paths = get_source_paths(data_dir)
+    # Loaded by the first benchmark which needs it
+    databases = []
+
+    def load_without_holownia():
+        return DistrictDatabase(**paths, load_holownia=False)
+
+    def setup_holownia():
+        database_without_holownia = load_without_holownia()
+        with open(paths["presidential2020_election_path"], "r") as holownia_file:
+            holownia_votes = database_without_holownia._read_holownia_votes(
+                holownia_file
+            )
+        return database_without_holownia, holownia_votes
+
+    def setup_database():
+        if not databases:
+            databases.append(DistrictDatabase(**paths))
+        databases[0].reset_all_districts_state()
+        return databases[0]
+
+    def get_generator_paths():
+        return (
+            f"{data_dir}/wyniki_gl_na_kand_po_powiatach_utf8.csv",
+            f"{data_dir}/okregi_sejm.csv",
+        )
+
+    def generate_results(generator_paths):
+        powiat_results_path, districts_path = generator_paths
+        with open(powiat_results_path, "r") as powiat_results_file, open(
+            districts_path, "r"
+        ) as districts_file:
+            DistrictResultsGenerator.aggregate_results(
+                powiat_results_file, districts_file
+            )
+
+    return {
+        "load_csv": (lambda: None, lambda _: load_without_holownia()),
+        "load_holownia": (
+            setup_holownia,
+            lambda args: args[0]._load_holownia(args[1]),
+        ),
+        "simulate_poll_easy": (
+            setup_database,
+            lambda db: db.simulate_poll_results(EASY_POLL, EPSILON_PERCENT),
+        ),
+        "simulate_poll_hard": (
+            setup_database,
+            lambda db: db.simulate_poll_results(HARD_POLL, EPSILON_PERCENT),
+        ),
+        "calculate_mandates": (
+            setup_database,
+            lambda db: db.calculate_number_of_mandates_in_all_districts(),
+        ),
+        "mandates_flis": (
+            setup_database,
+            lambda db: db.get_number_of_mandates_flis(HARD_POLL),
+        ),
+        "district_results_generator": (get_generator_paths, generate_results),
+    }
+
+
+def time_benchmark(setup, run, repeat):
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - start)
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "repeat": repeat,
+    }
+
+
+def run_benchmarks(data_dir="./data", repeat=REPEAT, names=None):
+    benchmarks = get_benchmarks(data_dir)
+    if names is None:
+        names = list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            raise ValueError(f"Unknown benchmark: {name}")
+
+    return {
+        "version": BENCHMARK_VERSION,
+        "python": platform.python_version(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": {
+            name: time_benchmark(*benchmarks[name], repeat) for name in names
+        },
+    }
+
+
+# Benchmarks whose median is slower than in the baseline by more than tolerance
+# (fraction), benchmarks missing in either of results are skipped
+def compare_results(results, baseline, tolerance=TOLERANCE):
+    regressions = []
+    for name, stats in results["benchmarks"].items():
+        if name not in baseline["benchmarks"]:
+            continue
+        baseline_median = baseline["benchmarks"][name]["median"]
+        ratio = stats["median"] / baseline_median if baseline_median > 0 else 1.0
+        if ratio > 1 + tolerance:
+            regressions.append(
+                {
+                    "name": name,
+                    "baseline_median": baseline_median,
+                    "median": stats["median"],
+                    "ratio": ratio,
+                }
+            )
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Time stages of the calculation pipeline"
+    )
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--only", nargs="+", help="names of benchmarks to run")
+    parser.add_argument("--output", default="-", help="output file, - for stdout")
+    parser.add_argument("--baseline", help="results of an earlier run to compare with")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="allowed slowdown of the median as a fraction",
+    )
+    parser.add_argument("--data-dir", default="./data")
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(args.data_dir, args.repeat, args.only)
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(results, baseline, args.tolerance)
+        results["regressions"] = regressions
+
+    encoded_results = json.dumps(results, indent=2)
+    if args.output == "-":
+        print(encoded_results)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(encoded_results + "\n")
+
+    for regression in regressions:
+        print(
+            f"{regression['name']}: {regression['baseline_median'] * 1000:.1f} ms -> "
+            f"{regression['median'] * 1000:.1f} ms ({regression['ratio']:.2f}x)",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
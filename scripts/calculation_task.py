@@ -0,0 +1,46 @@
+#
+# Calculations run in a QThreadPool, so that the window stays responsive.
+#
+# Every task gets a generation number. When inputs change, the window cancels the running
+# task and starts a new one with a higher generation, results of older generations
+# are dropped when they arrive.
+#
+from PySide2.QtCore import QObject, QRunnable, Signal
+
+
+class CalculationSignals(QObject):
+    # (generation, result)
+    finished = Signal(int, object)
+    # (generation, exception)
+    failed = Signal(int, object)
+
+
+class CalculationTask(QRunnable):
+    def __init__(self, generation, function, *args):
+        super().__init__()
+        self._generation = generation
+        self._function = function
+        self._args = args
+        self._cancelled = False
+        self.signals = CalculationSignals()
+
+    def get_generation(self):
+        return self._generation
+
+    def cancel(self):
+        self._cancelled = True
+
+    def is_cancelled(self):
+        return self._cancelled
+
+    def run(self):
+        if self._cancelled:
+            return
+        try:
+            result = self._function(*self._args)
+        except Exception as error:
+            if not self._cancelled:
+                self.signals.failed.emit(self._generation, error)
+            return
+        if not self._cancelled:
+            self.signals.finished.emit(self._generation, result)
@@ -0,0 +1,59 @@
+#
+# Named checkpoints of votes in districts.
+#
+# All checkpoints share one immutable baseline (the state saved when the database was
+# loaded) and keep copies of only those districts which differ from it. Restoring
+# a checkpoint copies the baseline buffer and overwrites the changed rows.
+#
+import numpy as np
+
+
+class Checkpoint:
+    def __init__(self, changed_rows, votes, mandates):
+        self._changed_rows = changed_rows
+        self._votes = votes
+        self._mandates = mandates
+
+    def get_changed_rows(self):
+        return self._changed_rows
+
+    def get_votes(self):
+        return self._votes
+
+    def get_mandates(self):
+        return self._mandates
+
+
+class CheckpointStore:
+    def __init__(self, baseline_votes):
+        self._baseline = np.array(baseline_votes, dtype=np.float64)
+        self._baseline.setflags(write=False)
+        self._checkpoints = {}
+
+    def get_baseline(self):
+        return self._baseline
+
+    def get_names(self):
+        return list(self._checkpoints.keys())
+
+    def has_checkpoint(self, name):
+        return name in self._checkpoints
+
+    # mandates is a (districts x parties) array or None if they were not calculated
+    def create(self, name, votes, mandates=None):
+        changed_rows = np.flatnonzero((votes != self._baseline).any(axis=1))
+        self._checkpoints[name] = Checkpoint(
+            changed_rows,
+            votes[changed_rows].copy(),
+            None if mandates is None else np.array(mandates),
+        )
+
+    # Write votes of the checkpoint into votes buffer and return its mandates
+    def restore(self, name, votes):
+        checkpoint = self._checkpoints[name]
+        np.copyto(votes, self._baseline)
+        votes[checkpoint.get_changed_rows()] = checkpoint.get_votes()
+        return checkpoint.get_mandates()
+
+    def delete(self, name):
+        del self._checkpoints[name]
@@ -8,6 +8,9 @@ OPPOSITION = ["KO", "Lewica", "TD"]
 PARTY_TRESHOLD = 0.05
 COALITION_TRESHOLD = 0.08
 
+# Seats in Sejm needed for majority
+MAJORITY_OF_SEATS = 231
+
 # TD composition polls
 POLL_PL2050_APRIL2023_PERCENT = 8.6
 POLL_PSL_APRIL2023_PERCENT = 5.8
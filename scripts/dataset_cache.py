@@ -0,0 +1,124 @@
+#
+# Binary cache of a fully loaded DistrictDatabase baseline.
+#
+# File layout: magic, length of the header (8 bytes, little endian), JSON header with
+# names of districts, list leaders and descriptions of arrays, then raw arrays, each
+# aligned to ARRAY_ALIGNMENT bytes. Arrays are memory-mapped copy-on-write, so loading
+# does not parse anything and writes never reach the file.
+#
+# The cache is keyed by a hash of the source files and of the constants used while
+# loading them, see compute_source_hash().
+#
+import json
+import os
+
+import numpy as np
+
+from constants import *
+
+CACHE_MAGIC = b"ELECTCACHE"
+CACHE_VERSION = 1
+ARRAY_ALIGNMENT = 64
+
+
+# Exception raised when a cache file is missing, corrupted or built from other sources
+class DatasetCacheError(Exception):
+    def __init__(self, path, reason):
+        self.path = path
+        self.reason = reason
+        super().__init__(f"Invalid dataset cache {path}: {reason}")
+
+
+# Hash of the contents of source files (in given order) and of loading options
+def compute_source_hash(source_paths, load_holownia):
+    import hashlib
+
+    source_hash = hashlib.sha256()
+    for path in source_paths:
+        with open(path, "rb") as source_file:
+            source_hash.update(hashlib.sha256(source_file.read()).digest())
+    options = {
+        "version": CACHE_VERSION,
+        "load_holownia": load_holownia,
+        "parties": LIST_OF_PARTIES,
+        "other_parties": OTHER_PARTIES,
+        "poll_pl2050": POLL_PL2050_APRIL2023_PERCENT,
+        "poll_psl": POLL_PSL_APRIL2023_PERCENT,
+    }
+    source_hash.update(json.dumps(options, sort_keys=True).encode())
+    return source_hash.hexdigest()
+
+
+def _align(offset):
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+# header is a JSON-serializable dict, arrays is a dict {name: numpy array}
+def write_cache(path, source_hash, header, arrays):
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+    descriptions = {}
+    offset = 0
+    for name, array in arrays.items():
+        descriptions[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "offset": offset,
+        }
+        offset = _align(offset + array.nbytes)
+
+    encoded_header = json.dumps(
+        {
+            "version": CACHE_VERSION,
+            "source_hash": source_hash,
+            "header": header,
+            "arrays": descriptions,
+        }
+    ).encode()
+    data_start = _align(len(CACHE_MAGIC) + 8 + len(encoded_header))
+
+    # Write to a temporary file first, so that readers never see a partial cache
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as cache_file:
+        cache_file.write(CACHE_MAGIC)
+        cache_file.write(len(encoded_header).to_bytes(8, "little"))
+        cache_file.write(encoded_header)
+        for name, array in arrays.items():
+            cache_file.seek(data_start + descriptions[name]["offset"])
+            cache_file.write(array.tobytes())
+    os.replace(temporary_path, path)
+
+
+# Returns (source hash, header, arrays), arrays are copy-on-write memory maps
+def read_cache(path):
+    try:
+        with open(path, "rb") as cache_file:
+            if cache_file.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                raise DatasetCacheError(path, "not a dataset cache")
+            header_length = int.from_bytes(cache_file.read(8), "little")
+            contents = json.loads(cache_file.read(header_length))
+    except OSError as error:
+        raise DatasetCacheError(path, error.strerror) from None
+    except ValueError:
+        raise DatasetCacheError(path, "corrupted header") from None
+
+    if contents["version"] != CACHE_VERSION:
+        raise DatasetCacheError(path, f"unsupported version {contents['version']}")
+
+    data_start = _align(len(CACHE_MAGIC) + 8 + header_length)
+    arrays = {}
+    for name, description in contents["arrays"].items():
+        shape = tuple(description["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=description["dtype"])
+            continue
+        try:
+            arrays[name] = np.memmap(
+                path,
+                dtype=description["dtype"],
+                mode="c",
+                offset=data_start + description["offset"],
+                shape=shape,
+            )
+        except ValueError:
+            raise DatasetCacheError(path, f"truncated array {name}") from None
+    return contents["source_hash"], contents["header"], arrays
@@ -1,7 +1,27 @@
-import copy
+from array import array
+
+from apportionment import allocate_dhont
+from vote_matrix import VotesRow
 
 
 class District:
+    __slots__ = (
+        "_name",
+        "_id",
+        "_n_seats",
+        "_boundaries_description",
+        "_sum_of_votes",
+        "_attendance_percent",
+        "_votes_per_seat",
+        "_results",
+        "_mandates",
+        "_list_leaders",
+        "_population",
+        "_area",
+        "_listener",
+        "_saved_results",
+    )
+
     def __init__(
         self,
         name,
@@ -24,6 +44,8 @@ class District:
         self._list_leaders = {}
         self._population = 0
         self._area = 0
+        self._listener = None
+        self._saved_results = None
 
         if number_of_votes is not None:
             self._sum_of_votes = number_of_votes
@@ -79,7 +101,10 @@ class District:
         return self._boundaries_description
 
     def set_sum_of_votes(self, number_of_votes):
+        delta = number_of_votes - self._sum_of_votes
         self._sum_of_votes = number_of_votes
+        if self._listener is not None:
+            self._listener.on_district_sum_of_votes_changed(delta)
 
     def set_list_leader(self, party, list_leader):
         self._list_leaders[party] = list_leader
@@ -96,17 +121,40 @@ class District:
     def set_area(self, area):
         self._area = area
 
+    # Listener (e.g. DistrictDatabase) is notified about every change of votes,
+    # so that it can keep national results up to date
+    def set_listener(self, listener):
+        self._listener = listener
+
+    def _notify_votes_changed(self, party, delta):
+        if self._listener is not None:
+            self._listener.on_district_votes_changed(party, delta)
+
+    def _notify_results_replaced(self):
+        if self._listener is not None:
+            self._listener.on_district_results_replaced()
+
+    # Replace results with a dict-like view, e.g. a row of a VoteMatrix
+    def bind_results(self, results):
+        self._results = results
+        self._notify_results_replaced()
+
     def add_party(self, party, votes):
+        delta = votes - self._results.get(party, 0)
         self._results[party] = votes
+        self._notify_votes_changed(party, delta)
 
     def add_votes(self, party, votes):
         self._results[party] += votes
+        self._notify_votes_changed(party, votes)
 
     # Scale votes by given scale, scale is a dict {party: scale}
     def scale_votes(self, scale_dict):
         for party in self._results:
             if party in scale_dict:
-                self._results[party] *= scale_dict[party]
+                old_votes = self._results[party]
+                self._results[party] = old_votes * scale_dict[party]
+                self._notify_votes_changed(party, self._results[party] - old_votes)
 
     # If votes for all parties do not sum up to sum of votes,
     # which was set, scale them
@@ -117,47 +165,138 @@ class District:
             self.scale_votes({party: scale for party in self._results})
 
     def calculate_number_of_mandates_dhont(self, parties_over_threshold):
-        # Initialize mandates
-        mandates = {party: 0 for party in self._results.keys()}
-
-        # Initialize last divisors
-        last_divisors = {party: 1 for party in parties_over_threshold}
-
-        # Extract results for parties over threshold
-        results_dhont = {
-            party: self._results[party] for party in parties_over_threshold
-        }
-
-        # Calculate number of mandates
-        for i in range(self._n_seats):
-            max_value = max(results_dhont.values())
-            party_max_values = [
-                key for key, value in results_dhont.items() if value == max_value
-            ]
-            if len(party_max_values) == 1:
-                party_max_value = party_max_values[0]
-            else:
-                # If there are more than one party with the same number of votes
-                # choose the one with the higher number of votes
-                party_max_value = max(party_max_values, key=lambda x: self._results[x])
-
-            mandates[party_max_value] += 1
-            last_divisors[party_max_value] += 1
-            results_dhont[party_max_value] = (
-                self._results[party_max_value] / last_divisors[party_max_value]
-            )
+        self._mandates = allocate_dhont(
+            self._results, parties_over_threshold, self._n_seats
+        )
 
+    def set_number_of_mandates(self, mandates):
         self._mandates = mandates
 
     def get_number_of_mandates(self):
         return self._mandates
 
+    # Votes are numbers, so a shallow copy is enough
     def save_state(self):
-        self._saved_results = copy.deepcopy(self._results)
+        self._saved_results = dict(self._results)
+
+    def get_saved_results(self):
+        return self._saved_results
 
     def reset(self):
-        self._results = copy.deepcopy(self._saved_results)
+        if isinstance(self._results, dict):
+            self._results = dict(self._saved_results)
+        else:
+            # Write into a view over a vote matrix instead of replacing it
+            self._results.update(self._saved_results)
+        self._notify_results_replaced()
+        self.reset_mandates()
+
+    def reset_mandates(self):
         self._mandates = {}
 
+    # Copy of the district without a listener, votes and mandates are not shared
+    def copy(self):
+        district = self._copy_attributes()
+        district._results = dict(self._results)
+        district._mandates = dict(self._mandates)
+        district._list_leaders = dict(self._list_leaders)
+        if self._saved_results is not None:
+            district._saved_results = dict(self._saved_results)
+        return district
+
+    # New district of the same class sharing all attributes except the listener
+    def _copy_attributes(self):
+        district = self.__class__.__new__(self.__class__)
+        for cls in self.__class__.__mro__:
+            for attribute in getattr(cls, "__slots__", ()):
+                setattr(district, attribute, getattr(self, attribute))
+        district._listener = None
+        return district
+
     def __str__(self) -> str:
         return f"Okręg nr {self._id} ({self._name})"
+
+
+# District with a fixed set of parties. Votes, mandates and list leaders are kept in
+# flat arrays ordered by party_index ({party: position}), which is shared by all
+# districts of a database, instead of one dict per district. Public API is the same
+# as of District, but only parties from party_index can be added.
+class CompactDistrict(District):
+    __slots__ = ("_party_index", "_mandates_row")
+
+    def __init__(
+        self,
+        name,
+        id,
+        n_seats,
+        party_index,
+        previous_results=None,
+        number_of_votes=None,
+        boundaries_description=None,
+    ):
+        super().__init__(
+            name, id, n_seats, None, number_of_votes, boundaries_description
+        )
+        self._party_index = party_index
+        self._results = VotesRow(array("d", bytes(8 * len(party_index))), party_index)
+        self._mandates_row = VotesRow(
+            array("i", bytes(4 * len(party_index))), party_index, int
+        )
+        self._list_leaders = [None] * len(party_index)
+
+        if previous_results is not None:
+            self._results.update(previous_results)
+
+    def get_list_leader(self, party):
+        return self._list_leaders[self._party_index[party]]
+
+    def set_list_leader(self, party, list_leader):
+        self._list_leaders[self._party_index[party]] = list_leader
+
+    def calculate_number_of_mandates_dhont(self, parties_over_threshold):
+        self.set_number_of_mandates(
+            allocate_dhont(self._results, parties_over_threshold, self._n_seats)
+        )
+
+    # No mandates ({}) until they are calculated, like in District
+    def set_number_of_mandates(self, mandates):
+        if not mandates:
+            self._mandates = {}
+            return
+        row = self._mandates_row.get_row()
+        for i in range(len(row)):
+            row[i] = 0
+        self._mandates_row.update(mandates)
+        self._mandates = self._mandates_row
+
+    # Copy of the mandates buffer, so that earlier results do not change with
+    # the next allocation
+    def get_number_of_mandates(self):
+        return dict(self._mandates)
+
+    # Saved results are a copy of the votes buffer
+    def save_state(self):
+        self._saved_results = array("d", self._results.get_row())
+
+    def get_saved_results(self):
+        return VotesRow(self._saved_results, self._party_index)
+
+    def reset(self):
+        self._results.update(self.get_saved_results())
+        self._notify_results_replaced()
+        self.reset_mandates()
+
+    # Copies only the flat arrays, party_index stays shared
+    def copy(self):
+        district = self._copy_attributes()
+        district._results = VotesRow(
+            array("d", self._results.get_row()), self._party_index
+        )
+        district._mandates_row = VotesRow(
+            array("i", self._mandates_row.get_row()), self._party_index, int
+        )
+        district._mandates = district._mandates_row if self._mandates else {}
+        district._list_leaders = self._list_leaders.copy()
+        if self._saved_results is not None:
+            district._saved_results = array("d", self._saved_results)
+        return district
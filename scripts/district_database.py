@@ -1,8 +1,35 @@
 import csv
-from district import District
+from contextlib import ExitStack, contextmanager, nullcontext
+from district import CompactDistrict, District
+from checkpoints import CheckpointStore
+from vote_matrix import VoteMatrix
+from apportionment import (
+    APPORTIONMENT_METHODS,
+    allocate_all_districts,
+    allocate_all_methods,
+    allocate_all_scenarios,
+    allocate_dhont_all_districts,
+    calculate_seat_margins,
+    select_parties_over_threshold,
+    select_parties_over_threshold_array,
+)
+import dataset_cache
+import monte_carlo
+from seat_curve import calculate_fitted_seat_curve, calculate_seat_curve
+from poll_solver import (
+    PollFitResult,
+    calculate_residual_percent,
+    fit_poll_newton,
+    fit_polls_ipf,
+)
+from powiat_index import PowiatIndex, UnknownPowiatError, index_values
+from instrumentation import CalculationStats, profile
+import numpy as np
 
 from constants import *
 
+HOLOWNIA_COLUMN = "Szymon Franciszek HOŁOWNIA"
+
 
 # Exception raised when max iterations in simulate_poll_results() is reached
 class MaxIterationsError(Exception):
@@ -21,13 +48,31 @@ class DistrictDatabase:
         population_path=None,
         area_path=None,
         load_holownia=True,
+        use_vote_matrix=False,
+        presidential2020_results=None,
+        compact_districts=False,
     ):
         self._districts = {}
+        self._compact_districts = compact_districts
+        # Shared by all compact districts
+        self._party_index = {party: i for i, party in enumerate(LIST_OF_PARTIES)}
+        self._vote_matrix = None
+        self._overall_results = None
+        self._overall_sum_of_votes = None
+        self._results_percent = None
+        self._parties_over_threshold = None
+        self._poll_results_percent = None
+        self._stats = None
+        self._fingerprint = None
+        self._checkpoints = CheckpointStore(np.zeros((0, len(LIST_OF_PARTIES))))
 
         if (
             districts_path is not None
             and parlamentary2019_election_path is not None
-            and presidential2020_election_path is not None
+            and (
+                presidential2020_election_path is not None
+                or presidential2020_results is not None
+            )
             and list_leaders_path is not None
             and population_path is not None
             and area_path is not None
@@ -40,8 +85,14 @@ class DistrictDatabase:
                 population_path,
                 area_path,
                 load_holownia,
+                presidential2020_results,
             )
 
+        if use_vote_matrix:
+            self.enable_vote_matrix()
+
+    # Results of the presidential election can be given as a csv file or as
+    # DistrictResults aggregated in memory by DistrictResultsGenerator
     def load_database(
         self,
         districts_path,
@@ -51,22 +102,34 @@ class DistrictDatabase:
         population_path,
         area_path,
         load_holownia,
+        presidential2020_results=None,
     ):
-        with open(districts_path, "r") as districts_file, open(
-            parlamentary2019_election_path, "r"
-        ) as parlamentary2019_election_file, open(
-            presidential2020_election_path, "r"
-        ) as presidential2020_election_file, open(
-            list_leaders_path, "r"
-        ) as list_leaders_file, open(
-            population_path, "r"
-        ) as population_file, open(
-            area_path, "r"
-        ) as area_file:
+        with ExitStack() as stack:
+            stack.enter_context(self._timer("load"))
+            districts_file = stack.enter_context(open(districts_path, "r"))
+            parlamentary2019_election_file = stack.enter_context(
+                open(parlamentary2019_election_path, "r")
+            )
+            list_leaders_file = stack.enter_context(open(list_leaders_path, "r"))
+            population_file = stack.enter_context(open(population_path, "r"))
+            area_file = stack.enter_context(open(area_path, "r"))
+
+            if presidential2020_results is None:
+                presidential2020_election_file = stack.enter_context(
+                    open(presidential2020_election_path, "r")
+                )
+                presidential2020_results = self._read_holownia_votes(
+                    presidential2020_election_file
+                )
+            else:
+                presidential2020_results = presidential2020_results.get_column(
+                    HOLOWNIA_COLUMN
+                )
+
             self._read_database_from_file(
                 districts_file,
                 parlamentary2019_election_file,
-                presidential2020_election_file,
+                presidential2020_results,
                 list_leaders_file,
                 population_file,
                 area_file,
@@ -77,7 +140,7 @@ class DistrictDatabase:
         self,
         districts_file,
         parlamentary2019_election_file,
-        presidential2020_election_file,
+        holownia_votes_districts,
         list_leaders_file,
         population_file,
         area_file,
@@ -86,7 +149,8 @@ class DistrictDatabase:
         self._load_disctricts(districts_file)
         self._load_parlamentary_election(parlamentary2019_election_file)
         if load_holownia:
-            self._load_holownia(presidential2020_election_file)
+            with self._timer("load_holownia"):
+                self._load_holownia(holownia_votes_districts)
         self._load_list_leaders(list_leaders_file)
         self._load_districts_population_and_area(population_file, area_file)
         self.save_all_districts_state()
@@ -94,12 +158,19 @@ class DistrictDatabase:
     def _load_disctricts(self, districts_file):
         reader = csv.DictReader(districts_file, delimiter=";")
         for row in reader:
-            self._districts[row["Numer okręgu"]] = District(
+            self._districts[row["Numer okręgu"]] = self._create_district(
                 name=row["Siedziba OKW"],
                 id=row["Numer okręgu"],
                 n_seats=int(row["Liczba mandatów"]),
                 boundaries_description=row["Opis granic"],
             )
+            self._districts[row["Numer okręgu"]].set_listener(self)
+
+    # Compact districts keep votes in arrays ordered by LIST_OF_PARTIES, see district.py
+    def _create_district(self, **kwargs):
+        if self._compact_districts:
+            return CompactDistrict(party_index=self._party_index, **kwargs)
+        return District(**kwargs)
 
     def _load_parlamentary_election(self, parlamentary2019_election_file):
         reader = csv.DictReader(parlamentary2019_election_file, delimiter=";")
@@ -145,12 +216,12 @@ class DistrictDatabase:
 
         self.calculate_number_of_mandates_in_all_districts()
 
-    def _load_holownia(self, presidential2020_election_file):
+    def _read_holownia_votes(self, presidential2020_election_file):
         reader = csv.DictReader(presidential2020_election_file, delimiter=";")
-        holownia_votes_districts = {
-            row["Numer okręgu"]: int(row["Szymon Franciszek HOŁOWNIA"])
-            for row in reader
-        }
+        return {row["Numer okręgu"]: int(row[HOLOWNIA_COLUMN]) for row in reader}
+
+    # holownia_votes_districts is a dict {district id: votes for Hołownia}
+    def _load_holownia(self, holownia_votes_districts):
         sum_of_votes_holownia = sum(holownia_votes_districts.values())
         sum_of_votes_psl = self.get_current_overall_results()["TD"]
 
@@ -175,8 +246,7 @@ class DistrictDatabase:
             )
 
         # Rescale votes to 100% in all districts
-        for district in self._districts.values():
-            district.rescale_votes_to_100_percent()
+        self.rescale_votes_to_100_percent_in_all_districts()
 
     def _load_list_leaders(self, list_leaders_file):
         reader = csv.DictReader(list_leaders_file, delimiter=",")
@@ -190,42 +260,156 @@ class DistrictDatabase:
                     else:
                         self._districts[district_id].set_list_leader(party, list_leader)
 
+    # Powiats are resolved by name with PowiatIndex (see powiat_index.py), population
+    # and area are looked up by TERYT code
     def _load_districts_population_and_area(self, population_file, area_file):
-        # csv.DictReader does not allow to iterate over the same instance twice,
-        # so we need to write it into a list
-        population_reader = csv.DictReader(population_file, delimiter=";")
-        area_reader = csv.DictReader(area_file, delimiter=";")
-        population_data = [row for row in population_reader]
-        area_data = [row for row in area_reader]
+        population_rows = list(csv.DictReader(population_file, delimiter=";"))
+        area_rows = csv.DictReader(area_file, delimiter=";")
+        powiat_index = PowiatIndex(population_rows)
+        population = index_values(population_rows, "ludność")
+        area = index_values(area_rows, "powierzchnia")
 
         for district in self._districts.values():
-            boundaries = district.get_boundaries_description()
-
-            if "województwo" in boundaries:
-                voivodeship = boundaries.removeprefix("województwo ")
-                for row in population_data:
-                    if voivodeship.upper() in row["Nazwa"]:
-                        district.set_population(int(row["ludność"]))
-                        break
-                for row in area_data:
-                    if voivodeship.upper() in row["Nazwa"]:
-                        district.set_area(int(row["powierzchnia"]))
-                        break
-            else:
-                district_population = 0
-                district_area = 0
-                powiats_in_district = boundaries.split(", ")
-                for powiat in powiats_in_district:
-                    for row in population_data:
-                        if powiat in row["Nazwa"]:
-                            district_population += int(row["ludność"])
-                            break
-                    for row in area_data:
-                        if powiat in row["Nazwa"]:
-                            district_area += int(row["powierzchnia"])
-                            break
-                district.set_population(district_population)
-                district.set_area(district_area)
+            codes = powiat_index.resolve_boundaries(district.get_boundaries_description())
+            try:
+                district.set_population(sum(population[code] for code in codes))
+                district.set_area(sum(area[code] for code in codes))
+            except KeyError as error:
+                raise UnknownPowiatError(error.args[0]) from None
+
+    # Load the baseline from a binary cache (see dataset_cache.py) written by write_cache().
+    # If source paths are given, the cache is validated against them and rebuilt from
+    # the csv files when it is missing or stale. If the cache cannot be written, the built
+    # database is returned anyway. Without source paths the cache is trusted, which is
+    # the fast path for worker processes.
+    @classmethod
+    def from_cache(
+        cls,
+        cache_path,
+        districts_path=None,
+        parlamentary2019_election_path=None,
+        presidential2020_election_path=None,
+        list_leaders_path=None,
+        population_path=None,
+        area_path=None,
+        load_holownia=True,
+        use_vote_matrix=False,
+        compact_districts=False,
+    ):
+        source_paths = [
+            districts_path,
+            parlamentary2019_election_path,
+            presidential2020_election_path,
+            list_leaders_path,
+            population_path,
+            area_path,
+        ]
+        if any(path is None for path in source_paths):
+            source_hash = None
+        else:
+            source_hash = dataset_cache.compute_source_hash(source_paths, load_holownia)
+
+        try:
+            cached_hash, header, arrays = dataset_cache.read_cache(cache_path)
+        except dataset_cache.DatasetCacheError:
+            if source_hash is None:
+                raise
+            cached_hash = None
+
+        if source_hash is not None and cached_hash != source_hash:
+            database = cls(
+                *source_paths,
+                load_holownia=load_holownia,
+                compact_districts=compact_districts,
+            )
+            try:
+                database.write_cache(cache_path, source_hash)
+            except OSError:
+                # The cache only speeds up loading, e.g. data may be read-only
+                pass
+            if use_vote_matrix:
+                database.enable_vote_matrix()
+            return database
+
+        database = cls(compact_districts=compact_districts)
+        database._load_cached_baseline(header, arrays, use_vote_matrix)
+        return database
+
+    def write_cache(self, cache_path, source_hash):
+        districts = list(self._districts.values())
+        header = {
+            "parties": LIST_OF_PARTIES,
+            "districts": [
+                {
+                    "id": district.get_id(),
+                    "name": district.get_name(),
+                    "boundaries_description": district.get_boundaries_description(),
+                    "list_leaders": {
+                        party: district.get_list_leader(party)
+                        for party in LIST_OF_PARTIES
+                        if party != "Inne"
+                    },
+                }
+                for district in districts
+            ],
+        }
+        arrays = {
+            "votes": self._checkpoints.get_baseline(),
+            "n_seats": [district.get_n_seats() for district in districts],
+            "sums_of_votes": [district.get_sum_of_votes() for district in districts],
+            "attendance_percent": [
+                district.get_attendance_percent() for district in districts
+            ],
+            "votes_per_seat": [district.get_votes_per_seat() for district in districts],
+            "population": [district.get_population() for district in districts],
+            "area": [district.get_area() for district in districts],
+        }
+        arrays = {name: np.asarray(array) for name, array in arrays.items()}
+        mandates = self.get_mandates_array()
+        if mandates is not None:
+            arrays["mandates"] = mandates
+        dataset_cache.write_cache(cache_path, source_hash, header, arrays)
+
+    def _load_cached_baseline(self, header, arrays, use_vote_matrix):
+        if header["parties"] != LIST_OF_PARTIES:
+            raise ValueError("Parties in the dataset cache differ from LIST_OF_PARTIES")
+
+        votes = arrays["votes"]
+        for i, district_header in enumerate(header["districts"]):
+            district = self._create_district(
+                name=district_header["name"],
+                id=district_header["id"],
+                n_seats=int(arrays["n_seats"][i]),
+                number_of_votes=arrays["sums_of_votes"][i].item(),
+                boundaries_description=district_header["boundaries_description"],
+            )
+            district.set_attendance_percent(arrays["attendance_percent"][i].item())
+            district.set_votes_per_seat(arrays["votes_per_seat"][i].item())
+            district.set_population(arrays["population"][i].item())
+            district.set_area(arrays["area"][i].item())
+            for party, list_leader in district_header["list_leaders"].items():
+                district.set_list_leader(party, list_leader)
+            if not use_vote_matrix:
+                for party, party_votes in zip(LIST_OF_PARTIES, votes[i].tolist()):
+                    district.add_party(party, party_votes)
+            district.set_listener(self)
+            self._districts[district.get_id()] = district
+
+        if use_vote_matrix:
+            # Votes stay in the copy-on-write memory map
+            self._vote_matrix = VoteMatrix(
+                list(self._districts.keys()),
+                LIST_OF_PARTIES,
+                votes,
+                arrays["n_seats"],
+                arrays["sums_of_votes"],
+            )
+            for district_id, district in self._districts.items():
+                district.bind_results(self._vote_matrix.get_row_view(district_id))
+
+        if "mandates" in arrays:
+            self.set_mandates_array(arrays["mandates"])
+        self.save_all_districts_state()
 
     def get_district(self, id):
         return self._districts[id]
@@ -233,21 +417,219 @@ class DistrictDatabase:
     def get_districts(self):
         return self._districts.values()
 
+    # Move all votes into one dense VoteMatrix, districts become views over its rows
+    def enable_vote_matrix(self):
+        self._vote_matrix = VoteMatrix.from_districts(
+            self._districts.values(), LIST_OF_PARTIES
+        )
+        for district_id, district in self._districts.items():
+            district.bind_results(self._vote_matrix.get_row_view(district_id))
+
+    def get_vote_matrix(self):
+        return self._vote_matrix
+
+    # Collect counters and timers of calculations inside the block, see instrumentation.py.
+    # profile_output (path or text file) gets a cProfile report of the block.
+    @contextmanager
+    def instrument(self, stats=None, profile_output=None):
+        previous_stats = self._stats
+        self._stats = CalculationStats() if stats is None else stats
+        try:
+            with profile(profile_output):
+                yield self._stats
+        finally:
+            self._stats = previous_stats
+
+    # Stats of the current instrument() block, None outside of it
+    def get_stats(self):
+        return self._stats
+
+    def _count(self, name, n=1):
+        if self._stats is not None:
+            self._stats.increment(name, n)
+
+    def _timer(self, name):
+        if self._stats is None:
+            return nullcontext()
+        return self._stats.timer(name)
+
+    def _record_fit(self, iterations, residual_percent):
+        if self._stats is not None:
+            self._stats.increment("fits")
+            self._stats.increment("fit_iterations", iterations)
+            self._stats.set_value("fit_residual_percent", residual_percent)
+
+    # Saved state is the immutable baseline shared by all checkpoints,
+    # saving it again removes existing checkpoints
     def save_all_districts_state(self):
-        for district in self._districts.values():
-            district.save_state()
+        self._checkpoints = CheckpointStore(self.get_votes_array())
+        self._fingerprint = None
+
+    # Hash of the saved state and of the rules of allocation, identifies the dataset
+    # in caches of results (see result_cache.py)
+    def get_fingerprint(self):
+        if self._fingerprint is None:
+            import hashlib
+
+            fingerprint = hashlib.sha256(self._checkpoints.get_baseline().tobytes())
+            n_seats = [district.get_n_seats() for district in self._districts.values()]
+            fingerprint.update(np.asarray(n_seats, dtype=np.int64).tobytes())
+            fingerprint.update(self.get_sums_of_votes_array().tobytes())
+            rules = [LIST_OF_PARTIES, PARTY_TRESHOLD, COALITION_TRESHOLD]
+            fingerprint.update(repr(rules).encode())
+            self._fingerprint = fingerprint.hexdigest()
+        return self._fingerprint
 
     def reset_all_districts_state(self):
-        for district in self._districts.values():
-            district.reset()
+        baseline = self._checkpoints.get_baseline()
+        self._write_votes(lambda votes: np.copyto(votes, baseline))
+        self.set_mandates_array(None)
+
+    # Named checkpoints of votes and mandates in all districts
+    def create_checkpoint(self, name):
+        self._checkpoints.create(name, self._read_votes(), self.get_mandates_array())
+
+    def restore_checkpoint(self, name):
+        if not self._checkpoints.has_checkpoint(name):
+            raise KeyError(f"Unknown checkpoint: {name}")
+        mandates = self._write_votes(
+            lambda votes: self._checkpoints.restore(name, votes)
+        )
+        self.set_mandates_array(mandates)
+
+    def delete_checkpoint(self, name):
+        self._checkpoints.delete(name)
+
+    def get_checkpoint_names(self):
+        return self._checkpoints.get_names()
+
+    # Votes without copying them if the vote matrix is enabled
+    def _read_votes(self):
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_votes()
+        return self.get_votes_array()
+
+    # Let write_function fill the votes buffer in place
+    def _write_votes(self, write_function):
+        if self._vote_matrix is not None:
+            self._invalidate_aggregates()
+            return write_function(self._vote_matrix.get_votes())
+        votes = np.empty((len(self._districts), len(LIST_OF_PARTIES)))
+        result = write_function(votes)
+        self.set_votes_array(votes)
+        return result
+
+    # Votes of all districts as (districts x parties) array in LIST_OF_PARTIES order
+    def get_votes_array(self):
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_votes().copy()
+        return np.array(
+            [
+                [district.get_number_of_votes(party) for party in LIST_OF_PARTIES]
+                for district in self._districts.values()
+            ],
+            dtype=np.float64,
+        )
+
+    def set_votes_array(self, votes):
+        if self._vote_matrix is not None:
+            np.copyto(self._vote_matrix.get_votes(), votes)
+            self._invalidate_aggregates()
+            return
+        for district, district_votes in zip(self._districts.values(), votes):
+            for party, party_votes in zip(LIST_OF_PARTIES, district_votes):
+                district.add_party(party, float(party_votes))
+        # Recalculate totals instead of accumulating rounding errors of bulk writes
+        self._invalidate_aggregates()
+
+    # Mandates of all districts as (districts x parties) array in LIST_OF_PARTIES order,
+    # None if they were not calculated
+    def get_mandates_array(self):
+        districts_mandates = [
+            district.get_number_of_mandates() for district in self._districts.values()
+        ]
+        if any(not mandates for mandates in districts_mandates):
+            return None
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_mandates().copy()
+        return np.array(
+            [
+                [mandates.get(party, 0) for party in LIST_OF_PARTIES]
+                for mandates in districts_mandates
+            ],
+            dtype=np.int64,
+        )
+
+    def set_mandates_array(self, mandates):
+        if mandates is None:
+            if self._vote_matrix is not None:
+                self._vote_matrix.get_mandates()[:] = 0
+            for district in self._districts.values():
+                district.reset_mandates()
+            return
+        if self._vote_matrix is not None:
+            self._vote_matrix.set_mandates(mandates)
+        for district, district_mandates in zip(self._districts.values(), mandates):
+            district.set_number_of_mandates(
+                dict(zip(LIST_OF_PARTIES, district_mandates.tolist()))
+            )
+
+    def get_sums_of_votes_array(self):
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_sums_of_votes()
+        return np.array(
+            [district.get_sum_of_votes() for district in self._districts.values()],
+            dtype=np.float64,
+        )
+
+    # National results are cached. Districts notify the database about every change
+    # of votes, so the totals are updated incrementally in O(1), and bulk operations
+    # on the vote matrix invalidate them. Percentages and parties over threshold
+    # are recalculated from the totals after any change.
+    def on_district_votes_changed(self, party, delta):
+        if self._overall_results is not None and party in self._overall_results:
+            self._overall_results[party] += delta
+        self._invalidate_derived_aggregates()
+
+    def on_district_sum_of_votes_changed(self, delta):
+        if self._overall_sum_of_votes is not None:
+            self._overall_sum_of_votes += delta
+        self._invalidate_derived_aggregates()
+
+    def on_district_results_replaced(self):
+        self._invalidate_aggregates()
+
+    def _invalidate_aggregates(self):
+        self._overall_results = None
+        self._invalidate_derived_aggregates()
+
+    def _invalidate_derived_aggregates(self):
+        self._results_percent = None
+        self._parties_over_threshold = None
+        self._poll_results_percent = None
 
     def get_sum_of_votes(self):
+        if self._overall_sum_of_votes is None:
+            self._overall_sum_of_votes = self._calculate_sum_of_votes()
+        return self._overall_sum_of_votes
+
+    def _calculate_sum_of_votes(self):
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_sum_of_votes()
         sum = 0
         for district in self._districts.values():
             sum += district.get_sum_of_votes()
         return sum
 
     def get_current_overall_results(self):
+        if self._overall_results is None:
+            self._overall_results = self._calculate_overall_results()
+        return dict(self._overall_results)
+
+    def _calculate_overall_results(self):
+        self._count("overall_results_recomputations")
+        if self._vote_matrix is not None:
+            return self._vote_matrix.get_overall_results()
         results = {}
         for party in LIST_OF_PARTIES:
             results[party] = 0
@@ -258,18 +640,95 @@ class DistrictDatabase:
         return results
 
     def get_results_percent(self):
-        results_percent = {}
-        sum_of_votes = self.get_sum_of_votes()
-        for party, votes in self.get_current_overall_results().items():
-            results_percent[party] = votes / sum_of_votes * 100
-        return results_percent
+        if self._results_percent is None:
+            self._count("results_percent_recomputations")
+            self._results_percent = {}
+            sum_of_votes = self.get_sum_of_votes()
+            for party, votes in self.get_current_overall_results().items():
+                self._results_percent[party] = votes / sum_of_votes * 100
+        return dict(self._results_percent)
 
     def scale_results_in_all_districts(self, scale_dict):
+        self._count("scale_results_calls")
+        if self._vote_matrix is not None:
+            self._vote_matrix.scale_votes(scale_dict)
+            self._vote_matrix.rescale_votes_to_100_percent()
+            self._invalidate_aggregates()
+            return
         for district in self._districts.values():
             district.scale_votes(scale_dict)
             district.rescale_votes_to_100_percent()
 
-    def simulate_poll_results(self, poll_results_percent: dict, epsilon_percent: float):
+    def rescale_votes_to_100_percent_in_all_districts(self):
+        if self._vote_matrix is not None:
+            self._vote_matrix.rescale_votes_to_100_percent()
+            self._invalidate_aggregates()
+            return
+        for district in self._districts.values():
+            district.rescale_votes_to_100_percent()
+
+    # Scale results in all districts, so that overall results are equal to poll results.
+    # Solver "iterative" repeats scaling of parties and districts, solver "newton" finds
+    # scale factors of parties with Newton's method (see poll_solver.py).
+    # Fitting starts from the current state, which gives the same result as starting from
+    # the saved state (only scale factors differ), unless a party with support in the
+    # poll has no votes left - then the saved state is restored first.
+    # Seats are allocated with method from APPORTIONMENT_METHODS.
+    def simulate_poll_results(
+        self,
+        poll_results_percent: dict,
+        epsilon_percent: float,
+        solver="iterative",
+        method="dhont",
+    ):
+        if solver not in ["iterative", "newton"]:
+            raise ValueError(f"Unknown solver: {solver}")
+        self._check_method(method)
+
+        current_results = self.get_current_overall_results()
+        if any(
+            percent > 0 and current_results[party] <= 0
+            for party, percent in poll_results_percent.items()
+        ):
+            self.reset_all_districts_state()
+
+        with self._timer("fit"):
+            if solver == "iterative":
+                fit_result = self._simulate_poll_results_iterative(
+                    poll_results_percent, epsilon_percent
+                )
+            elif solver == "newton":
+                fit_result = self._simulate_poll_results_newton(
+                    poll_results_percent, epsilon_percent
+                )
+        self._record_fit(fit_result.get_iterations(), fit_result.get_residual_percent())
+
+        self.calculate_number_of_mandates_in_all_districts(method)
+        self._poll_results_percent = dict(poll_results_percent)
+        return fit_result
+
+    # Poll results of the last simulate_poll_results() or update_poll_results(),
+    # None if votes were changed in another way since then
+    def get_poll_results_percent(self):
+        if self._poll_results_percent is None:
+            return None
+        return dict(self._poll_results_percent)
+
+    # Fit poll results changed by poll_delta_percent ({party: change in percentage points})
+    # starting from the current fitted state. Consecutive close polls (sweeps, sliders)
+    # need only a few iterations each. Without a previous poll the change is applied
+    # to current results.
+    def update_poll_results(
+        self, poll_delta_percent: dict, epsilon_percent: float, solver="newton"
+    ):
+        poll_results_percent = self.get_poll_results_percent()
+        if poll_results_percent is None:
+            poll_results_percent = self.get_results_percent()
+        for party, delta in poll_delta_percent.items():
+            poll_results_percent[party] += delta
+        return self.simulate_poll_results(poll_results_percent, epsilon_percent, solver)
+
+    def _simulate_poll_results_iterative(self, poll_results_percent, epsilon_percent):
         # Poll results in absolute numbers
         poll_results = {}
         for party in poll_results_percent.keys():
@@ -303,12 +762,184 @@ class DistrictDatabase:
         if it == MAX_ITERATIONS:
             raise MaxIterationsError(MAX_ITERATIONS)
 
-        self.calculate_number_of_mandates_in_all_districts()
+        current_results = self.get_current_overall_results()
+        residual = max(
+            abs(current_results[party] - poll_results[party])
+            for party in LIST_OF_PARTIES
+        )
+        return PollFitResult("iterative", it, residual / self.get_sum_of_votes() * 100)
+
+    def _simulate_poll_results_newton(self, poll_results_percent, epsilon_percent):
+        MAX_ITERATIONS = 100
+
+        sum_of_votes = self.get_sum_of_votes()
+        poll_votes = np.array(
+            [poll_results_percent[party] for party in LIST_OF_PARTIES], dtype=np.float64
+        )
+        poll_votes *= sum_of_votes / 100
+
+        fitted, it = fit_poll_newton(
+            self.get_votes_array(),
+            self.get_sums_of_votes_array(),
+            poll_votes,
+            epsilon_percent * sum_of_votes / 100,
+            MAX_ITERATIONS,
+        )
+        residual_percent = calculate_residual_percent(fitted, poll_votes, sum_of_votes)
+        if residual_percent > epsilon_percent:
+            raise MaxIterationsError(MAX_ITERATIONS)
+
+        self.set_votes_array(fitted)
+        return PollFitResult("newton", it, residual_percent)
+
+    # Fit poll results to the saved state and allocate seats without changing the database,
+    # so that it can run in a worker thread while the database is being read.
+    # Returns (votes, mandates) arrays, see apply_poll_results().
+    # start_votes (e.g. previously fitted votes) is a warm start. Fitting only rescales
+    # parties and districts, so the result is the same as from the saved state, but
+    # fewer iterations are needed for small changes of the poll. A start without votes
+    # of a party which has support in the poll cannot be rescaled to it, so the saved
+    # state is used instead.
+    def fit_poll_results(
+        self, poll_results_percent, epsilon_percent, start_votes=None, method="dhont"
+    ):
+        MAX_ITERATIONS = 100
+        self._check_method(method)
+
+        sum_of_votes = self.get_sum_of_votes()
+        poll_votes = np.array(
+            [poll_results_percent[party] for party in LIST_OF_PARTIES], dtype=np.float64
+        )
+        poll_votes *= sum_of_votes / 100
+
+        if start_votes is None or (start_votes.sum(axis=0)[poll_votes > 0] <= 0).any():
+            start_votes = self._checkpoints.get_baseline()
+
+        with self._timer("fit"):
+            fitted, it = fit_poll_newton(
+                start_votes,
+                self.get_sums_of_votes_array(),
+                poll_votes,
+                epsilon_percent * sum_of_votes / 100,
+                MAX_ITERATIONS,
+            )
+        residual_percent = calculate_residual_percent(fitted, poll_votes, sum_of_votes)
+        self._record_fit(it, residual_percent)
+        if residual_percent > epsilon_percent:
+            raise MaxIterationsError(MAX_ITERATIONS)
+
+        parties_over_threshold = select_parties_over_threshold(
+            dict(zip(LIST_OF_PARTIES, fitted.sum(axis=0))), sum_of_votes
+        )
+        eligible = [party in parties_over_threshold for party in LIST_OF_PARTIES]
+        n_seats = np.array(
+            [district.get_n_seats() for district in self._districts.values()]
+        )
+        self._count("dhont_passes")
+        with self._timer("dhont"):
+            return fitted, allocate_all_districts(fitted, n_seats, eligible, method)
+
+    # Fit K polls at once to the saved state and allocate seats without changing
+    # the database, see fit_polls_ipf() in poll_solver.py. polls_percent is a
+    # (K x parties) array in LIST_OF_PARTIES order. Returns (votes, mandates, converged):
+    # (K x districts x parties) arrays and a boolean vector of scenarios which were
+    # fitted within epsilon_percent, seats of the other ones are not reliable.
+    def fit_polls_batched(self, polls_percent, epsilon_percent, method="dhont"):
+        MAX_ITERATIONS = 1000
+        self._check_method(method)
 
-    def calculate_number_of_mandates_in_all_districts(self):
+        sum_of_votes = self.get_sum_of_votes()
+        poll_votes = np.atleast_2d(np.asarray(polls_percent, dtype=np.float64))
+        if (poll_votes < 0).any():
+            raise ValueError("Poll results must not be negative")
+        poll_votes = poll_votes * sum_of_votes / 100
+
+        with self._timer("fit"):
+            fitted, iterations, converged = fit_polls_ipf(
+                self._checkpoints.get_baseline(),
+                self.get_sums_of_votes_array(),
+                poll_votes,
+                epsilon_percent * sum_of_votes / 100,
+                MAX_ITERATIONS,
+            )
+        self._count("fits", len(poll_votes))
+        self._count("fit_iterations", int(iterations.sum()))
+
+        eligible = select_parties_over_threshold_array(fitted.sum(axis=1), sum_of_votes)
+        n_seats = [district.get_n_seats() for district in self._districts.values()]
+        self._count("dhont_passes")
+        with self._timer("dhont"):
+            mandates = allocate_all_scenarios(fitted, n_seats, eligible, method)
+        return fitted, mandates, converged
+
+    def apply_poll_results(self, votes, mandates):
+        self.set_votes_array(votes)
+        self.set_mandates_array(mandates)
+
+    # Allocate seats with method from APPORTIONMENT_METHODS, D'Hondt by default
+    def calculate_number_of_mandates_in_all_districts(self, method="dhont"):
+        self._check_method(method)
         parties_over_threshold = self.get_parties_over_threshold()
-        for district in self._districts.values():
-            district.calculate_number_of_mandates_dhont(parties_over_threshold)
+        self._count("dhont_passes")
+        with self._timer("dhont"):
+            if method != "dhont":
+                self.set_mandates_array(
+                    self.calculate_mandates_all_methods([method])[method]
+                )
+                return
+            if self._vote_matrix is not None:
+                self._calculate_number_of_mandates_vectorized(parties_over_threshold)
+                return
+            for district in self._districts.values():
+                district.calculate_number_of_mandates_dhont(parties_over_threshold)
+
+    # Seats of current votes under several methods (all from APPORTIONMENT_METHODS
+    # by default) without changing the database, so that methods can be compared
+    # without fitting the poll again. Returns a dict {method: (districts x parties)
+    # array of seats} with columns in LIST_OF_PARTIES order.
+    def calculate_mandates_all_methods(self, methods=None):
+        for method in methods or []:
+            self._check_method(method)
+        parties_over_threshold = self.get_parties_over_threshold()
+        return allocate_all_methods(
+            self._read_votes(),
+            [district.get_n_seats() for district in self._districts.values()],
+            [party in parties_over_threshold for party in LIST_OF_PARTIES],
+            methods,
+        )
+
+    # Seats of parties under several methods, {method: {party: seats}}
+    def get_number_of_mandates_all_methods(self, methods=None):
+        return {
+            method: dict(zip(LIST_OF_PARTIES, mandates.sum(axis=0).tolist()))
+            for method, mandates in self.calculate_mandates_all_methods(methods).items()
+        }
+
+    def _check_method(self, method):
+        if method not in APPORTIONMENT_METHODS:
+            raise ValueError(f"Unknown apportionment method: {method}")
+
+    # D'Hondt in all districts at once on the vote matrix
+    def _calculate_number_of_mandates_vectorized(self, parties_over_threshold):
+        vote_matrix = self._vote_matrix
+        eligible = [party in parties_over_threshold for party in LIST_OF_PARTIES]
+        mandates = allocate_dhont_all_districts(
+            vote_matrix.get_votes(), vote_matrix.get_n_seats(), eligible
+        )
+        self.set_mandates_array(mandates)
+
+    # Quotient tables and margins of seats in all districts for current votes and
+    # parties over threshold, see calculate_seat_margins() in apportionment.py.
+    # Rows of arrays follow "district_ids" and columns LIST_OF_PARTIES.
+    def get_seat_margins(self):
+        parties_over_threshold = self.get_parties_over_threshold()
+        margins = calculate_seat_margins(
+            self._read_votes(),
+            [district.get_n_seats() for district in self._districts.values()],
+            [party in parties_over_threshold for party in LIST_OF_PARTIES],
+        )
+        margins["district_ids"] = list(self._districts.keys())
+        return margins
 
     def are_results_approx_equal(self, results1, results2, epsilon_percent):
         epsilon = epsilon_percent * self.get_sum_of_votes() / 100
@@ -318,25 +949,12 @@ class DistrictDatabase:
         return True
 
     def get_parties_over_threshold(self):
-        parties_over_threshold = []
-        for party in LIST_OF_PARTIES:
-            if (
-                party == "TD"
-                and self.get_current_overall_results()[party]
-                > COALITION_TRESHOLD * self.get_sum_of_votes()
-            ):
-                parties_over_threshold.append(party)
-            elif party == "MN":
-                parties_over_threshold.append(party)
-            elif party == "Inne":
-                continue
-            elif (
-                self.get_current_overall_results()[party]
-                > PARTY_TRESHOLD * self.get_sum_of_votes()
-                and party != "TD"
-            ):
-                parties_over_threshold.append(party)
-        return parties_over_threshold
+        if self._parties_over_threshold is None:
+            self._count("threshold_recomputations")
+            self._parties_over_threshold = select_parties_over_threshold(
+                self.get_current_overall_results(), self.get_sum_of_votes()
+            )
+        return list(self._parties_over_threshold)
 
     def get_number_of_mandates(self):
         mandates = {party: 0 for party in LIST_OF_PARTIES}
@@ -351,6 +969,82 @@ class DistrictDatabase:
 
         return mandates
 
+    # Simulate n_draws polls around poll_results_percent and return distribution of seats:
+    # mean seats and seat quantiles of parties, probabilities of majority of
+    # PIS_KONFEDERACJA and OPPOSITION and probabilities of parties crossing thresholds.
+    # Error models: "dirichlet" (with concentration) and "normal" (with
+    # standard_deviation_percent or covariance matrix in LIST_OF_PARTIES order).
+    # Draws are fitted starting from the saved (baseline) state and run in n_workers
+    # processes, results for given seed do not depend on n_workers.
+    def simulate_many(
+        self,
+        poll_results_percent,
+        n_draws,
+        error_model="dirichlet",
+        concentration=1000,
+        standard_deviation_percent=1.0,
+        covariance=None,
+        quantiles=(0.05, 0.5, 0.95),
+        epsilon_percent=0.01,
+        n_workers=None,
+        seed=None,
+    ):
+        if error_model not in monte_carlo.ERROR_MODELS:
+            raise ValueError(f"Unknown error model: {error_model}")
+
+        poll_percent = [poll_results_percent[party] for party in LIST_OF_PARTIES]
+        model_kwargs = {
+            "error_model": error_model,
+            "concentration": concentration,
+            "standard_deviation_percent": standard_deviation_percent,
+            "covariance": covariance,
+        }
+        polls, seats = monte_carlo.simulate_many(
+            self._checkpoints.get_baseline(),
+            self.get_sums_of_votes_array(),
+            np.array([district.get_n_seats() for district in self._districts.values()]),
+            poll_percent,
+            n_draws,
+            model_kwargs,
+            epsilon_percent,
+            n_workers,
+            seed,
+        )
+        return monte_carlo.summarize_simulations(polls, seats, n_draws, quantiles)
+
+    # Seats of party for its national shares in grid (percent). Other parties keep their
+    # proportions of the current national results and every poll is fitted from the saved
+    # state, so seats are the same as after simulate_poll_results() of the poll. With
+    # fitted=False shares of other parties are rescaled only in every district of the
+    # current state, which is faster, but may differ from the fitted poll by a few seats.
+    # Returns a dict with seats of the party at grid points (in total and in districts),
+    # shares at which its number of seats changes with seats above them, and shares
+    # at which any party crosses its threshold (see seat_curve.py).
+    def seat_curve(self, party, grid, fitted=True, epsilon_percent=0.01, method="dhont"):
+        if not fitted:
+            return calculate_seat_curve(
+                self._read_votes(),
+                [district.get_n_seats() for district in self._districts.values()],
+                LIST_OF_PARTIES,
+                party,
+                grid,
+            )
+
+        def fit_polls(polls_percent):
+            _, mandates, converged = self.fit_polls_batched(
+                polls_percent, epsilon_percent, method
+            )
+            return mandates, converged
+
+        results = self.get_current_overall_results()
+        return calculate_fitted_seat_curve(
+            fit_polls,
+            [results[party_] for party_ in LIST_OF_PARTIES],
+            LIST_OF_PARTIES,
+            party,
+            grid,
+        )
+
     # Implement Flis formula
     # Based on:
     # Jarosław Flis, Wojciech Słomczyński,	Dariusz Stolicki; (2019);
@@ -3,8 +3,53 @@
 # for Sejm districts. It uses data from the 2020 Polish presidential election results for powiats,
 # because Sejm districts results for presidential election are not availaible on the PKW site.
 #
+# Powiats are mapped to districts once and the powiat csv is read in a single pass,
+# summing its numeric columns into one integer array per district.
+#
 import csv
 
+import numpy as np
+
+# Columns of the powiat csv which are not summed up
+NON_NUMERIC_COLUMNS = ["Nr OKW", "Województwo", "Powiat", "Kod TERYT"]
+
+# Names of powiats in district boundaries which differ from names in the powiat csv
+BOUNDARY_ALIASES = {"średzki WIEL": "średzki WIE"}
+
+
+# Results of the presidential election aggregated to Sejm districts
+class DistrictResults:
+    def __init__(self, district_ids, columns, totals):
+        self._district_ids = list(district_ids)
+        self._columns = list(columns)
+        self._column_index = {column: i for i, column in enumerate(self._columns)}
+        self._totals = totals
+
+    def get_district_ids(self):
+        return self._district_ids
+
+    def get_columns(self):
+        return self._columns
+
+    # (districts x columns) integer array
+    def get_totals(self):
+        return self._totals
+
+    # Dict {district id: value} of one column
+    def get_column(self, column):
+        values = self._totals[:, self._column_index[column]].tolist()
+        return dict(zip(self._district_ids, values))
+
+    # Rows in the format of the generated csv file
+    def get_rows(self):
+        for district_id, district_totals in zip(self._district_ids, self._totals):
+            row = {
+                "Numer okręgu": district_id,
+                "Nazwa": f"Okręg Wyborczy Nr {district_id}",
+            }
+            row.update(zip(self._columns, district_totals.tolist()))
+            yield row
+
 
 class DistrictResultsGenerator:
     def __init__(self, powiat_results_path, districts_path, output_path):
@@ -14,58 +59,71 @@ class DistrictResultsGenerator:
             self.generate_results(powiat_results_file, districts_file, output_file)
 
     def generate_results(self, powiat_results_file, districts_file, output_file):
-        districts_reader = csv.DictReader(districts_file, delimiter=";")
+        results = self.aggregate_results(powiat_results_file, districts_file)
+        self.write_results(results, output_file)
 
-        # csv.DictReader does not allow to iterate over the same instance twice,
-        # so we need to write it into a list
-        powiat_reader = csv.DictReader(powiat_results_file, delimiter=";")
-        powiat_data = [row for row in powiat_reader]
+    # Aggregate powiat results without writing them, see DistrictResults
+    @classmethod
+    def aggregate_results(cls, powiat_results_file, districts_file):
+        district_ids, district_of_voivodeship, district_of_powiat = cls.map_powiats(
+            districts_file
+        )
 
-        districts = []
-        # We need to remove non-numeric keys from powiat_row
-        non_numeric_keys = ["Nr OKW", "Województwo", "Powiat", "Kod TERYT"]
+        powiat_reader = csv.reader(powiat_results_file, delimiter=";")
+        header = [cls.clear_key(key) for key in next(powiat_reader)]
+        voivodeship_column = header.index("Województwo")
+        powiat_column = header.index("Powiat")
+        numeric_columns = [
+            i for i, key in enumerate(header) if key not in NON_NUMERIC_COLUMNS
+        ]
 
-        for district_row in districts_reader:
-            district_data = {
-                "Numer okręgu": district_row["Numer okręgu"],
-                "Nazwa": f'Okręg Wyborczy Nr {district_row["Numer okręgu"]}',
-            }
+        totals = np.zeros((len(district_ids), len(numeric_columns)), dtype=np.int64)
+        for powiat_row in powiat_reader:
+            voivodeship = powiat_row[voivodeship_column]
+            if voivodeship in district_of_voivodeship:
+                district = district_of_voivodeship[voivodeship]
+            elif powiat_row[powiat_column] in district_of_powiat:
+                district = district_of_powiat[powiat_row[powiat_column]]
+            else:
+                raise ValueError(f"Powiat {powiat_row[powiat_column]} is in no district")
+            totals[district] += [int(powiat_row[i]) for i in numeric_columns]
+
+        return DistrictResults(
+            district_ids, [header[i] for i in numeric_columns], totals
+        )
+
+    # Map voivodeships, which are whole districts, and powiats to indices of districts.
+    # Names of powiats are unique outside of these voivodeships.
+    @staticmethod
+    def map_powiats(districts_file):
+        district_ids = []
+        district_of_voivodeship = {}
+        district_of_powiat = {}
+
+        for i, district_row in enumerate(csv.DictReader(districts_file, delimiter=";")):
+            district_ids.append(district_row["Numer okręgu"])
             boundaries = district_row["Opis granic"]
 
-            if "województwo" in boundaries:
-                voivodeship = boundaries.removeprefix("województwo ")
-                for powiat_row in powiat_data:
-                    if powiat_row["Województwo"] == voivodeship:
-                        for key in powiat_row.keys():
-                            key = self.clear_key(key)
-                            if key not in non_numeric_keys:
-                                if key in district_data:
-                                    district_data[key] += int(powiat_row[key])
-                                else:
-                                    district_data[key] = int(powiat_row[key])
+            if boundaries.startswith("województwo "):
+                district_of_voivodeship[boundaries.removeprefix("województwo ")] = i
             else:
-                powiats_in_district = boundaries.split(", ")
-                for powiat_row in powiat_data:
-                    if powiat_row["Powiat"] in powiats_in_district:
-                        for key in powiat_row.keys():
-                            key = self.clear_key(key)
-                            if key not in non_numeric_keys:
-                                if key in district_data:
-                                    district_data[key] += int(powiat_row[key])
-                                else:
-                                    district_data[key] = int(powiat_row[key])
-            districts.append(district_data)
-
-        self.write_results(districts, output_file)
-
-    def write_results(self, districts, output_file):
-        fieldnames = districts[0].keys()
+                for powiat in boundaries.split(", "):
+                    powiat = BOUNDARY_ALIASES.get(powiat, powiat)
+                    if powiat in district_of_powiat:
+                        raise ValueError(f"Powiat {powiat} is in more than one district")
+                    district_of_powiat[powiat] = i
+
+        return district_ids, district_of_voivodeship, district_of_powiat
+
+    @staticmethod
+    def write_results(results, output_file):
+        fieldnames = ["Numer okręgu", "Nazwa"] + results.get_columns()
         writer = csv.DictWriter(output_file, fieldnames, delimiter=";")
         writer.writeheader()
-        for district_data in districts:
-            writer.writerow(district_data)
+        writer.writerows(results.get_rows())
 
-    def clear_key(self, key):
+    @staticmethod
+    def clear_key(key):
         if "\ufeff" in key:
             key = key.removeprefix('\ufeff"')
             key = key.removesuffix('"')
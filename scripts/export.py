@@ -0,0 +1,322 @@
+#
+# Streaming export of per-district results of scenarios.
+#
+# Scenarios come in batches (scenario ids, (K x districts x parties) votes and seats),
+# e.g. from DistrictDatabase.fit_polls_batched(), and every batch is written before
+# the next one is calculated, so memory does not depend on the number of scenarios.
+# One row per scenario and district holds attributes of the district (seats, sum of votes,
+# attendance, population, area, votes per seat) and votes, percentages and seats of every
+# party ("votes_PiS", "percent_PiS", "seats_PiS", ...).
+#
+# Formats: "csv", "jsonl", "parquet" (needs pyarrow) and "npz". npz files are written
+# as a zip of .npy arrays, one set of arrays per batch, see read_npz_export().
+# "columnar" is parquet if pyarrow is installed and npz otherwise. The output is written
+# to a temporary file first, so a failed export does not leave a partial file.
+#
+# Scenarios which cannot be parsed or fitted are skipped, their ids and errors are
+# reported on stderr.
+#
+# Usage: python scripts/export.py [polls] --output path [--format ...] [--method dhont]
+#        Without polls the saved state is exported as one scenario.
+#
+import argparse
+import csv
+import json
+import os
+import sys
+import zipfile
+from itertools import islice
+
+import numpy as np
+
+from constants import *
+
+FORMATS = ["csv", "jsonl", "parquet", "npz", "columnar"]
+BATCH_SIZE = 256
+EPSILON_PERCENT = 0.01
+
+DISTRICT_COLUMNS = [
+    "n_seats",
+    "sum_of_votes",
+    "attendance_percent",
+    "population",
+    "area",
+    "votes_per_seat",
+]
+
+
+def get_columns():
+    columns = ["scenario", "district"] + DISTRICT_COLUMNS
+    for prefix in ["votes", "percent", "seats"]:
+        columns += [f"{prefix}_{party}" for party in LIST_OF_PARTIES]
+    return columns
+
+
+def get_columnar_format():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "npz"
+    return "parquet"
+
+
+# Format by extension of path
+def guess_format(path):
+    for format in ["csv", "jsonl", "parquet", "npz"]:
+        if path.endswith(f".{format}"):
+            return format
+    return "columnar"
+
+
+# Attributes of districts which are the same in all scenarios, {column: vector}
+def get_district_attributes(database):
+    districts = list(database.get_districts())
+    return {
+        "district": [district.get_id() for district in districts],
+        "n_seats": np.array([district.get_n_seats() for district in districts]),
+        "sum_of_votes": database.get_sums_of_votes_array(),
+        "attendance_percent": np.array(
+            [district.get_attendance_percent() for district in districts]
+        ),
+        "population": np.array([district.get_population() for district in districts]),
+        "area": np.array([district.get_area() for district in districts]),
+        "votes_per_seat": np.array(
+            [district.get_votes_per_seat() for district in districts]
+        ),
+    }
+
+
+# Current state of the database as a single batch with one scenario
+def current_state_batches(database, scenario_id=0):
+    mandates = database.get_mandates_array()
+    if mandates is None:
+        database.calculate_number_of_mandates_in_all_districts()
+        mandates = database.get_mandates_array()
+    yield [scenario_id], database.get_votes_array()[None], mandates[None]
+
+
+# Batches of fitted polls, polls is an iterable of (scenario id, percents of parties
+# in LIST_OF_PARTIES order). Scenarios which could not be fitted are skipped and
+# (scenario id, error) of them is appended to failed if given.
+def poll_batches(database, polls, method="dhont", batch_size=BATCH_SIZE, failed=None):
+    if failed is None:
+        failed = []
+    polls = iter(polls)
+    while chunk := list(islice(polls, batch_size)):
+        ids = []
+        valid_polls = []
+        for id, poll in chunk:
+            if min(poll) < 0:
+                failed.append((id, "Poll results must not be negative"))
+                continue
+            ids.append(id)
+            valid_polls.append(poll)
+        if not valid_polls:
+            continue
+
+        votes, mandates, converged = database.fit_polls_batched(
+            valid_polls, EPSILON_PERCENT, method
+        )
+        for id, fitted in zip(ids, converged):
+            if not fitted:
+                failed.append((id, "Poll results could not be fitted"))
+        yield (
+            [id for id, fitted in zip(ids, converged) if fitted],
+            votes[converged],
+            mandates[converged],
+        )
+
+
+# Columns of a batch as flat arrays, rows are ordered by scenario, then by district
+def batch_columns(attributes, scenario_ids, votes, mandates):
+    n_scenarios, n_districts, _ = votes.shape
+    columns = {
+        "scenario": np.repeat(np.asarray(scenario_ids), n_districts),
+        "district": np.tile(np.asarray(attributes["district"]), n_scenarios),
+    }
+    for column in DISTRICT_COLUMNS:
+        columns[column] = np.tile(attributes[column], n_scenarios)
+
+    sums_of_votes = np.asarray(attributes["sum_of_votes"], dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percents = votes / sums_of_votes[None, :, None] * 100
+    for prefix, values in [("votes", votes), ("percent", percents), ("seats", mandates)]:
+        for i, party in enumerate(LIST_OF_PARTIES):
+            columns[f"{prefix}_{party}"] = values[:, :, i].ravel()
+    return columns
+
+
+class CsvWriter:
+    def __init__(self, output_file):
+        self._writer = csv.writer(output_file, delimiter=";")
+        self._writer.writerow(get_columns())
+
+    def write(self, columns):
+        self._writer.writerows(zip(*[columns[column].tolist() for column in columns]))
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    def __init__(self, output_file):
+        self._output_file = output_file
+
+    def write(self, columns):
+        names = list(columns)
+        for row in zip(*[columns[column].tolist() for column in names]):
+            self._output_file.write(json.dumps(dict(zip(names, row))) + "\n")
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        # pyarrow is an optional dependency
+        import pyarrow
+        import pyarrow.parquet
+
+        self._pyarrow = pyarrow
+        self._path = path
+        self._writer = None
+
+    def write(self, columns):
+        table = self._pyarrow.table(columns)
+        if self._writer is None:
+            self._writer = self._pyarrow.parquet.ParquetWriter(self._path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+# Arrays of a batch are written as "<column>/<batch number>.npy"
+class NpzWriter:
+    def __init__(self, path):
+        self._zip_file = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True)
+        self._n_batches = 0
+
+    def write(self, columns):
+        for column, values in columns.items():
+            with self._zip_file.open(
+                f"{column}/{self._n_batches:06d}.npy", "w", force_zip64=True
+            ) as array_file:
+                np.lib.format.write_array(array_file, np.asarray(values))
+        self._n_batches += 1
+
+    def close(self):
+        self._zip_file.close()
+
+
+# Columns of an npz export, batches are concatenated
+def read_npz_export(path):
+    arrays = {}
+    with zipfile.ZipFile(path, "r") as zip_file:
+        for name in sorted(zip_file.namelist()):
+            column = name.split("/")[0]
+            with zip_file.open(name) as array_file:
+                arrays.setdefault(column, []).append(np.lib.format.read_array(array_file))
+    return {column: np.concatenate(batches) for column, batches in arrays.items()}
+
+
+# Write batches (see current_state_batches() and poll_batches()) to path,
+# returns the number of written rows
+def export_batches(database, batches, path, format=None):
+    if format is None:
+        format = guess_format(path)
+    if format == "columnar":
+        format = get_columnar_format()
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format: {format}")
+
+    attributes = get_district_attributes(database)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    output_file = None
+    if format in ["csv", "jsonl"]:
+        output_file = open(temporary_path, "w", newline="")
+        writer = CsvWriter(output_file) if format == "csv" else JsonLinesWriter(output_file)
+    elif format == "parquet":
+        writer = ParquetWriter(temporary_path)
+    else:
+        writer = NpzWriter(temporary_path)
+
+    n_rows = 0
+    try:
+        try:
+            for scenario_ids, votes, mandates in batches:
+                if len(scenario_ids) == 0:
+                    continue
+                columns = batch_columns(attributes, scenario_ids, votes, mandates)
+                writer.write(columns)
+                n_rows += len(columns["scenario"])
+        finally:
+            writer.close()
+            if output_file is not None:
+                output_file.close()
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    os.replace(temporary_path, path)
+    return n_rows
+
+
+def main(args=None):
+    import batch
+
+    parser = argparse.ArgumentParser(
+        description="Export results of poll scenarios in districts"
+    )
+    parser.add_argument("input", nargs="?", help="polls as csv or JSON Lines")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--format", choices=FORMATS, help="default: by file extension")
+    parser.add_argument("--method", default="dhont")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--cache", help="path of the dataset cache")
+    args = parser.parse_args(args)
+
+    database = batch.load_database(args.data_dir, args.cache)
+    # (scenario id, error) of skipped scenarios
+    failed = []
+    if args.input is None:
+        batches = current_state_batches(database)
+    else:
+        input_file = open(args.input, "r")
+        input_format = "csv" if args.input.endswith(".csv") else "jsonl"
+        polls = _read_polls(input_file, input_format, failed)
+        batches = poll_batches(database, polls, args.method, args.batch_size, failed)
+
+    try:
+        n_rows = export_batches(database, batches, args.output, args.format)
+    finally:
+        if args.input is not None:
+            input_file.close()
+    print(f"{n_rows} rows written to {args.output}", file=sys.stderr)
+    if failed:
+        print(f"{len(failed)} scenarios skipped:", file=sys.stderr)
+        for id, error in failed:
+            print(f"  {id}: {error}", file=sys.stderr)
+
+
+# (scenario id, percents of parties) of records, records which cannot be parsed
+# are skipped and (scenario id, error) of them is appended to failed
+def _read_polls(input_file, input_format, failed):
+    import batch
+
+    for i, record in enumerate(batch.read_records(input_file, input_format)):
+        id = i
+        try:
+            record = batch.parse_record(record)
+            id = record.get("id", i)
+            poll_results_percent = batch.parse_poll(record)
+        except (TypeError, ValueError) as error:
+            failed.append((id, str(error)))
+            continue
+        yield id, [poll_results_percent[party] for party in LIST_OF_PARTIES]
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,21 @@
+import math
+
 from PySide2.QtWidgets import QMainWindow, QListWidgetItem
 from PySide2.QtWidgets import QGraphicsScene, QGraphicsProxyWidget
 from PySide2.QtWidgets import QTableWidgetItem
 from PySide2.QtGui import QColor, QFont
+from PySide2.QtCore import QThreadPool, QTimer
 
 from ui_election_calculator import Ui_MainWindow
 from district_database import DistrictDatabase
+from calculation_task import CalculationTask
 from constants import *
 
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+# Delay of recalculation after the last edit in live mode
+LIVE_MODE_DELAY_MS = 150
 
 
 class ElectionCalculatorWindow(QMainWindow):
@@ -17,12 +24,20 @@ class ElectionCalculatorWindow(QMainWindow):
         self._is_user_data_proper = False
         self._is_main_scenario = True
 
+        # Calculations run one at a time in the background, see calculation_task.py
+        self._thread_pool = QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+        self._calculation_task = None
+        self._calculation_generation = 0
+        self._shown_mandates = None
+
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
 
         self.__init_database()
         self.__init_mandates_chart()
         self.__init_list_of_distrcits()
+        self.__init_live_mode()
 
         # Set map widget as default
         self.ui.tabWidget.setCurrentWidget(self.ui.tab)
@@ -30,7 +45,8 @@ class ElectionCalculatorWindow(QMainWindow):
         self.ui.pushButton.clicked.connect(self._calculate_mandates)
 
     def __init_database(self):
-        self.database = DistrictDatabase(
+        self.database = DistrictDatabase.from_cache(
+            cache_path="./data/dataset.cache",
             districts_path="./data/okregi_sejm.csv",
             parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
             presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
@@ -43,7 +59,9 @@ class ElectionCalculatorWindow(QMainWindow):
         self.scene = QGraphicsScene()
         self.ui.graphicsView.setScene(self.scene)
 
-        self.figure, self.ax = plt.subplots()
+        # Figure without pyplot, which would load its global state and backends
+        self.figure = Figure()
+        self.ax = self.figure.add_subplot()
         self.canvas = FigureCanvas(self.figure)
         self.proxy = QGraphicsProxyWidget()
         self.proxy.setWidget(self.canvas)
@@ -53,6 +71,16 @@ class ElectionCalculatorWindow(QMainWindow):
         self.x = (self.view_rect.width() - self.chart_rect.width()) / 2
         self.y = (self.view_rect.height() - self.chart_rect.height()) / 2
 
+        # Canvas and bars are created once, updates only change heights of bars
+        self.chart_parties = [party for party in LIST_OF_PARTIES if party != "Inne"]
+        self.bars = self.ax.bar(self.chart_parties, [0] * len(self.chart_parties))
+        self.proxy.setPos(self.x, self.y)
+        self.canvas.setGeometry(
+            0, 0, self.view_rect.width() - 5, self.view_rect.height() - 5
+        )
+        self.scene.addItem(self.proxy)
+        self.proxy.hide()
+
     def __init_list_of_distrcits(self):
         self.ui.stackedWidget.setCurrentIndex(0)
         for district in self.database.get_districts():
@@ -61,16 +89,46 @@ class ElectionCalculatorWindow(QMainWindow):
             self.ui.districts.addItem(item)
         self.ui.districts.itemClicked.connect(self._select_district)
 
+    # In live mode results are recalculated LIVE_MODE_DELAY_MS after the last edit
+    def __init_live_mode(self):
+        self._live_timer = QTimer(self)
+        self._live_timer.setSingleShot(True)
+        self._live_timer.setInterval(LIVE_MODE_DELAY_MS)
+        self._live_timer.timeout.connect(self._calculate_mandates_live)
+
+        for line_edit in [
+            self.ui.lineEdit_PiS,
+            self.ui.lineEdit_KO,
+            self.ui.lineEdit_Lewica,
+            self.ui.lineEdit_TD,
+            self.ui.lineEdit_Konfederacja,
+        ]:
+            line_edit.textEdited.connect(self._schedule_live_calculation)
+        self.ui.radioButton_mainScenario.toggled.connect(self._schedule_live_calculation)
+
+    def _schedule_live_calculation(self):
+        if self.ui.checkBox_live.isChecked():
+            self._live_timer.start()
+
     def _calculate_mandates(self):
-        self._reset_party_labels()
+        self._calculate(live=False)
+
+    def _calculate_mandates_live(self):
+        self._calculate(live=True)
+
+    # Live calculation keeps previous results on screen until new ones are ready
+    # and starts fitting from the previously fitted votes
+    def _calculate(self, live):
+        if live:
+            self._cancel_calculation()
+            self.ui.label_error.setText("")
+        else:
+            self._reset_party_labels()
         self._is_user_data_proper = True
 
         # Check if user data is not empty
         if self._is_all_user_data_zeroes():
-            self.ui.label_error.setText(
-                "<b><font color='red'>BŁĄD: Wprowadź jakieś wyniki!<b></font>"
-            )
-            self._error_action()
+            self._show_error("BŁĄD: Wprowadź jakieś wyniki!")
             return
 
         try:
@@ -83,19 +141,13 @@ class ElectionCalculatorWindow(QMainWindow):
                 "MN": 0.17,
             }
         except ValueError:
-            self.ui.label_error.setText(
-                "<b><font color='red'>BŁĄD: Wprowadź poprawne wartości!<b></font>"
-            )
-            self._error_action()
+            self._show_error("BŁĄD: Wprowadź poprawne wartości!")
             return
 
         # Check if all values are non-negative
         for percent in poll_results_percent.values():
             if percent < 0:
-                self.ui.label_error.setText(
-                    "<b><font color='red'>BŁĄD: Wprowadź nieujemne wartości!<b></font>"
-                )
-                self._error_action()
+                self._show_error("BŁĄD: Wprowadź nieujemne wartości!")
                 return
 
         # Sum can be larger than 100% (because of MN) - it wil be rescaled
@@ -106,45 +158,83 @@ class ElectionCalculatorWindow(QMainWindow):
 
         # Check if sum is not larger than 100% (plus MN)
         if poll_results_percent["Inne"] < 0:
-            self.ui.label_error.setText(
-                "<b><font color='red'>BŁĄD: Suma przekracza 100%!<b></font>"
-            )
-            self._error_action()
+            self._show_error("BŁĄD: Suma przekracza 100%!")
             return
 
         # Calculate mandates
         if self.ui.radioButton_mainScenario.isChecked():
             self._is_main_scenario = True
-            self.database.simulate_poll_results(poll_results_percent, 0.1)
-            mandates = self.database.get_number_of_mandates()
+            start_votes = self.database.get_votes_array() if live else None
+            self._start_calculation(poll_results_percent, start_votes)
         elif self.ui.radioButton_flis.isChecked():
             self._is_main_scenario = False
             mandates = self.database.get_number_of_mandates_flis(poll_results_percent)
+            self._show_mandates(mandates)
+
+    # Fit poll results in the background, the result is applied in _calculation_finished()
+    def _start_calculation(self, poll_results_percent, start_votes=None):
+        self._calculation_generation += 1
+        self._calculation_task = CalculationTask(
+            self._calculation_generation,
+            self.database.fit_poll_results,
+            poll_results_percent,
+            0.1,
+            start_votes,
+        )
+        self._calculation_task.signals.finished.connect(self._calculation_finished)
+        self._calculation_task.signals.failed.connect(self._calculation_failed)
+        self.ui.label_error.setText("<font color='grey'>Obliczanie…</font>")
+        self._thread_pool.start(self._calculation_task)
+
+    # Results of a cancelled calculation are dropped, even if they were already sent
+    def _cancel_calculation(self):
+        if self._calculation_task is not None:
+            self._calculation_task.cancel()
+            self._calculation_task = None
+        self._calculation_generation += 1
+
+    def _calculation_finished(self, generation, result):
+        if generation != self._calculation_generation:
+            return
+        self._calculation_task = None
+        self.ui.label_error.setText("")
 
-        # Update
-        self._update_mandates_chart(mandates)
-        self._update_mandate_labels(mandates)
-        self._update_districts_info()
-
-    def _update_mandates_chart(self, party_mandates):
-        parties = []
-        chart_mandates = []
+        votes, mandates = result
+        self.database.apply_poll_results(votes, mandates)
+        self._show_mandates(self.database.get_number_of_mandates())
 
-        for party, n_mandates in party_mandates.items():
-            if party != "Inne":
-                parties.append(party)
-                chart_mandates.append(n_mandates)
+    def _calculation_failed(self, generation, error):
+        if generation != self._calculation_generation:
+            return
+        self._calculation_task = None
+        self._show_error("BŁĄD: Nie można dopasować wyników!")
+
+    def closeEvent(self, event):
+        self._cancel_calculation()
+        self._thread_pool.waitForDone()
+        super().closeEvent(event)
+
+    # Chart and labels are redrawn only if seats changed, results in districts
+    # (shown in percent) are always updated
+    def _show_mandates(self, mandates):
+        if mandates != self._shown_mandates:
+            self._update_mandates_chart(mandates)
+            self._update_mandate_labels(mandates)
+            self._shown_mandates = dict(mandates)
+        self._update_districts_info()
 
-        self.ax.bar(parties, chart_mandates)
-        self.canvas = FigureCanvas(self.figure)
-        self.proxy = QGraphicsProxyWidget()
-        self.proxy.setWidget(self.canvas)
+    def _show_error(self, message):
+        self._reset_party_labels()
+        self.ui.label_error.setText(f"<b><font color='red'>{message}<b></font>")
+        self._error_action()
 
-        self.proxy.setPos(self.x, self.y)
-        self.canvas.setGeometry(
-            0, 0, self.view_rect.width() - 5, self.view_rect.height() - 5
-        )
-        self.scene.addItem(self.proxy)
+    def _update_mandates_chart(self, party_mandates):
+        for party, bar in zip(self.chart_parties, self.bars):
+            bar.set_height(party_mandates.get(party, 0))
+        self.ax.relim()
+        self.ax.autoscale_view()
+        self.canvas.draw_idle()
+        self.proxy.show()
 
     def _update_mandate_labels(self, mandates):
         self.ui.label_PiS.setText(f"<font color='blue'>{mandates['PiS']}</font>")
@@ -199,9 +289,9 @@ class ElectionCalculatorWindow(QMainWindow):
         n_parties = len(self.database.get_number_of_mandates())
         # Ignore "Inne" party
         self.ui.tableWidget_results.setRowCount(n_parties - 1)
-        self.ui.tableWidget_results.setColumnCount(4)
+        self.ui.tableWidget_results.setColumnCount(5)
         self.ui.tableWidget_results.setHorizontalHeaderLabels(
-            ["Partia", "Nr 1 na liście", "Poparcie", "Mandaty"]
+            ["Partia", "Nr 1 na liście", "Poparcie", "Mandaty", "Do mandatu"]
         )
 
         parties_mandates = item.district.get_number_of_mandates()
@@ -215,19 +305,25 @@ class ElectionCalculatorWindow(QMainWindow):
         )
 
         # Column width
-        self.ui.tableWidget_results.setColumnWidth(0, 116)
-        self.ui.tableWidget_results.setColumnWidth(1, 200)
-        self.ui.tableWidget_results.setColumnWidth(2, 80)
-        self.ui.tableWidget_results.setColumnWidth(3, 80)
+        self.ui.tableWidget_results.setColumnWidth(0, 100)
+        self.ui.tableWidget_results.setColumnWidth(1, 160)
+        self.ui.tableWidget_results.setColumnWidth(2, 70)
+        self.ui.tableWidget_results.setColumnWidth(3, 70)
+        self.ui.tableWidget_results.setColumnWidth(4, 80)
         # Row height
         for i in range(n_parties - 1):
             self.ui.tableWidget_results.setRowHeight(i, 34)
 
+        parties_over_threshold = self.database.get_parties_over_threshold()
+        # Votes which a party needs to gain to win one more seat in the district
+        seat_margins = self.database.get_seat_margins()
+        district_index = seat_margins["district_ids"].index(item.district.get_id())
+        votes_to_next_seat = seat_margins["votes_to_next_seat"][district_index]
         row = 0
         for party, percent in parties_results_percent.items():
             if party != "Inne":
                 # Asterisks for parties below threshold
-                if party in self.database.get_parties_over_threshold():
+                if party in parties_over_threshold:
                     party_item = QTableWidgetItem(f"{party}")
                 else:
                     party_item = QTableWidgetItem(f"{party} *")
@@ -263,6 +359,18 @@ class ElectionCalculatorWindow(QMainWindow):
                     row, 3, QTableWidgetItem(mandates_item)
                 )
 
+                party_votes_to_next_seat = votes_to_next_seat[
+                    LIST_OF_PARTIES.index(party)
+                ]
+                if math.isfinite(party_votes_to_next_seat):
+                    margin_item = QTableWidgetItem(
+                        f"{math.floor(party_votes_to_next_seat) + 1}"
+                    )
+                else:
+                    margin_item = QTableWidgetItem("-")
+                margin_item.setTextAlignment(4)
+                self.ui.tableWidget_results.setItem(row, 4, margin_item)
+
                 row += 1
 
     def _update_district_labels(self, item):
@@ -326,9 +434,12 @@ class ElectionCalculatorWindow(QMainWindow):
         self.ui.label_PiSKonf.setText("0")
         self.ui.label_Opposition.setText("0")
 
+        # Results of previous inputs are no longer needed
+        self._cancel_calculation()
+        self._shown_mandates = None
+
         # Reset chart
-        self.scene.clear()
-        self.ax.clear()
+        self.proxy.hide()
 
         # Reset database
         self.database.reset_all_districts_state()
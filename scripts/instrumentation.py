@@ -0,0 +1,110 @@
+#
+# Opt-in counters and timers of calculations.
+#
+# DistrictDatabase keeps a CalculationStats only inside DistrictDatabase.instrument(),
+# otherwise every hook is a single check of None. Timers measure wall time with
+# time.perf_counter(). An optional cProfile report of the instrumented block can be
+# written to a file, see write_profile_report().
+#
+import time
+from contextlib import contextmanager
+
+PROFILE_SORT = "cumulative"
+PROFILE_LINES = 30
+
+
+class CalculationStats:
+    def __init__(self):
+        self._counters = {}
+        # {name: [total seconds, count]}
+        self._timers = {}
+        self._values = {}
+
+    def increment(self, name, n=1):
+        self._counters[name] = self._counters.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        timer = self._timers.setdefault(name, [0.0, 0])
+        timer[0] += seconds
+        timer[1] += 1
+
+    # Last value of a measurement, e.g. residual of the last fit
+    def set_value(self, name, value):
+        self._values[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def get_counter(self, name):
+        return self._counters.get(name, 0)
+
+    def get_counters(self):
+        return dict(self._counters)
+
+    # {name: {"total": seconds, "count": number of measurements}}
+    def get_timers(self):
+        return {
+            name: {"total": total, "count": count}
+            for name, (total, count) in self._timers.items()
+        }
+
+    def get_value(self, name):
+        return self._values.get(name)
+
+    def get_values(self):
+        return dict(self._values)
+
+    def as_dict(self):
+        return {
+            "counters": self.get_counters(),
+            "timers": self.get_timers(),
+            "values": self.get_values(),
+        }
+
+    def reset(self):
+        self._counters.clear()
+        self._timers.clear()
+        self._values.clear()
+
+    def __str__(self) -> str:
+        lines = [f"{name}: {count}" for name, count in self._counters.items()]
+        lines += [
+            f"{name}: {total * 1000:.2f} ms ({count}x)"
+            for name, (total, count) in self._timers.items()
+        ]
+        lines += [f"{name}: {value}" for name, value in self._values.items()]
+        return "\n".join(lines)
+
+
+# Run the block under cProfile if output (path or text file) is given
+@contextmanager
+def profile(output=None):
+    if output is None:
+        yield
+        return
+
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        write_profile_report(profiler, output)
+
+
+def write_profile_report(profiler, output):
+    import pstats
+
+    if isinstance(output, str):
+        with open(output, "w") as output_file:
+            write_profile_report(profiler, output_file)
+        return
+    report = pstats.Stats(profiler, stream=output)
+    report.sort_stats(PROFILE_SORT).print_stats(PROFILE_LINES)
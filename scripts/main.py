@@ -1,10 +1,12 @@
-from PySide2.QtWidgets import QApplication
 import sys
 
-from gui import ElectionCalculatorWindow
-
 
+# Qt, matplotlib and the window are imported only when the GUI is started,
+# the computation core does not depend on them
 def guiMain(args):
+    from PySide2.QtWidgets import QApplication
+    from gui import ElectionCalculatorWindow
+
     app = QApplication(args)
     window = ElectionCalculatorWindow()
     window.show()
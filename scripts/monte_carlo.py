@@ -0,0 +1,176 @@
+#
+# Monte Carlo simulation of seat distributions.
+#
+# Poll results are drawn from an error model around the given poll, every draw is fitted
+# to districts and seats are allocated with D'Hondt. Draws are split into shards of fixed
+# size, each shard has its own seed spawned from one SeedSequence, so results depend only
+# on the seed and not on the number of worker processes.
+#
+import numpy as np
+
+from apportionment import allocate_dhont_all_districts, select_parties_over_threshold
+from poll_solver import fit_poll_newton
+from constants import *
+
+ERROR_MODELS = ["dirichlet", "normal"]
+SHARD_SIZE = 1000
+MAX_ITERATIONS = 100
+
+# Baseline of the worker process, set by _init_worker()
+_worker_state = {}
+
+
+# Draw n_draws poll results in percent around poll_percent (vector in LIST_OF_PARTIES order).
+# Dirichlet: shares ~ Dir(concentration * poll shares).
+# Normal: poll + N(0, covariance), negative results are cut off and results rescaled to 100%.
+def draw_polls(
+    poll_percent,
+    n_draws,
+    rng,
+    error_model="dirichlet",
+    concentration=1000,
+    standard_deviation_percent=1.0,
+    covariance=None,
+):
+    poll_percent = np.asarray(poll_percent, dtype=np.float64)
+    supported = poll_percent > 0
+    polls = np.zeros((n_draws, len(poll_percent)))
+
+    if error_model == "dirichlet":
+        alpha = concentration * poll_percent[supported] / poll_percent.sum()
+        polls[:, supported] = rng.dirichlet(alpha, size=n_draws) * 100
+    elif error_model == "normal":
+        if covariance is None:
+            covariance = np.diag(
+                np.broadcast_to(standard_deviation_percent, poll_percent.shape) ** 2
+            )
+        polls = rng.multivariate_normal(poll_percent, covariance, size=n_draws)
+        polls[:, ~supported] = 0
+        np.clip(polls, 0, None, out=polls)
+        polls *= 100 / polls.sum(axis=1, keepdims=True)
+    else:
+        raise ValueError(f"Unknown error model: {error_model}")
+    return polls
+
+
+def _init_worker(votes, sums_of_votes, n_seats):
+    _worker_state["votes"] = votes
+    _worker_state["sums_of_votes"] = sums_of_votes
+    _worker_state["n_seats"] = n_seats
+
+
+# Simulate one shard of draws in the worker process.
+# Returns drawn polls, seats (draws x parties) and mask of draws which could be fitted.
+def _simulate_shard(seed, n_draws, poll_percent, model_kwargs, epsilon_percent):
+    votes = _worker_state["votes"]
+    sums_of_votes = _worker_state["sums_of_votes"]
+    n_seats = _worker_state["n_seats"]
+    sum_of_votes = sums_of_votes.sum()
+
+    rng = np.random.default_rng(seed)
+    polls = draw_polls(poll_percent, n_draws, rng, **model_kwargs)
+    seats = np.zeros(polls.shape, dtype=np.int64)
+    fitted_draws = np.zeros(n_draws, dtype=bool)
+
+    for i, poll in enumerate(polls):
+        poll_votes = poll * sum_of_votes / 100
+        fitted, _ = fit_poll_newton(
+            votes,
+            sums_of_votes,
+            poll_votes,
+            epsilon_percent * sum_of_votes / 100,
+            MAX_ITERATIONS,
+        )
+        results = fitted.sum(axis=0)
+        if np.abs(results - poll_votes).max() > epsilon_percent * sum_of_votes / 100:
+            continue
+
+        parties_over_threshold = select_parties_over_threshold(
+            dict(zip(LIST_OF_PARTIES, results)), sum_of_votes
+        )
+        eligible = [party in parties_over_threshold for party in LIST_OF_PARTIES]
+        seats[i] = allocate_dhont_all_districts(fitted, n_seats, eligible).sum(axis=0)
+        fitted_draws[i] = True
+
+    return polls, seats, fitted_draws
+
+
+# Run n_draws simulations from baseline votes, see DistrictDatabase.simulate_many()
+def simulate_many(
+    votes,
+    sums_of_votes,
+    n_seats,
+    poll_percent,
+    n_draws,
+    model_kwargs,
+    epsilon_percent=0.01,
+    n_workers=None,
+    seed=None,
+):
+    shard_sizes = [SHARD_SIZE] * (n_draws // SHARD_SIZE)
+    if n_draws % SHARD_SIZE:
+        shard_sizes.append(n_draws % SHARD_SIZE)
+    shard_seeds = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    shard_args = [
+        (shard_seed, shard_size, poll_percent, model_kwargs, epsilon_percent)
+        for shard_seed, shard_size in zip(shard_seeds, shard_sizes)
+    ]
+
+    if n_workers == 1:
+        _init_worker(votes, sums_of_votes, n_seats)
+        results = [_simulate_shard(*args) for args in shard_args]
+    else:
+        # multiprocessing is imported only when it is needed (about 40 ms)
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            max_workers=n_workers,
+            initializer=_init_worker,
+            initargs=(votes, sums_of_votes, n_seats),
+        ) as executor:
+            results = list(executor.map(_simulate_shard, *zip(*shard_args)))
+
+    if not results:
+        return np.zeros((0, len(poll_percent))), np.zeros((0, len(poll_percent)))
+    polls = np.concatenate([shard_polls for shard_polls, _, _ in results])
+    seats = np.concatenate([shard_seats for _, shard_seats, _ in results])
+    fitted_draws = np.concatenate([fitted for _, _, fitted in results])
+    return polls[fitted_draws], seats[fitted_draws]
+
+
+# Seat quantiles and probabilities of majorities and crossing thresholds
+def summarize_simulations(polls, seats, n_draws, quantiles):
+    summary = {
+        "n_draws": n_draws,
+        "n_failed_draws": n_draws - len(seats),
+        "mean_seats": {},
+        "seat_quantiles": {},
+        "majority_probability": {},
+        "threshold_probability": {},
+    }
+    if len(seats) == 0:
+        return summary
+
+    seat_quantiles = np.quantile(seats, quantiles, axis=0)
+    for i, party in enumerate(LIST_OF_PARTIES):
+        summary["mean_seats"][party] = float(seats[:, i].mean())
+        summary["seat_quantiles"][party] = {
+            q: float(value) for q, value in zip(quantiles, seat_quantiles[:, i])
+        }
+
+    blocs = {"PIS_KONFEDERACJA": PIS_KONFEDERACJA, "OPPOSITION": OPPOSITION}
+    for name, bloc in blocs.items():
+        bloc_columns = [LIST_OF_PARTIES.index(party) for party in bloc]
+        bloc_seats = seats[:, bloc_columns].sum(axis=1)
+        summary["majority_probability"][name] = float(
+            (bloc_seats >= MAJORITY_OF_SEATS).mean()
+        )
+
+    over_threshold = np.zeros(polls.shape, dtype=bool)
+    for poll, poll_over_threshold in zip(polls, over_threshold):
+        parties = select_parties_over_threshold(dict(zip(LIST_OF_PARTIES, poll)), 100)
+        poll_over_threshold[:] = [party in parties for party in LIST_OF_PARTIES]
+    for i, party in enumerate(LIST_OF_PARTIES):
+        summary["threshold_probability"][party] = float(over_threshold[:, i].mean())
+
+    return summary
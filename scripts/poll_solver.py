@@ -0,0 +1,174 @@
+#
+# Fitting of national poll results to district results.
+#
+# The iterative loop in DistrictDatabase.simulate_poll_results() alternately scales parties
+# and rescales districts, which is the iterative proportional fitting (IPF) of a matrix
+# to given row sums (votes in districts) and column sums (poll results). Its fixed point has
+# the form X[d, p] = S[d] * V[d, p] * exp(u[p]) / sum_q(V[d, q] * exp(u[q])), so it is enough
+# to find one log scale factor u[p] per party. They are found by minimizing the convex
+# function F(u) = sum_d(S[d] * log(sum_q(V[d, q] * exp(u[q])))) - sum_p(T[p] * u[p]),
+# whose gradient is the difference between current results C and poll results T,
+# with Newton's method accelerated IPF: each Newton step solves a small
+# (parties x parties) linear system.
+#
+import numpy as np
+
+
+# Summary of a poll fit returned by DistrictDatabase.simulate_poll_results()
+class PollFitResult:
+    def __init__(self, solver, iterations, residual_percent):
+        self._solver = solver
+        self._iterations = iterations
+        self._residual_percent = residual_percent
+
+    def get_solver(self):
+        return self._solver
+
+    def get_iterations(self):
+        return self._iterations
+
+    def get_residual_percent(self):
+        return self._residual_percent
+
+    def __str__(self) -> str:
+        return (
+            f"{self._solver}: {self._iterations} iterations, "
+            f"residual {self._residual_percent:.2e}%"
+        )
+
+
+# Max absolute difference between results and poll results in percent of all votes
+def calculate_residual_percent(votes, poll_votes, sum_of_votes):
+    return float(np.abs(votes.sum(axis=0) - poll_votes).max() / sum_of_votes * 100)
+
+
+def _logsumexp(values, axis):
+    maximum = values.max(axis=axis, keepdims=True)
+    maximum[~np.isfinite(maximum)] = 0
+    return np.log(np.exp(values - maximum).sum(axis=axis)) + maximum.squeeze(axis)
+
+
+# Shares of parties in districts after scaling and log(sum_q(V[d, q] * exp(u[q])))
+# for every district, computed in log domain to avoid underflow of small parties
+def _log_shares(log_weights, log_scales):
+    log_votes = log_weights + log_scales
+    with np.errstate(divide="ignore"):
+        log_row_sums = _logsumexp(log_votes, axis=1)
+    return log_votes - log_row_sums[:, None], log_row_sums
+
+
+# Fit votes (districts x parties) to poll_votes (votes per party) keeping sums of votes
+# in districts. Each iteration is one IPF step u += log(T / C), which quickly brings
+# parties with tiny support back where Newton's method sees a flat function, followed
+# by one Newton step with backtracking line search. Returns fitted votes and number
+# of iterations.
+def fit_poll_newton(votes, sums_of_votes, poll_votes, epsilon, max_iterations):
+    fitted = np.zeros_like(votes, dtype=np.float64)
+
+    # Parties with no poll support are removed, parties with no votes cannot be scaled
+    active = (poll_votes > 0) & (votes.sum(axis=0) > 0)
+    if not active.any():
+        return fitted, 0
+
+    weights = votes[:, active]
+    has_votes = weights.sum(axis=1) > 0
+    with np.errstate(divide="ignore"):
+        log_weights = np.log(weights[has_votes])
+
+    # Work with shares of all votes, so that tolerances do not depend
+    # on the number of voters
+    sum_of_votes = sums_of_votes[has_votes].sum()
+    district_shares = sums_of_votes[has_votes] / sum_of_votes
+    log_district_shares = np.log(district_shares)
+    # Poll results must sum up to votes in districts which can be scaled
+    targets = poll_votes[active] / poll_votes[active].sum()
+    log_targets = np.log(targets)
+    epsilon = epsilon / sum_of_votes
+
+    def objective(log_row_sums, log_scales):
+        return district_shares @ log_row_sums - targets @ log_scales
+
+    log_scales = np.zeros(len(targets))
+    log_shares, log_row_sums = _log_shares(log_weights, log_scales)
+    shares = np.exp(log_shares)
+    gradient = district_shares @ shares - targets
+    iterations = 0
+    while np.abs(gradient).max() > epsilon and iterations < max_iterations:
+        # IPF step
+        log_current = _logsumexp(log_shares + log_district_shares[:, None], axis=0)
+        log_scales = log_scales + log_targets - log_current
+        log_shares, log_row_sums = _log_shares(log_weights, log_scales)
+        shares = np.exp(log_shares)
+        gradient = district_shares @ shares - targets
+
+        # Newton step, Hessian of F is diag(C) - sum_d(S[d] * shares[d] * shares[d]^T)
+        current = gradient + targets
+        hessian = np.diag(current) - (shares * district_shares[:, None]).T @ shares
+        step = np.linalg.lstsq(hessian, -gradient, rcond=None)[0]
+        slope = gradient @ step
+
+        # Backtracking line search keeps Newton's method stable for extreme polls.
+        # Close to the solution changes of F are below floating point precision
+        # and full steps converge quadratically.
+        step_size = 1.0
+        if -slope > 1e-12:
+            value = objective(log_row_sums, log_scales)
+            while step_size > 1e-10:
+                new_log_scales = log_scales + step_size * step
+                _, new_log_row_sums = _log_shares(log_weights, new_log_scales)
+                new_value = objective(new_log_row_sums, new_log_scales)
+                if new_value <= value + 1e-4 * step_size * slope:
+                    break
+                step_size /= 2
+
+        log_scales = log_scales + step_size * step
+        log_shares, log_row_sums = _log_shares(log_weights, log_scales)
+        shares = np.exp(log_shares)
+        gradient = district_shares @ shares - targets
+        iterations += 1
+
+    fitted[np.ix_(has_votes, active)] = shares * sums_of_votes[has_votes, None]
+    return fitted, iterations
+
+
+# Fit K polls at once. poll_votes is a (K x parties) array, votes are fitted on
+# a (K x districts x parties) array by the iterative loop of simulate_poll_results():
+# scale parties to the poll, then rescale districts to their sums of votes.
+# All scenarios iterate in lockstep, a scenario stops as soon as it converges.
+# Parties with no votes are not scaled, so a scenario giving them support never converges.
+# Returns fitted votes, numbers of iterations and a boolean vector of converged scenarios.
+def fit_polls_ipf(votes, sums_of_votes, poll_votes, epsilon, max_iterations):
+    votes = np.asarray(votes, dtype=np.float64)
+    sums_of_votes = np.asarray(sums_of_votes, dtype=np.float64)
+    poll_votes = np.atleast_2d(np.asarray(poll_votes, dtype=np.float64))
+    n_scenarios = len(poll_votes)
+
+    fitted = np.repeat(votes[None, :, :], n_scenarios, axis=0)
+    current = fitted.sum(axis=1)
+    iterations = np.zeros(n_scenarios, dtype=np.int64)
+    running = np.arange(n_scenarios)
+    for _ in range(max_iterations):
+        differences = np.abs(current[running] - poll_votes[running]).max(axis=1)
+        running = running[differences > epsilon]
+        if len(running) == 0:
+            break
+
+        running_current = current[running]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scales = np.where(
+                running_current != 0, poll_votes[running] / running_current, 1
+            )
+        block = fitted[running] * scales[:, None, :]
+
+        # Rescale districts whose votes do not sum up to their sum of votes
+        row_sums = block.sum(axis=2)
+        rescale = (sums_of_votes > 0) & (row_sums > 0) & (row_sums != sums_of_votes)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            block *= np.where(rescale, sums_of_votes / row_sums, 1)[:, :, None]
+
+        fitted[running] = block
+        current[running] = block.sum(axis=1)
+        iterations[running] += 1
+
+    converged = np.abs(current - poll_votes).max(axis=1) <= epsilon
+    return fitted, iterations, converged
@@ -0,0 +1,102 @@
+#
+# Index of powiats and voivodeships from population / area data (BDL format:
+# "Kod;Nazwa;value;", Kod is a 7-digit TERYT code).
+#
+# Names are normalized once ("Powiat m. st. Warszawa" -> "Warszawa", "Powiat m. Wałbrzych
+# od 2013" -> "Wałbrzych") and kept in a dict name -> TERYT codes, so every entry of
+# a district's boundary description is resolved with a single lookup. Names which occur
+# in more than one voivodeship (e.g. "bielski") are resolved with the voivodeship
+# of the other powiats of the district.
+#
+import re
+
+# Names used in boundary descriptions which differ from names in the data
+POWIAT_ALIASES = {
+    "jeleniogórski": "karkonoski",
+    "opolski LUB": "opolski",
+    "średzki WIEL": "średzki WIE",
+}
+
+# Parts of districts without population and area
+NON_TERRITORIAL_AREAS = ["zagranica", "statki"]
+
+
+# Exception raised when a name from a boundary description is not in the data
+class UnknownPowiatError(Exception):
+    def __init__(self, name):
+        self.name = name
+        super().__init__(f"Unknown powiat: {name}")
+
+
+# Exception raised when a name matches powiats in more than one voivodeship
+class AmbiguousPowiatError(Exception):
+    def __init__(self, name, codes):
+        self.name = name
+        self.codes = codes
+        super().__init__(f"Ambiguous powiat: {name} (TERYT codes: {', '.join(codes)})")
+
+
+def normalize_powiat_name(name):
+    name = re.sub(r"^Powiat (m\. st\. |m\. )?", "", name.strip())
+    return re.sub(r" od \d{4}$", "", name)
+
+
+# TERYT code of a row: 2 digits for voivodeships, 4 digits for powiats
+def get_teryt_code(kod):
+    if kod[2:] == "00000":
+        return kod[:2]
+    return kod[:4]
+
+
+# Dict TERYT code -> value of value_column
+def index_values(rows, value_column):
+    return {get_teryt_code(row["Kod"]): int(row[value_column]) for row in rows}
+
+
+class PowiatIndex:
+    def __init__(self, rows):
+        self._powiat_codes = {}
+        self._voivodeship_codes = {}
+        for row in rows:
+            code = get_teryt_code(row["Kod"])
+            if code == "00":
+                continue
+            if len(code) == 2:
+                self._voivodeship_codes[row["Nazwa"].lower()] = code
+            else:
+                name = normalize_powiat_name(row["Nazwa"])
+                self._powiat_codes.setdefault(name, []).append(code)
+
+    def get_voivodeship_code(self, voivodeship):
+        try:
+            return self._voivodeship_codes[voivodeship.lower()]
+        except KeyError:
+            raise UnknownPowiatError(voivodeship) from None
+
+    # All TERYT codes of powiats with given name (after aliases)
+    def get_powiat_codes(self, name):
+        codes = self._powiat_codes.get(POWIAT_ALIASES.get(name, name))
+        if codes is None:
+            raise UnknownPowiatError(name)
+        return codes
+
+    # TERYT codes of all areas in a boundary description, e.g. "województwo lubuskie"
+    # or "bolesławiecki, głogowski, ..., Jelenia Góra, Legnica"
+    def resolve_boundaries(self, boundaries):
+        if boundaries.startswith("województwo "):
+            return [self.get_voivodeship_code(boundaries.removeprefix("województwo "))]
+
+        names = [
+            name for name in boundaries.split(", ") if name not in NON_TERRITORIAL_AREAS
+        ]
+        candidates = [self.get_powiat_codes(name) for name in names]
+        voivodeships = {codes[0][:2] for codes in candidates if len(codes) == 1}
+
+        resolved = []
+        for name, codes in zip(names, candidates):
+            if len(codes) > 1:
+                codes = [code for code in codes if code[:2] in voivodeships]
+                if len(codes) != 1:
+                    raise AmbiguousPowiatError(name, self.get_powiat_codes(name))
+            resolved.append(codes[0])
+        return resolved
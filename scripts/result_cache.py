@@ -0,0 +1,177 @@
+#
+# Cache of seats calculated for polls.
+#
+# Keys are poll results quantized to the fitting tolerance (polls closer than epsilon
+# give the same fit within the tolerance), the method of allocation and the fingerprint
+# of the dataset (see DistrictDatabase.get_fingerprint()). Entries are kept in an LRU
+# of max_size entries and optionally in cache_dir as JSON files shared between processes,
+# both expire after ttl_seconds (None - never). The cache can be shared by threads,
+# values are calculated outside of its lock.
+#
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from constants import *
+
+# Flis estimate is exact, polls are quantized only to make keys hashable
+FLIS_EPSILON_PERCENT = 1e-9
+
+
+def make_key(
+    kind, fingerprint, method, poll_results_percent, epsilon_percent, solver=None
+):
+    quantized = tuple(
+        round(poll_results_percent.get(party, 0.0) / epsilon_percent)
+        for party in LIST_OF_PARTIES
+    )
+    return (kind, fingerprint, method, solver, epsilon_percent, quantized)
+
+
+class ResultCache:
+    def __init__(self, max_size=256, ttl_seconds=None, cache_dir=None):
+        if max_size < 1:
+            raise ValueError("Size of the cache must be positive")
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._cache_dir = cache_dir
+        # {key: (time of creation, value)}, least recently used first
+        self._entries = OrderedDict()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        requests = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            (stats["hits"] + stats["disk_hits"]) / requests if requests else 0.0
+        )
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    # Cached value of key, calculate() is called on a miss. Values must be
+    # JSON-serializable if cache_dir is given.
+    def get(self, key, calculate):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_expired(entry[0], time.time()):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[1]
+
+        entry = self._read_entry(key)
+        if entry is not None:
+            stat = "disk_hits"
+        else:
+            stat = "misses"
+            entry = (time.time(), calculate())
+            self._write_entry(key, entry)
+
+        with self._lock:
+            self._stats[stat] += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return entry[1]
+
+    def _is_expired(self, created, now):
+        return self._ttl_seconds is not None and now - created > self._ttl_seconds
+
+    def _get_path(self, key):
+        import hashlib
+
+        name = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self._cache_dir, f"{name}.json")
+
+    def _read_entry(self, key):
+        if self._cache_dir is None:
+            return None
+        try:
+            with open(self._get_path(key), "r") as entry_file:
+                contents = json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+        if self._is_expired(contents["created"], time.time()):
+            return None
+        return contents["created"], contents["value"]
+
+    def _write_entry(self, key, entry):
+        if self._cache_dir is None:
+            return
+        path = self._get_path(key)
+        # Write to a temporary file first, so that readers never see a partial entry
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, "w") as entry_file:
+                json.dump({"created": entry[0], "value": entry[1]}, entry_file)
+            os.replace(temporary_path, path)
+        except OSError:
+            # The disk cache is best effort, e.g. cache_dir may be read-only or full
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+
+
+# DistrictDatabase with cached seats for polls. On a hit the database is not changed,
+# on a miss it is reset to the saved state and fitted to the poll like by
+# simulate_poll_results(), so cached seats do not depend on earlier queries.
+class CachedDatabase:
+    def __init__(self, database, cache=None):
+        self._database = database
+        self._cache = ResultCache() if cache is None else cache
+
+    def get_database(self):
+        return self._database
+
+    def get_cache(self):
+        return self._cache
+
+    # Seats of parties {party: seats} for poll results
+    def get_number_of_mandates(
+        self, poll_results_percent, epsilon_percent, method="dhont", solver="iterative"
+    ):
+        key = make_key(
+            "mandates",
+            self._database.get_fingerprint(),
+            method,
+            poll_results_percent,
+            epsilon_percent,
+            solver,
+        )
+
+        def calculate():
+            self._database.reset_all_districts_state()
+            self._database.simulate_poll_results(
+                poll_results_percent, epsilon_percent, solver, method
+            )
+            return self._database.get_number_of_mandates()
+
+        return dict(self._cache.get(key, calculate))
+
+    def get_number_of_mandates_flis(self, poll_results_percent):
+        key = make_key(
+            "flis",
+            self._database.get_fingerprint(),
+            "flis",
+            poll_results_percent,
+            FLIS_EPSILON_PERCENT,
+        )
+        return dict(
+            self._cache.get(
+                key,
+                lambda: self._database.get_number_of_mandates_flis(poll_results_percent),
+            )
+        )
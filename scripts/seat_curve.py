@@ -0,0 +1,286 @@
+#
+# Seats of one party as a function of its national share.
+#
+# calculate_fitted_seat_curve() follows the fitted family: polls in which the party has
+# the share and other parties keep their national proportions, every poll fitted from
+# the saved state like by simulate_poll_results(). Seats are known only at fitted shares,
+# so shares at which they change are found by bisection between points of a scan.
+#
+# calculate_seat_curve() is a fast approximation in closed form. Votes of the party are
+# multiplied by x in every district and votes of other parties are rescaled, so that sums
+# of votes in districts do not change. This is only the first step of the poll fitting
+# (see poll_solver.py): shares of other parties are rescaled proportionally in every
+# district, not nationally, so seats may differ from the fitted poll by a few seats.
+#
+# In the approximation D'Hondt does not depend on the scale of votes in a district,
+# so the party wins its k-th seat in a district exactly when its quotient votes * x / k
+# exceeds the (n - k + 1)-th highest quotient of other parties, which does not depend
+# on x. Breakpoints are found in closed form, only the mapping between x and the national
+# share, which is monotone, is found by bisection. Parties crossing thresholds split the curve into segments
+# with different sets of parties taking part in the allocation.
+#
+import numpy as np
+
+from apportionment import get_threshold
+from constants import *
+
+BISECTION_STEPS = 64
+MIN_LOG_SCALE = -60.0
+MAX_LOG_SCALE = 60.0
+
+# Scan of the fitted family between grid points and precision of its breakpoints
+SCAN_STEP_PERCENT = 0.1
+BREAKPOINT_TOLERANCE_PERCENT = 1e-4
+
+
+# National shares (scales x parties) of all parties for votes of party scaled by scales
+def _family_shares(votes, party_index, scales):
+    party_votes = votes[:, party_index]
+    other_votes = votes.copy()
+    other_votes[:, party_index] = 0
+    row_sums = votes.sum(axis=1)
+
+    denominators = other_votes.sum(axis=1) + party_votes * scales[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        district_scales = np.where(denominators > 0, row_sums / denominators, 0)
+    shares = district_scales @ other_votes
+    shares[:, party_index] = (district_scales * party_votes * scales[:, None]).sum(axis=1)
+    return shares / row_sums.sum()
+
+
+# Scales at which share of party column is equal to target shares (fractions),
+# share of an increasing party or decreasing other party is monotone in the scale
+def _solve_scales(votes, party_index, column, target_shares, increasing):
+    low = np.full(len(target_shares), MIN_LOG_SCALE)
+    high = np.full(len(target_shares), MAX_LOG_SCALE)
+    for _ in range(BISECTION_STEPS):
+        middle = (low + high) / 2
+        shares = _family_shares(votes, party_index, np.exp(middle))[:, column]
+        below = (shares < target_shares) == increasing
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    return np.exp((low + high) / 2)
+
+
+# Scales at which other parties cross their thresholds
+def _threshold_scales(votes, party_index, parties):
+    scale_range = np.exp([MIN_LOG_SCALE, MAX_LOG_SCALE])
+    range_shares = _family_shares(votes, party_index, scale_range)
+    scales = []
+    for column, party in enumerate(parties):
+        threshold = get_threshold(party)
+        if not np.isfinite(threshold):
+            continue
+        low_share, high_share = range_shares[:, column]
+        if min(low_share, high_share) < threshold < max(low_share, high_share):
+            scales.append(
+                _solve_scales(
+                    votes,
+                    party_index,
+                    column,
+                    np.array([threshold]),
+                    column == party_index,
+                )[0]
+            )
+    return np.unique(scales)
+
+
+# Scales at which the party wins its k-th seat (districts x max seats, inf if never),
+# eligible is a boolean vector of parties taking part in the allocation
+def _seat_breakpoints(votes, n_seats, party_index, eligible):
+    n_districts, n_parties = votes.shape
+    max_seats = int(n_seats.max())
+    breakpoints = np.full((n_districts, max_seats), np.inf)
+    if not eligible[party_index]:
+        return breakpoints
+
+    other_eligible = eligible.copy()
+    other_eligible[party_index] = False
+    divisors = np.arange(1, max_seats + 1)
+    quotients = votes[:, other_eligible, None] / divisors
+    quotients = -np.sort(-quotients.reshape(n_districts, -1), axis=1)
+    if quotients.shape[1] < max_seats:
+        quotients = np.pad(quotients, ((0, 0), (0, max_seats - quotients.shape[1])))
+
+    party_votes = votes[:, party_index]
+    for d in range(n_districts):
+        n = n_seats[d]
+        if party_votes[d] <= 0:
+            continue
+        # k-th seat is won against the (n - k + 1)-th highest quotient of other parties
+        competing = quotients[d, :n][::-1]
+        breakpoints[d, :n] = divisors[:n] * competing / party_votes[d]
+    return breakpoints
+
+
+# Seats of party for national shares in grid (percent) in the approximation in closed
+# form, see DistrictDatabase.seat_curve()
+def calculate_seat_curve(votes, n_seats, parties, party, grid):
+    votes = np.asarray(votes, dtype=np.float64)
+    n_seats = np.asarray(n_seats)
+    grid = np.asarray(grid, dtype=np.float64)
+    party_index = parties.index(party)
+    if votes[:, party_index].sum() <= 0:
+        raise ValueError(f"Party {party} has no votes")
+
+    max_share_percent = votes[votes[:, party_index] > 0].sum() / votes.sum() * 100
+    if (grid < 0).any() or (grid >= max_share_percent).any():
+        raise ValueError(
+            f"Shares of {party} must be in [0, {max_share_percent:.2f}) percent"
+        )
+
+    def to_percent(scales):
+        scales = np.asarray(scales, dtype=np.float64)
+        return _family_shares(votes, party_index, scales)[:, party_index] * 100
+
+    # Segments between threshold crossings with constant sets of eligible parties
+    boundaries = _threshold_scales(votes, party_index, parties)
+    edges = np.exp(np.concatenate([[MIN_LOG_SCALE], np.log(boundaries), [MAX_LOG_SCALE]]))
+    segment_shares = _family_shares(votes, party_index, np.sqrt(edges[:-1] * edges[1:]))
+    thresholds = np.array([get_threshold(party_) for party_ in parties])
+    segment_breakpoints = [
+        _seat_breakpoints(votes, n_seats, party_index, eligible)
+        for eligible in segment_shares > thresholds
+    ]
+
+    grid_scales = np.zeros(len(grid))
+    positive = grid > 0
+    grid_scales[positive] = _solve_scales(
+        votes, party_index, party_index, grid[positive] / 100, True
+    )
+    grid_segments = np.searchsorted(boundaries, grid_scales, side="right")
+
+    district_seats = np.zeros((len(grid), len(votes)), dtype=np.int64)
+    breakpoint_scales = [boundaries]
+    for segment, breakpoints in enumerate(segment_breakpoints):
+        in_segment = grid_segments == segment
+        district_seats[in_segment] = (
+            breakpoints[None, :, :] < grid_scales[in_segment, None, None]
+        ).sum(axis=2)
+        inside = (breakpoints > edges[segment]) & (breakpoints < edges[segment + 1])
+        breakpoint_scales.append(breakpoints[inside])
+    # Share equal to the threshold is not enough, which bisection cannot tell apart
+    district_seats[grid <= get_threshold(party) * 100] = 0
+
+    # Seats change at seat breakpoints and at threshold crossings
+    change_scales = np.unique(np.concatenate(breakpoint_scales))
+    change_segments = np.searchsorted(boundaries, change_scales, side="right")
+    seats_after_changes = np.zeros(len(change_scales), dtype=np.int64)
+    for segment, breakpoints in enumerate(segment_breakpoints):
+        in_segment = change_segments == segment
+        seats_after_changes[in_segment] = (
+            breakpoints.ravel()[None, :] <= change_scales[in_segment, None]
+        ).sum(axis=1)
+
+    return {
+        "party": party,
+        "shares_percent": grid,
+        "seats": district_seats.sum(axis=1),
+        "district_seats": district_seats,
+        "breakpoints_percent": to_percent(change_scales),
+        "seats_after_breakpoints": seats_after_changes,
+        "threshold_breakpoints_percent": to_percent(boundaries),
+    }
+
+
+# Polls (shares x parties, percent) in which party has shares and other parties keep
+# their proportions of results_percent
+def _family_polls(results_percent, party_index, shares):
+    others = np.delete(np.arange(len(results_percent)), party_index)
+    polls = np.zeros((len(shares), len(results_percent)))
+    polls[:, others] = (
+        results_percent[others] / results_percent[others].sum() * (100 - shares[:, None])
+    )
+    polls[:, party_index] = shares
+    return polls
+
+
+# Shares of party at which any party crosses its threshold in the fitted family
+def _fitted_threshold_shares(results_percent, parties, party_index):
+    others_percent = results_percent.sum() - results_percent[party_index]
+    shares = []
+    for column, party in enumerate(parties):
+        threshold_percent = get_threshold(party) * 100
+        if not np.isfinite(threshold_percent):
+            continue
+        if column == party_index:
+            shares.append(threshold_percent)
+        elif results_percent[column] > 0:
+            # Share of the other party is results_percent * (100 - share) / others_percent
+            shares.append(
+                100 - threshold_percent * others_percent / results_percent[column]
+            )
+    shares = np.array(shares)
+    return np.unique(shares[(shares > 0) & (shares < 100)])
+
+
+# Seats of party for national shares in grid (percent) in the fitted family.
+# fit_polls(polls) returns (polls x districts x parties) seats and converged flags of
+# polls fitted from the saved state, see DistrictDatabase.fit_polls_batched().
+# Breakpoints are searched between the lowest and the highest share of the grid and
+# located to BREAKPOINT_TOLERANCE_PERCENT, changes which cancel out between points of the
+# scan (grid and steps of SCAN_STEP_PERCENT) are not found. Breakpoints at thresholds
+# are as precise as the fit, since thresholds apply to fitted votes.
+def calculate_fitted_seat_curve(fit_polls, results_percent, parties, party, grid):
+    results_percent = np.asarray(results_percent, dtype=np.float64)
+    grid = np.asarray(grid, dtype=np.float64)
+    party_index = parties.index(party)
+    if results_percent.sum() - results_percent[party_index] <= 0:
+        raise ValueError(f"Other parties than {party} have no votes")
+    if (grid < 0).any() or (grid >= 100).any():
+        raise ValueError(f"Shares of {party} must be in [0, 100) percent")
+
+    def fit(shares):
+        mandates, converged = fit_polls(_family_polls(results_percent, party_index, shares))
+        if not converged.all():
+            raise ValueError(
+                f"Polls with {party} at {shares[~converged].tolist()}% could not be fitted"
+            )
+        return mandates[:, :, party_index]
+
+    district_seats = fit(grid).astype(np.int64)
+
+    scan = np.unique(
+        np.concatenate(
+            [grid, np.arange(grid.min(), grid.max(), SCAN_STEP_PERCENT)]
+        )
+    )
+    scan_seats = fit(scan).sum(axis=1)
+    changes = np.flatnonzero(np.diff(scan_seats) != 0)
+    low, high = scan[changes], scan[changes + 1]
+    low_seats, high_seats = scan_seats[changes], scan_seats[changes + 1]
+    breakpoints = [np.zeros(0)]
+    seats_after_breakpoints = [np.zeros(0, dtype=np.int64)]
+    # Bisection finds the first change in every interval, intervals with more changes
+    # are searched again from it
+    while len(low):
+        end, end_seats = high, high_seats
+        while (high - low).max() > BREAKPOINT_TOLERANCE_PERCENT:
+            middle = (low + high) / 2
+            middle_seats = fit(middle).sum(axis=1)
+            before = middle_seats == low_seats
+            low = np.where(before, middle, low)
+            high = np.where(before, high, middle)
+            high_seats = np.where(before, high_seats, middle_seats)
+        breakpoints.append(high)
+        seats_after_breakpoints.append(high_seats)
+        remaining = high_seats != end_seats
+        low, low_seats = high[remaining], high_seats[remaining]
+        high, high_seats = end[remaining], end_seats[remaining]
+
+    breakpoints = np.concatenate(breakpoints)
+    order = np.argsort(breakpoints)
+
+    return {
+        "party": party,
+        "shares_percent": grid,
+        "seats": district_seats.sum(axis=1),
+        "district_seats": district_seats,
+        "breakpoints_percent": breakpoints[order],
+        "seats_after_breakpoints": np.concatenate(seats_after_breakpoints)[order].astype(
+            np.int64
+        ),
+        "threshold_breakpoints_percent": _fitted_threshold_shares(
+            results_percent, parties, party_index
+        ),
+    }
@@ -0,0 +1,296 @@
+#
+# Local HTTP/JSON service calculating seats for polls.
+#
+# The baseline is loaded once in the main process, worker processes are forked from it
+# at startup, so every worker has its own copy of the database and requests do not pay
+# for loading. At most --max-concurrent requests are calculated at the same time, further
+# requests get 503. Results of single polls are cached (see result_cache.py).
+#
+# Endpoints (POST bodies and responses are JSON):
+#   POST /seats      {"poll": {party: percent}, "method": "dhont"} -> {"seats": {...}}
+#   POST /districts  as /seats, with seats in districts ("districts")
+#   POST /flis       {"poll": {...}} -> Flis estimate of seats
+#   GET  /health     status and number of workers
+#   GET  /metrics    numbers of requests, errors, latencies and cache statistics
+# Instead of "poll", a body can contain "polls": a list of polls, which are fitted
+# together in one worker (see DistrictDatabase.fit_polls_batched()) and answered
+# as {"results": [...]}. Missing parties have 0%, "Inne" is the rest up to 100%.
+#
+# Usage: python scripts/server.py [--host 127.0.0.1] [--port 8000] [--workers N]
+#                                 [--max-concurrent N] [--data-dir ./data] [--cache path]
+#
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import batch
+from result_cache import ResultCache, make_key
+
+MAX_BODY_BYTES = 1 << 20
+MAX_POLLS = 10000
+REQUEST_TIMEOUT_SECONDS = 60
+CACHE_SIZE = 1024
+
+# Calculations of POST endpoints: (method of allocation or None for the requested one,
+# seats in districts)
+ENDPOINTS = {
+    "/seats": (None, False),
+    "/districts": (None, True),
+    "/flis": ("flis", False),
+}
+
+
+# Error answered with an HTTP status
+class RequestError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        super().__init__(message)
+
+
+def _init_worker(data_dir, cache_path):
+    # Workers forked from the server already have the database
+    if batch.get_worker_database() is None:
+        batch.set_worker_database(batch.load_database(data_dir, cache_path))
+
+
+class ScoringServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        data_dir="./data",
+        cache_path=None,
+        n_workers=None,
+        max_concurrent=None,
+        cache_size=CACHE_SIZE,
+        verbose=False,
+    ):
+        # multiprocessing is imported only when a server is started
+        from multiprocessing import Pool
+
+        self._n_workers = n_workers or os.cpu_count()
+        self._max_concurrent = max_concurrent or 2 * self._n_workers
+        self._database = batch.load_database(data_dir, cache_path)
+        batch.set_worker_database(self._database)
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(self._max_concurrent)
+        self._cache = ResultCache(max_size=cache_size)
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._metrics = {
+            "requests": 0,
+            "errors": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "polls": 0,
+            "endpoints": {},
+        }
+        # Bind before workers are started, so that they are not started at all
+        # if e.g. the port is in use
+        super().__init__(address, ScoringRequestHandler)
+        try:
+            self._pool = Pool(
+                self._n_workers,
+                initializer=_init_worker,
+                initargs=(data_dir, cache_path),
+            )
+        except BaseException:
+            super().server_close()
+            raise
+
+    def server_close(self):
+        super().server_close()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+
+    def get_health(self):
+        return {
+            "status": "ok",
+            "workers": self._n_workers,
+            "max_concurrent": self._max_concurrent,
+            "uptime_seconds": time.time() - self._started,
+        }
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = json.loads(json.dumps(self._metrics))
+        metrics["cache"] = self._cache.get_stats()
+        return metrics
+
+    def record_request(self, path, seconds, error):
+        with self._lock:
+            endpoint = self._metrics["endpoints"].setdefault(
+                path, {"requests": 0, "errors": 0, "total_seconds": 0.0}
+            )
+            endpoint["requests"] += 1
+            endpoint["total_seconds"] += seconds
+            self._metrics["requests"] += 1
+            if error:
+                endpoint["errors"] += 1
+                self._metrics["errors"] += 1
+
+    # Answer of a POST endpoint, raises RequestError
+    def calculate(self, path, body):
+        method, with_districts = ENDPOINTS[path]
+        if method is None:
+            method = body.get("method", "dhont")
+        if method not in batch.METHODS:
+            raise RequestError(400, f"Unknown method: {method}")
+
+        if "polls" in body:
+            polls = body["polls"]
+            if not isinstance(polls, list) or len(polls) > MAX_POLLS:
+                raise RequestError(400, f"polls must be a list of at most {MAX_POLLS}")
+        elif "poll" in body:
+            polls = [body["poll"]]
+        else:
+            raise RequestError(400, "Missing poll")
+
+        records = []
+        for poll in polls:
+            if not isinstance(poll, dict):
+                raise RequestError(400, "Poll must be an object")
+            try:
+                record = batch.parse_poll(poll)
+            except (TypeError, ValueError) as error:
+                raise RequestError(400, str(error)) from None
+            record["id"] = poll.get("id")
+            records.append(record)
+
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._metrics["rejected"] += 1
+            raise RequestError(503, "Too many concurrent requests")
+        try:
+            with self._lock:
+                self._metrics["in_flight"] += 1
+                self._metrics["polls"] += len(records)
+            if "poll" in body and "polls" not in body:
+                return self._calculate_cached(records[0], method, with_districts)
+            return {"results": self._calculate(records, method, with_districts)}
+        finally:
+            with self._lock:
+                self._metrics["in_flight"] -= 1
+            self._slots.release()
+
+    def _calculate(self, records, method, with_districts):
+        result = self._pool.apply_async(
+            batch.calculate_in_worker, (records, method, with_districts)
+        )
+        try:
+            return result.get(REQUEST_TIMEOUT_SECONDS)
+        except Exception as error:
+            raise RequestError(500, f"Calculation failed: {error!r}") from None
+
+    def _calculate_cached(self, record, method, with_districts):
+        key = make_key(
+            "districts" if with_districts else "seats",
+            self._database.get_fingerprint(),
+            method,
+            record,
+            batch.EPSILON_PERCENT,
+        )
+        result = self._cache.get(
+            key, lambda: self._calculate([record], method, with_districts)[0]
+        )
+        return dict(result, id=record["id"])
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/health":
+            self._answer(200, self.server.get_health())
+        elif self.path == "/metrics":
+            self._answer(200, self.server.get_metrics())
+        elif self.path in ENDPOINTS:
+            self._answer(405, {"error": "Use POST"})
+        else:
+            self._answer(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self):
+        if self.path not in ENDPOINTS:
+            self._answer(404, {"error": f"Unknown path: {self.path}"})
+            return
+
+        start = time.perf_counter()
+        status = 200
+        try:
+            answer = self.server.calculate(self.path, self._read_body())
+        except RequestError as error:
+            status = error.status
+            answer = {"error": str(error)}
+        self.server.record_request(self.path, time.perf_counter() - start, status != 200)
+        self._answer(status, answer)
+
+    def _read_body(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            raise RequestError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise RequestError(413, "Request body is too large")
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise RequestError(400, "Request body is not valid JSON") from None
+        if not isinstance(body, dict):
+            raise RequestError(400, "Request body must be an object")
+        return body
+
+    def _answer(self, status, answer):
+        encoded_answer = json.dumps(answer, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded_answer)))
+        self.end_headers()
+        self.wfile.write(encoded_answer)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve seats for polls over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=0, help="0 for the number of processors"
+    )
+    parser.add_argument(
+        "--max-concurrent", type=int, help="default: twice the number of workers"
+    )
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE)
+    parser.add_argument("--data-dir", default="./data")
+    parser.add_argument("--cache", help="path of the dataset cache")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(args)
+
+    server = ScoringServer(
+        (args.host, args.port),
+        args.data_dir,
+        args.cache,
+        args.workers,
+        args.max_concurrent,
+        args.cache_size,
+        args.verbose,
+    )
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
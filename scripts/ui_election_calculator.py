@@ -55,6 +55,9 @@ class Ui_MainWindow(object):
         self.pushButton = QPushButton(self.centralwidget)
         self.pushButton.setObjectName("pushButton")
         self.pushButton.setGeometry(QRect(130, 300, 89, 25))
+        self.checkBox_live = QCheckBox(self.centralwidget)
+        self.checkBox_live.setObjectName("checkBox_live")
+        self.checkBox_live.setGeometry(QRect(225, 300, 100, 25))
         self.graphicsView = QGraphicsView(self.centralwidget)
         self.graphicsView.setObjectName("graphicsView")
         self.graphicsView.setGeometry(QRect(420, 50, 731, 221))
@@ -389,6 +392,9 @@ class Ui_MainWindow(object):
         self.pushButton.setText(
             QCoreApplication.translate("MainWindow", "Oblicz", None)
         )
+        self.checkBox_live.setText(
+            QCoreApplication.translate("MainWindow", "Na \u017cywo", None)
+        )
         self.label_13.setText(
             QCoreApplication.translate(
                 "MainWindow",
@@ -0,0 +1,123 @@
+from collections.abc import MutableMapping
+
+import numpy as np
+
+
+# Dict-like view over one row of a vote matrix. District keeps using
+# self._results[party] as before, but the votes live in the shared matrix.
+# Row can be any indexable buffer, e.g. an array.array of a CompactDistrict.
+class VotesRow(MutableMapping):
+    __slots__ = ("_row", "_party_index", "_value_type")
+
+    def __init__(self, row, party_index, value_type=float):
+        self._row = row
+        self._party_index = party_index
+        self._value_type = value_type
+
+    def get_row(self):
+        return self._row
+
+    def __getitem__(self, party):
+        return self._value_type(self._row[self._party_index[party]])
+
+    def __setitem__(self, party, votes):
+        self._row[self._party_index[party]] = votes
+
+    def __delitem__(self, party):
+        raise TypeError(f"Cannot remove party {party} from a vote matrix row")
+
+    def __iter__(self):
+        return iter(self._party_index)
+
+    def __len__(self):
+        return len(self._party_index)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+# Votes of all districts stored as one dense (districts x parties) matrix,
+# so that national operations run as single numpy broadcasts
+class VoteMatrix:
+    def __init__(self, district_ids, parties, votes, n_seats, sums_of_votes):
+        self._district_ids = list(district_ids)
+        self._parties = list(parties)
+        self._district_index = {id: i for i, id in enumerate(self._district_ids)}
+        self._party_index = {party: i for i, party in enumerate(self._parties)}
+        self._votes = np.asarray(votes, dtype=np.float64)
+        self._n_seats = np.asarray(n_seats, dtype=np.int64)
+        self._sums_of_votes = np.asarray(sums_of_votes, dtype=np.float64)
+        self._mandates = np.zeros(self._votes.shape, dtype=np.int64)
+
+    @classmethod
+    def from_districts(cls, districts, parties):
+        districts = list(districts)
+        votes = [
+            [district.get_results().get(party, 0) for party in parties]
+            for district in districts
+        ]
+        return cls(
+            district_ids=[district.get_id() for district in districts],
+            parties=parties,
+            votes=votes,
+            n_seats=[district.get_n_seats() for district in districts],
+            sums_of_votes=[district.get_sum_of_votes() for district in districts],
+        )
+
+    def get_district_ids(self):
+        return self._district_ids
+
+    def get_parties(self):
+        return self._parties
+
+    def get_party_index(self):
+        return self._party_index
+
+    def get_votes(self):
+        return self._votes
+
+    def get_n_seats(self):
+        return self._n_seats
+
+    def get_sums_of_votes(self):
+        return self._sums_of_votes
+
+    def get_mandates(self):
+        return self._mandates
+
+    def set_mandates(self, mandates):
+        np.copyto(self._mandates, mandates)
+
+    def get_row_view(self, district_id):
+        return VotesRow(
+            self._votes[self._district_index[district_id]], self._party_index
+        )
+
+    def get_sum_of_votes(self):
+        return float(self._sums_of_votes.sum())
+
+    def get_overall_results(self):
+        totals = self._votes.sum(axis=0)
+        return {party: float(totals[i]) for party, i in self._party_index.items()}
+
+    def get_results_percent(self):
+        totals = self._votes.sum(axis=0) / self.get_sum_of_votes() * 100
+        return {party: float(totals[i]) for party, i in self._party_index.items()}
+
+    # Scale votes by given scale, scale is a dict {party: scale}
+    def scale_votes(self, scale_dict):
+        scale = np.ones(len(self._parties))
+        for party, party_scale in scale_dict.items():
+            if party in self._party_index:
+                scale[self._party_index[party]] = party_scale
+        self._votes *= scale
+
+    # Scale every district whose votes do not sum up to its sum of votes
+    def rescale_votes_to_100_percent(self):
+        row_sums = self._votes.sum(axis=1)
+        mask = (
+            (self._sums_of_votes > 0)
+            & (row_sums > 0)
+            & (row_sums != self._sums_of_votes)
+        )
+        self._votes[mask] *= (self._sums_of_votes[mask] / row_sums[mask])[:, None]
@@ -0,0 +1,157 @@
+import numpy as np
+
+from ..scripts.apportionment import (
+    APPORTIONMENT_METHODS,
+    allocate_all_districts,
+    allocate_all_methods,
+    allocate_all_scenarios,
+    allocate_dhont,
+    allocate_dhont_all_districts,
+    calculate_seat_margins,
+    sainte_lague_divisors,
+    select_parties_over_threshold,
+    select_parties_over_threshold_array,
+)
+from ..scripts.constants import LIST_OF_PARTIES
+
+
+def test_dhont():
+    mandates = allocate_dhont({"A": 100, "B": 200, "C": 300}, ["A", "B", "C"], 5)
+    assert mandates == {"A": 0, "B": 2, "C": 3}
+
+
+def test_dhont_party_below_threshold():
+    mandates = allocate_dhont({"A": 100, "B": 200, "C": 300}, ["A", "B"], 3)
+    assert mandates == {"A": 1, "B": 2, "C": 0}
+
+
+def test_dhont_tie_higher_votes_wins():
+    # Quotients 200 / 2 and 100 / 1 are equal, B has more votes
+    mandates = allocate_dhont({"A": 100, "B": 200}, ["A", "B"], 2)
+    assert mandates == {"A": 0, "B": 2}
+    # Equal votes, first party on the list wins
+    mandates = allocate_dhont({"A": 100, "B": 100}, ["B", "A"], 1)
+    assert mandates == {"A": 0, "B": 1}
+
+
+def test_dhont_all_districts():
+    rng = np.random.default_rng(0)
+    votes = rng.integers(0, 1000, size=(20, 5)).astype(float)
+    votes[0] = [100, 200, 300, 300, 0]
+    votes[1] = [100, 200, 0, 0, 0]
+    n_seats = rng.integers(1, 15, size=20)
+    n_seats[:2] = [5, 2]
+    eligible = [True, True, True, False, True]
+    parties = ["A", "B", "C", "D", "E"]
+
+    mandates = allocate_dhont_all_districts(votes, n_seats, eligible)
+
+    for district_votes, seats, district_mandates in zip(votes, n_seats, mandates):
+        expected = allocate_dhont(
+            dict(zip(parties, district_votes)), ["A", "B", "C", "E"], seats
+        )
+        assert district_mandates.tolist() == list(expected.values())
+
+
+def test_seat_margins():
+    votes = np.array([[720, 310, 150, 40], [500, 480, 0, 10]], dtype=np.float64)
+    eligible = [True, True, True, False]
+    margins = calculate_seat_margins(votes, [6, 3], eligible)
+
+    assert margins["mandates"].tolist() == [[4, 2, 0, 0], [2, 1, 0, 0]]
+    assert margins["quotients"].shape == (2, 4, 6)
+    assert margins["last_awarded"].tolist() == [155, 250]
+    assert margins["last_awarded_party"].tolist() == [1, 0]
+    assert margins["next_in_line"].tolist() == [150, 240]
+    # 150 + 5 votes beat the last quotient 310 / 2 of the second party
+    assert margins["votes_to_next_seat"][0].tolist() == [55, 230, 5, np.inf]
+
+    # (150 + t) / 1 > (310 - t) / 2 for t > 10 / 3
+    assert abs(margins["flip_margin"][0] - 10 / 3) < 1e-9
+    assert (margins["flip_gainer"][0], margins["flip_loser"][0]) == (2, 1)
+    assert margins["flip_margin"][1] == 10
+
+    moved = votes.copy()
+    moved[0, 1] -= 4
+    moved[0, 2] += 4
+    assert (
+        allocate_dhont_all_districts(moved, [6, 3], eligible)[0]
+        != margins["mandates"][0]
+    ).any()
+
+
+def test_methods():
+    votes = [[53000, 24000, 23000]]
+    expected = {
+        "dhont": [4, 2, 1],
+        "sainte_lague": [3, 2, 2],
+        "modified_sainte_lague": [3, 2, 2],
+        "imperiali": [5, 1, 1],
+        "hare": [4, 2, 1],
+        "droop": [4, 2, 1],
+    }
+    mandates = allocate_all_methods(votes, [7], [True, True, True])
+    assert list(mandates) == list(APPORTIONMENT_METHODS)
+    for method, method_mandates in mandates.items():
+        assert method_mandates.tolist() == [expected[method]], method
+
+    try:
+        allocate_all_districts(votes, [7], [True, True, True], "unknown")
+        assert False
+    except ValueError:
+        pass
+
+
+def test_methods_all_districts():
+    rng = np.random.default_rng(1)
+    votes = rng.integers(1, 1000, size=(30, 5)).astype(float)
+    n_seats = rng.integers(1, 20, size=30)
+    eligible = np.array([True, True, False, True, True])
+
+    mandates = allocate_all_methods(votes, n_seats, eligible)
+    for method, method_mandates in mandates.items():
+        assert (method_mandates.sum(axis=1) == n_seats).all(), method
+        assert (method_mandates[:, ~eligible] == 0).all(), method
+
+    # Highest quotients with odd divisors
+    for district_votes, seats, district_mandates in zip(
+        votes, n_seats, mandates["sainte_lague"]
+    ):
+        quotients = [
+            (votes_ / divisor, party)
+            for party, votes_ in enumerate(district_votes)
+            if eligible[party]
+            for divisor in sainte_lague_divisors(seats)
+        ]
+        winners = [party for _, party in sorted(quotients, reverse=True)[:seats]]
+        assert district_mandates.tolist() == np.bincount(winners, minlength=5).tolist()
+
+    # Hare quota gives every party at least floor of its exact share
+    shares = np.where(eligible, votes, 0)
+    exact = shares / shares.sum(axis=1, keepdims=True) * n_seats[:, None]
+    assert (mandates["hare"] >= np.floor(exact)).all()
+    assert (mandates["hare"] <= np.ceil(exact)).all()
+
+
+def test_allocate_all_scenarios():
+    rng = np.random.default_rng(2)
+    votes = rng.integers(0, 1000, size=(4, 10, 7)).astype(float)
+    n_seats = rng.integers(1, 15, size=10)
+    sums_of_votes = votes.sum(axis=(1, 2))
+    eligible = select_parties_over_threshold_array(votes.sum(axis=1), sums_of_votes)
+
+    mandates = allocate_all_scenarios(votes, n_seats, eligible)
+    for scenario_votes, scenario_eligible, scenario_mandates in zip(
+        votes, eligible, mandates
+    ):
+        parties = select_parties_over_threshold(
+            dict(zip(LIST_OF_PARTIES, scenario_votes.sum(axis=0))),
+            scenario_votes.sum(),
+        )
+        assert scenario_eligible.tolist() == [
+            party in parties for party in LIST_OF_PARTIES
+        ]
+        assert (
+            scenario_mandates
+            == allocate_dhont_all_districts(scenario_votes, n_seats, scenario_eligible)
+        ).all()
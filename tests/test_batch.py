@@ -0,0 +1,84 @@
+import io
+import json
+
+from ..scripts.batch import calculate_records, main, read_records
+
+CSV_INPUT = """id,PiS,KO,Lewica,TD,Konfederacja,MN
+a,35,30,10,10,10,0.17
+b,40,30,-5,10,10,0.17
+c,35,30,10,10,10,
+"""
+
+
+def test_calculate_records():
+    records = read_records(io.StringIO(CSV_INPUT), "csv")
+    results = list(calculate_records(records, with_districts=True, chunk_size=2))
+
+    assert [result["id"] for result in results] == ["a", "b", "c"]
+    assert sum(results[0]["seats"].values()) == 460
+    assert len(results[0]["districts"]) == 41
+    assert "error" in results[1]
+    # Missing results are zero and "Inne" is the rest up to 100%
+    assert results[2]["seats"]["MN"] == 0
+
+
+def test_flis_jsonl(tmp_path):
+    input_path = tmp_path / "polls.jsonl"
+    output_path = tmp_path / "seats.jsonl"
+    poll = {"PiS": 35, "KO": 30, "Lewica": 10, "TD": 10, "Konfederacja": 10}
+    input_path.write_text(json.dumps(poll) + "\n\n" + json.dumps(poll) + "\n")
+
+    main([str(input_path), "--method", "flis", "--output", str(output_path)])
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert len(results) == 2
+    assert results[0]["seats"]["Inne"] == 0 and results[0]["seats"]["PiS"] > 0
+
+
+def test_stats_and_profile(tmp_path):
+    records = read_records(io.StringIO(CSV_INPUT), "csv")
+    profile_dir = tmp_path / "profiles"
+    profile_dir.mkdir()
+    results = list(
+        calculate_records(records, with_stats=True, profile_dir=str(profile_dir))
+    )
+
+    assert results[0]["stats"]["counters"]["dhont_passes"] == 1
+    assert "fit" in results[0]["stats"]["timers"]
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        "a.txt",
+        "b.txt",
+        "c.txt",
+    ]
+
+
+def test_stats_do_not_change_seats():
+    records = list(read_records(io.StringIO(CSV_INPUT), "csv"))
+    results = list(calculate_records(records))
+    instrumented = list(calculate_records(records, with_stats=True))
+
+    for result, instrumented_result in zip(results, instrumented):
+        stats = instrumented_result.pop("stats")
+        assert instrumented_result == result
+    # Stats of the chunk, in which valid scenarios are fitted together
+    assert stats["counters"]["fits"] == 2
+    assert stats["counters"]["dhont_passes"] == 1
+
+
+def test_malformed_records(tmp_path):
+    input_path = tmp_path / "polls.jsonl"
+    output_path = tmp_path / "seats.jsonl"
+    lines = [
+        json.dumps({"PiS": 35, "KO": 30, "Lewica": 10, "TD": 10, "id": "a"}),
+        "{bad json",
+        "[1, 2]",
+        json.dumps({"PiS": [1], "id": "x"}),
+        json.dumps({"PiS": "abc", "id": "y"}),
+    ]
+    input_path.write_text("\n".join(lines) + "\n")
+
+    for method in ["dhont", "flis"]:
+        main([str(input_path), "--method", method, "--output", str(output_path)])
+        results = [json.loads(line) for line in output_path.read_text().splitlines()]
+        assert [result["id"] for result in results] == ["a", None, None, "x", "y"]
+        assert "seats" in results[0]
+        assert all(set(result) == {"id", "error"} for result in results[1:])
@@ -0,0 +1,71 @@
+import json
+
+from ..scripts.batch import load_database
+from ..scripts.benchmark import (
+    EASY_POLL,
+    EPSILON_PERCENT,
+    HARD_POLL,
+    compare_results,
+    main,
+    run_benchmarks,
+)
+
+
+def test_poll_difficulty():
+    database = load_database("./data")
+    iterations = {}
+    for name, poll in [("easy", EASY_POLL), ("hard", HARD_POLL)]:
+        database.reset_all_districts_state()
+        with database.instrument() as stats:
+            database.simulate_poll_results(poll, EPSILON_PERCENT)
+        iterations[name] = stats.get_counter("fit_iterations")
+    assert iterations["easy"] < 10
+    assert iterations["hard"] >= 20
+
+
+def test_run_benchmarks():
+    results = run_benchmarks(repeat=2, names=["calculate_mandates", "mandates_flis"])
+    assert list(results["benchmarks"]) == ["calculate_mandates", "mandates_flis"]
+    stats = results["benchmarks"]["calculate_mandates"]
+    assert stats["repeat"] == 2
+    assert 0 < stats["min"] <= stats["median"]
+
+    try:
+        run_benchmarks(repeat=1, names=["unknown"])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_compare_results():
+    baseline = {"benchmarks": {"a": {"median": 1.0}, "b": {"median": 1.0}}}
+    results = {
+        "benchmarks": {"a": {"median": 1.1}, "b": {"median": 1.5}, "c": {"median": 9}}
+    }
+    regressions = compare_results(results, baseline, tolerance=0.2)
+    assert [regression["name"] for regression in regressions] == ["b"]
+    assert regressions[0]["ratio"] == 1.5
+
+
+def test_main_with_baseline(tmp_path):
+    baseline_path = tmp_path / "baseline.json"
+    output_path = tmp_path / "results.json"
+    assert main(["--repeat", "1", "--only", "load_csv", "--output", str(baseline_path)]) == 0
+
+    # Any slowdown is a regression with a negative tolerance
+    exit_code = main(
+        [
+            "--repeat",
+            "1",
+            "--only",
+            "load_csv",
+            "--output",
+            str(output_path),
+            "--baseline",
+            str(baseline_path),
+            "--tolerance",
+            "-1",
+        ]
+    )
+    assert exit_code == 1
+    assert json.loads(output_path.read_text())["regressions"][0]["name"] == "load_csv"
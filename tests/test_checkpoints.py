@@ -0,0 +1,24 @@
+import numpy as np
+
+from ..scripts.checkpoints import CheckpointStore
+
+
+def test_only_changed_rows_are_stored():
+    store = CheckpointStore(np.ones((4, 3)))
+    votes = np.ones((4, 3))
+    votes[2, 1] = 5
+    store.create("test", votes)
+    assert store.get_names() == ["test"]
+
+    votes[:] = 0
+    mandates = store.restore("test", votes)
+    assert mandates is None
+    assert votes[2, 1] == 5 and votes.sum() == 16
+
+
+def test_baseline_is_immutable():
+    baseline = np.ones((2, 2))
+    store = CheckpointStore(baseline)
+    baseline[0, 0] = 2
+    assert store.get_baseline()[0, 0] == 1
+    assert not store.get_baseline().flags.writeable
@@ -0,0 +1,69 @@
+import pytest
+
+# DatasetCacheError of the module imported by district_database
+from ..scripts.district_database import DistrictDatabase, dataset_cache
+
+paths = {
+    "districts_path": "./data/okregi_sejm.csv",
+    "parlamentary2019_election_path": "./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+    "presidential2020_election_path": "./data/districts_results_2020_AUTO.csv",
+    "list_leaders_path": "./data/jedynki.csv",
+    "population_path": "./data/ludnosc_2022.csv",
+    "area_path": "./data/powierzchnia.csv",
+}
+
+
+def assert_same_baseline(database, expected):
+    assert (database.get_votes_array() == expected.get_votes_array()).all()
+    assert database.get_number_of_mandates() == expected.get_number_of_mandates()
+    assert database.get_sum_of_votes() == expected.get_sum_of_votes()
+    for district in expected.get_districts():
+        cached_district = database.get_district(district.get_id())
+        assert cached_district.get_name() == district.get_name()
+        assert cached_district.get_population() == district.get_population()
+        assert cached_district.get_area() == district.get_area()
+        assert cached_district.get_attendance_percent() == (
+            district.get_attendance_percent()
+        )
+        assert cached_district.get_list_leader("PiS") == district.get_list_leader("PiS")
+
+
+def test_cache_round_trip(tmp_path):
+    cache_path = tmp_path / "dataset.cache"
+    expected = DistrictDatabase(**paths)
+
+    # Missing cache is built from csv files
+    built = DistrictDatabase.from_cache(cache_path, **paths)
+    assert cache_path.exists()
+    assert_same_baseline(built, expected)
+
+    assert_same_baseline(DistrictDatabase.from_cache(cache_path, **paths), expected)
+    assert_same_baseline(DistrictDatabase.from_cache(cache_path), expected)
+
+    database = DistrictDatabase.from_cache(cache_path, use_vote_matrix=True)
+    assert_same_baseline(database, expected)
+    database.scale_results_in_all_districts({"PiS": 0.5})
+    database.reset_all_districts_state()
+    assert_same_baseline(DistrictDatabase.from_cache(cache_path), expected)
+
+
+def test_invalid_cache(tmp_path):
+    cache_path = tmp_path / "dataset.cache"
+    with pytest.raises(dataset_cache.DatasetCacheError):
+        DistrictDatabase.from_cache(cache_path)
+
+    cache_path.write_bytes(b"not a cache")
+    with pytest.raises(dataset_cache.DatasetCacheError):
+        DistrictDatabase.from_cache(cache_path)
+
+    # Stale or corrupted cache is rebuilt when sources are given
+    DistrictDatabase.from_cache(cache_path, **paths)
+    assert len(DistrictDatabase.from_cache(cache_path).get_districts()) == 41
+
+
+def test_unwritable_cache(tmp_path):
+    # The database is built from csv files even if the cache cannot be written
+    cache_path = tmp_path / "missing" / "dataset.cache"
+    database = DistrictDatabase.from_cache(cache_path, **paths)
+    assert len(database.get_districts()) == 41
+    assert not cache_path.exists()
@@ -1,4 +1,6 @@
-from ..scripts.district import District
+import tracemalloc
+
+from ..scripts.district import CompactDistrict, District
 
 
 def test_contructor():
@@ -49,3 +51,71 @@ def test_dhont():
     assert mandates["A"] == 0
     assert mandates["B"] == 2
     assert mandates["C"] == 3
+
+
+def test_compact_district():
+    party_index = {"A": 0, "B": 1, "C": 2}
+    results = {"A": 100, "B": 200, "C": 300}
+    district = CompactDistrict("test", 1, 5, party_index, results, 600)
+    district.set_list_leader("A", "Jan Kowalski")
+    assert district.get_list_leader("A") == "Jan Kowalski"
+    assert district.get_results_percent()["C"] == 50
+    assert district.get_number_of_mandates() == {}
+
+    district.save_state()
+    district.calculate_number_of_mandates_dhont(["A", "B", "C"])
+    mandates = district.get_number_of_mandates()
+    assert mandates == {"A": 0, "B": 2, "C": 3}
+    # Earlier results are not changed by the next allocation
+    district.calculate_number_of_mandates_dhont(["C"])
+    assert mandates == {"A": 0, "B": 2, "C": 3}
+    district.add_votes("A", 500)
+    assert district.get_number_of_votes("A") == 600
+    district.reset()
+    assert dict(district.get_results()) == results
+    assert district.get_number_of_mandates() == {}
+
+    # Parties are fixed by the shared index
+    try:
+        district.add_party("D", 100)
+        assert False
+    except KeyError:
+        pass
+
+
+def _allocated_size(create_district, n_districts=100):
+    tracemalloc.start()
+    districts = [create_district() for _ in range(n_districts)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size, districts
+
+
+def test_compact_district_is_smaller():
+    parties = ["PiS", "KO", "Lewica", "TD", "Konfederacja", "MN", "Inne"]
+    party_index = {party: i for i, party in enumerate(parties)}
+
+    def prepare(district):
+        for i, party in enumerate(parties):
+            district.add_party(party, 1000.0 * (i + 1))
+            district.set_list_leader(party, "-")
+        district.save_state()
+        district.calculate_number_of_mandates_dhont(parties)
+        return district
+
+    size, districts = _allocated_size(lambda: prepare(District("test", 1, 12)))
+    compact_size, compact_districts = _allocated_size(
+        lambda: prepare(CompactDistrict("test", 1, 12, party_index))
+    )
+    assert compact_size * 1.7 < size
+
+    for district in (districts[0], compact_districts[0]):
+        copied = district.copy()
+        copied.add_votes("PiS", 1000)
+        assert district.get_number_of_votes("PiS") == 1000
+        assert copied.get_number_of_votes("PiS") == 2000
+        assert dict(copied.get_number_of_mandates()) == dict(
+            district.get_number_of_mandates()
+        )
+        copied.reset()
+        assert copied.get_number_of_votes("PiS") == 1000
@@ -1,4 +1,5 @@
 from ..scripts.district_database import DistrictDatabase
+from ..scripts.constants import LIST_OF_PARTIES
 
 database = DistrictDatabase(
     districts_path="./data/okregi_sejm.csv",
@@ -87,3 +88,301 @@ def test_get_mandates_flis():
     assert mandates["Lewica"] == 92
     assert mandates["TD"] == 92
     assert mandates["Konfederacja"] == 92
+
+
+def test_vote_matrix_engine():
+    matrix_database = DistrictDatabase(
+        districts_path="./data/okregi_sejm.csv",
+        parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+        list_leaders_path="./data/jedynki.csv",
+        population_path="./data/ludnosc_2022.csv",
+        area_path="./data/powierzchnia.csv",
+        use_vote_matrix=True,
+    )
+    dict_database = DistrictDatabase(
+        districts_path="./data/okregi_sejm.csv",
+        parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+        list_leaders_path="./data/jedynki.csv",
+        population_path="./data/ludnosc_2022.csv",
+        area_path="./data/powierzchnia.csv",
+    )
+    poll_results_percent = {
+        "PiS": 35,
+        "KO": 30,
+        "Lewica": 10,
+        "TD": 10,
+        "Konfederacja": 10,
+        "MN": 0.17,
+        "Inne": 4.83,
+    }
+    for db in (matrix_database, dict_database):
+        db.simulate_poll_results(poll_results_percent, 0.1)
+
+    assert matrix_database.get_number_of_mandates() == (
+        dict_database.get_number_of_mandates()
+    )
+    assert matrix_database.get_district("1").get_number_of_votes("PiS") == (
+        matrix_database.get_vote_matrix().get_votes()[0, 0]
+    )
+
+    matrix_database.reset_all_districts_state()
+    dict_database.reset_all_districts_state()
+    for party, percent in dict_database.get_results_percent().items():
+        assert abs(matrix_database.get_results_percent()[party] - percent) < 1e-9
+
+
+def test_simulate_poll_results_newton():
+    poll_results_percent = {
+        "PiS": 0.5,
+        "KO": 0.5,
+        "Lewica": 1,
+        "TD": 1,
+        "Konfederacja": 95,
+        "MN": 0.5,
+        "Inne": 1.5,
+    }
+    database.reset_all_districts_state()
+    fit_result = database.simulate_poll_results(
+        poll_results_percent, 1e-6, solver="newton"
+    )
+    results = database.get_results_percent()
+
+    assert fit_result.get_iterations() < 20
+    assert fit_result.get_residual_percent() <= 1e-6
+    for party, percent in poll_results_percent.items():
+        assert abs(results[party] - percent) <= 1e-6
+    for district in database.get_districts():
+        votes = sum(district.get_results().values())
+        assert abs(votes - district.get_sum_of_votes()) < 1e-6
+    database.reset_all_districts_state()
+
+
+def test_checkpoints():
+    poll_results_percent = {
+        "PiS": 30,
+        "KO": 30,
+        "Lewica": 10,
+        "TD": 15,
+        "Konfederacja": 10,
+        "MN": 0.17,
+        "Inne": 4.83,
+    }
+    database.reset_all_districts_state()
+    baseline_votes = database.get_district("1").get_number_of_votes("PiS")
+
+    database.simulate_poll_results(poll_results_percent, 0.1, solver="newton")
+    database.create_checkpoint("poll")
+    mandates = database.get_number_of_mandates()
+    fitted_votes = database.get_district("1").get_number_of_votes("PiS")
+
+    database.reset_all_districts_state()
+    assert database.get_district("1").get_number_of_votes("PiS") == baseline_votes
+    assert database.get_district("1").get_number_of_mandates() == {}
+
+    database.restore_checkpoint("poll")
+    assert database.get_district("1").get_number_of_votes("PiS") == fitted_votes
+    assert database.get_number_of_mandates() == mandates
+    assert database.get_checkpoint_names() == ["poll"]
+
+    database.delete_checkpoint("poll")
+    database.reset_all_districts_state()
+
+
+def test_overall_results_updated_incrementally():
+    database.reset_all_districts_state()
+    results = database.get_current_overall_results()
+    assert "PiS" in database.get_parties_over_threshold()
+
+    database.get_district("1").add_votes("PiS", 1000)
+    database.get_district("2").scale_votes({"KO": 0.5})
+    expected = dict(results)
+    expected["PiS"] += 1000
+    expected["KO"] -= database.get_district("2").get_number_of_votes("KO")
+
+    for party, votes in database.get_current_overall_results().items():
+        assert abs(votes - expected[party]) < 1e-6
+
+    # Cached parties over threshold are invalidated on write
+    for district in database.get_districts():
+        district.scale_votes({"PiS": 0.01})
+    assert "PiS" not in database.get_parties_over_threshold()
+    database.reset_all_districts_state()
+    assert "PiS" in database.get_parties_over_threshold()
+
+
+def test_population_and_area():
+    # Every powiat belongs to exactly one district
+    assert sum(district.get_population() for district in database.get_districts()) == (
+        37766327
+    )
+    assert database.get_district("8").get_population() == 979976
+
+
+def test_fit_poll_results():
+    database.reset_all_districts_state()
+    poll = {
+        "PiS": 35,
+        "KO": 30,
+        "Lewica": 10,
+        "TD": 10,
+        "Konfederacja": 10,
+        "MN": 0.1,
+        "Inne": 4.9,
+    }
+    votes, mandates = database.fit_poll_results(poll, 0.01)
+    # The database is not changed until results are applied
+    assert database.get_mandates_array() is None
+
+    database.apply_poll_results(votes, mandates)
+    assert abs(database.get_results_percent()["PiS"] - 35) < 0.01
+    assert sum(database.get_number_of_mandates().values()) == 460
+    database.reset_all_districts_state()
+
+
+def test_fit_poll_results_warm_start():
+    poll = {"PiS": 35, "KO": 30, "Lewica": 10, "TD": 10, "Konfederacja": 10}
+    poll.update({"MN": 0.1, "Inne": 4.9})
+    votes, mandates = database.fit_poll_results(poll, 0.001)
+
+    poll["PiS"], poll["KO"] = 34, 31
+    cold_votes, cold_mandates = database.fit_poll_results(poll, 0.001)
+    warm_votes, warm_mandates = database.fit_poll_results(poll, 0.001, votes)
+    assert abs(warm_votes - cold_votes).max() < 100
+    assert (warm_mandates == cold_mandates).all()
+
+    # Lewica has no votes in the start, so the saved state is used
+    poll["Lewica"], poll["KO"] = 0, 41
+    votes, _ = database.fit_poll_results(poll, 0.001, votes)
+    poll["Lewica"], poll["KO"] = 10, 31
+    warm_votes, _ = database.fit_poll_results(poll, 0.001, votes)
+    assert abs(warm_votes - cold_votes).max() < 100
+
+
+def test_update_poll_results():
+    database.reset_all_districts_state()
+    poll = {"PiS": 35, "KO": 30, "Lewica": 10, "TD": 10, "Konfederacja": 10}
+    poll.update({"MN": 0.1, "Inne": 4.9})
+    database.simulate_poll_results(poll, 0.001, solver="newton")
+
+    fit_result = database.update_poll_results({"PiS": -0.5, "KO": 0.5}, 0.001)
+    assert fit_result.get_iterations() <= 2
+    assert database.get_poll_results_percent()["PiS"] == 34.5
+    warm_mandates = database.get_number_of_mandates()
+
+    database.reset_all_districts_state()
+    assert database.get_poll_results_percent() is None
+    database.simulate_poll_results(
+        dict(poll, PiS=34.5, KO=30.5), 0.001, solver="newton"
+    )
+    assert database.get_number_of_mandates() == warm_mandates
+
+    # Lewica has no votes after the first fit, so the saved state is used
+    database.update_poll_results({"Lewica": -10, "KO": 10}, 0.001)
+    database.update_poll_results({"Lewica": 10, "KO": -10}, 0.001)
+    assert abs(database.get_results_percent()["Lewica"] - 10) < 0.001
+    database.reset_all_districts_state()
+
+
+def test_seat_margins():
+    database.reset_all_districts_state()
+    database.calculate_number_of_mandates_in_all_districts()
+    margins = database.get_seat_margins()
+    assert len(margins["district_ids"]) == 41
+    assert (margins["mandates"] == database.get_mandates_array()).all()
+    assert (margins["flip_margin"] > 0).all()
+    database.reset_all_districts_state()
+
+
+def test_compact_districts():
+    compact_database = DistrictDatabase(
+        districts_path="./data/okregi_sejm.csv",
+        parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+        list_leaders_path="./data/jedynki.csv",
+        population_path="./data/ludnosc_2022.csv",
+        area_path="./data/powierzchnia.csv",
+        load_holownia=False,
+        compact_districts=True,
+    )
+    database.reset_all_districts_state()
+    database.calculate_number_of_mandates_in_all_districts()
+    assert compact_database.get_number_of_mandates() == (
+        database.get_number_of_mandates()
+    )
+    assert compact_database.get_district("1").get_list_leader("KO") == (
+        database.get_district("1").get_list_leader("KO")
+    )
+    poll_results_percent = {
+        "PiS": 35,
+        "KO": 30,
+        "Lewica": 10,
+        "TD": 10,
+        "Konfederacja": 10,
+        "MN": 0.17,
+        "Inne": 4.83,
+    }
+    compact_database.simulate_poll_results(poll_results_percent, 0.1)
+    database.simulate_poll_results(poll_results_percent, 0.1)
+    assert compact_database.get_number_of_mandates() == (
+        database.get_number_of_mandates()
+    )
+    compact_database.reset_all_districts_state()
+    database.reset_all_districts_state()
+    assert (compact_database.get_votes_array() == database.get_votes_array()).all()
+
+
+def test_apportionment_methods():
+    database.reset_all_districts_state()
+    database.calculate_number_of_mandates_in_all_districts()
+    all_methods = database.get_number_of_mandates_all_methods()
+    assert all_methods["dhont"] == database.get_number_of_mandates()
+    for mandates in all_methods.values():
+        assert sum(mandates.values()) == 460
+    # Sainte-Laguë is less favourable for the largest party
+    assert all_methods["sainte_lague"]["PiS"] < all_methods["dhont"]["PiS"]
+
+    database.calculate_number_of_mandates_in_all_districts("sainte_lague")
+    assert database.get_number_of_mandates() == all_methods["sainte_lague"]
+
+    _, mandates = database.fit_poll_results(
+        database.get_results_percent(), 0.01, method="hare"
+    )
+    assert dict(zip(LIST_OF_PARTIES, mandates.sum(axis=0).tolist())) == (
+        all_methods["hare"]
+    )
+    try:
+        database.calculate_number_of_mandates_in_all_districts("unknown")
+        assert False
+    except ValueError:
+        pass
+    database.calculate_number_of_mandates_in_all_districts()
+
+
+def test_fit_polls_batched():
+    polls = [
+        [35, 30, 10, 10, 10, 0.17, 4.83],
+        [30, 35, 4.5, 8.5, 12, 0.17, 9.83],
+        [40, 25, 12, 7.5, 9, 0.3, 6.2],
+    ]
+    votes, mandates, converged = database.fit_polls_batched(polls, 0.01)
+    assert votes.shape == (3, 41, len(LIST_OF_PARTIES))
+    assert converged.all()
+
+    for poll, scenario_votes, scenario_mandates in zip(polls, votes, mandates):
+        database.reset_all_districts_state()
+        database.simulate_poll_results(dict(zip(LIST_OF_PARTIES, poll)), 0.01)
+        assert abs(database.get_votes_array() - scenario_votes).max() < 1e-6
+        assert dict(zip(LIST_OF_PARTIES, scenario_mandates.sum(axis=0).tolist())) == (
+            database.get_number_of_mandates()
+        )
+    database.reset_all_districts_state()
+
+    _, _, converged = database.fit_polls_batched([[50, 50, 0, 0, 0, 0, 0]], 0.01)
+    assert converged.all()
+    try:
+        database.fit_polls_batched([[50, 50, 10, 0, 0, 0, -10]], 0.01)
+        assert False
+    except ValueError:
+        pass
@@ -0,0 +1,49 @@
+import csv
+import io
+
+import pytest
+
+from ..scripts.district_database import DistrictDatabase
+from ..scripts.district_results_generator import DistrictResultsGenerator
+
+
+def aggregate_results():
+    with open("./data/wyniki_gl_na_kand_po_powiatach_utf8.csv", "r") as powiat_file, open(
+        "./data/okregi_sejm.csv", "r"
+    ) as districts_file:
+        return DistrictResultsGenerator.aggregate_results(powiat_file, districts_file)
+
+
+def test_aggregate_results():
+    results = aggregate_results()
+    assert len(results.get_district_ids()) == 41
+    assert "Nr OKW" not in results.get_columns()
+    # Every powiat is counted in exactly one district
+    assert sum(results.get_column("Liczba głosów ważnych").values()) == 19425459
+
+
+def test_generated_file_is_up_to_date():
+    output_file = io.StringIO()
+    DistrictResultsGenerator.write_results(aggregate_results(), output_file)
+    output_file.seek(0)
+    with open("./data/districts_results_2020_AUTO.csv", "r") as generated_file:
+        assert list(csv.DictReader(output_file, delimiter=";")) == list(
+            csv.DictReader(generated_file, delimiter=";")
+        )
+
+
+def test_database_from_aggregated_results():
+    paths = {
+        "districts_path": "./data/okregi_sejm.csv",
+        "parlamentary2019_election_path": "./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        "list_leaders_path": "./data/jedynki.csv",
+        "population_path": "./data/ludnosc_2022.csv",
+        "area_path": "./data/powierzchnia.csv",
+    }
+    from_file = DistrictDatabase(
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv", **paths
+    )
+    in_memory = DistrictDatabase(presidential2020_results=aggregate_results(), **paths)
+    assert in_memory.get_current_overall_results() == pytest.approx(
+        from_file.get_current_overall_results()
+    )
@@ -0,0 +1,120 @@
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from ..scripts.batch import load_database
+from ..scripts.constants import LIST_OF_PARTIES
+from ..scripts.export import (
+    current_state_batches,
+    export_batches,
+    get_columns,
+    main,
+    poll_batches,
+    read_npz_export,
+)
+
+POLLS = [
+    ("a", [35, 30, 10, 10, 10, 0.17, 4.83]),
+    ("b", [30, 35, 4.5, 8.5, 12, 0.17, 9.83]),
+    ("c", [40, 25, 12, 7.5, 9, 0.3, 6.2]),
+]
+
+
+def test_export_formats(tmp_path):
+    database = load_database("./data")
+    rows = {}
+    for format in ["csv", "jsonl", "npz"]:
+        path = str(tmp_path / f"export.{format}")
+        n_rows = export_batches(
+            database, poll_batches(database, POLLS, batch_size=2), path
+        )
+        assert n_rows == 3 * 41
+        if format == "csv":
+            with open(path, "r") as csv_file:
+                rows[format] = list(csv.DictReader(csv_file, delimiter=";"))
+            assert list(rows[format][0]) == get_columns()
+        elif format == "jsonl":
+            with open(path, "r") as jsonl_file:
+                rows[format] = [json.loads(line) for line in jsonl_file]
+        else:
+            rows[format] = read_npz_export(path)
+
+    assert rows["jsonl"][41]["scenario"] == "b"
+    assert rows["jsonl"][41]["district"] == "1"
+    assert float(rows["csv"][41]["seats_KO"]) == rows["jsonl"][41]["seats_KO"]
+    assert rows["npz"]["seats_KO"][41] == rows["jsonl"][41]["seats_KO"]
+
+    # Seats and percentages agree with a fitted database
+    seats = sum(row["seats_PiS"] for row in rows["jsonl"] if row["scenario"] == "c")
+    database.simulate_poll_results(dict(zip(LIST_OF_PARTIES, POLLS[2][1])), 0.01)
+    assert seats == database.get_number_of_mandates()["PiS"]
+    percent = database.get_district("1").get_results_percent()["PiS"]
+    assert abs(rows["npz"]["percent_PiS"][82] - percent) < 1e-3
+    database.reset_all_districts_state()
+
+
+def test_export_current_state(tmp_path):
+    database = load_database("./data")
+    path = str(tmp_path / "state.npz")
+    assert export_batches(database, current_state_batches(database), path) == 41
+    columns = read_npz_export(path)
+    district = database.get_district("13")
+    assert columns["population"][12] == district.get_population()
+    assert columns["votes_per_seat"][12] == district.get_votes_per_seat()
+    assert np.isclose(
+        columns["votes_KO"][12], district.get_number_of_votes("KO")
+    )
+
+
+def test_main(tmp_path):
+    input_path = tmp_path / "polls.jsonl"
+    input_path.write_text(
+        "\n".join(
+            json.dumps(dict(zip(LIST_OF_PARTIES, poll), id=id)) for id, poll in POLLS
+        )
+    )
+    output_path = tmp_path / "export.csv"
+    main([str(input_path), "--output", str(output_path), "--batch-size", "2"])
+    assert len(output_path.read_text().splitlines()) == 1 + 3 * 41
+
+
+def test_main_skipped_scenarios(tmp_path, capsys):
+    # d has a negative result, MN cannot get 30% in its only district
+    polls = POLLS + [
+        ("d", [40, 30, -10, 10, 10, 0.17, 19.83]),
+        ("e", [30, 20, 10, 5, 5, 30, 0]),
+    ]
+    lines = [
+        json.dumps(dict(zip(LIST_OF_PARTIES, poll), id=id)) for id, poll in polls
+    ]
+    # Malformed records at positions 5, 6 and 7
+    lines += ["{bad json", "[1, 2]", json.dumps({"PiS": [1], "id": "x"})]
+    input_path = tmp_path / "polls.jsonl"
+    input_path.write_text("\n".join(lines))
+    output_path = tmp_path / "export.jsonl"
+    main([str(input_path), "--output", str(output_path), "--batch-size", "2"])
+
+    ids = {json.loads(line)["scenario"] for line in output_path.open()}
+    assert ids == {"a", "b", "c"}
+    errors = capsys.readouterr().err
+    assert "5 scenarios skipped" in errors
+    assert "d: Negative result of Lewica" in errors
+    assert "e: Poll results could not be fitted" in errors
+    assert "  5: " in errors
+    assert "6: Record must be an object" in errors
+    assert "  x: " in errors
+
+
+def test_failed_export_removes_output(tmp_path):
+    database = load_database("./data")
+
+    def batches():
+        yield from poll_batches(database, POLLS[:1])
+        raise RuntimeError("failed")
+
+    path = tmp_path / "export.csv"
+    with pytest.raises(RuntimeError):
+        export_batches(database, batches(), str(path))
+    assert list(tmp_path.iterdir()) == []
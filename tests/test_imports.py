@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+# Generous limit of the import time of the computation core in a fresh interpreter,
+# most of it is numpy
+IMPORT_TIME_LIMIT_SECONDS = 1.5
+
+SCRIPTS_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "scripts")
+
+IMPORT_CORE = """
+import json, sys, time
+start = time.perf_counter()
+import district, district_database, district_results_generator, batch
+elapsed = time.perf_counter() - start
+heavy = [
+    name for name in sys.modules
+    if name.split(".")[0] in ("PySide2", "matplotlib", "gui", "multiprocessing")
+]
+print(json.dumps({"elapsed": elapsed, "heavy": heavy}))
+"""
+
+
+def test_core_does_not_import_gui():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_CORE],
+        cwd=SCRIPTS_PATH,
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    result = json.loads(output)
+    assert result["heavy"] == []
+    assert result["elapsed"] < IMPORT_TIME_LIMIT_SECONDS
@@ -0,0 +1,72 @@
+import io
+
+from ..scripts.instrumentation import CalculationStats, profile
+from ..scripts.district_database import DistrictDatabase
+
+POLL = {
+    "PiS": 35,
+    "KO": 30,
+    "Lewica": 10,
+    "TD": 10,
+    "Konfederacja": 10,
+    "MN": 0.17,
+    "Inne": 4.83,
+}
+
+
+def _load_database():
+    return DistrictDatabase(
+        districts_path="./data/okregi_sejm.csv",
+        parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+        list_leaders_path="./data/jedynki.csv",
+        population_path="./data/ludnosc_2022.csv",
+        area_path="./data/powierzchnia.csv",
+    )
+
+
+def test_calculation_stats():
+    stats = CalculationStats()
+    stats.increment("a")
+    stats.increment("a", 2)
+    stats.set_value("residual", 0.5)
+    with stats.timer("t"):
+        pass
+    with stats.timer("t"):
+        pass
+
+    assert stats.get_counter("a") == 3
+    assert stats.get_counter("b") == 0
+    assert stats.get_timers()["t"]["count"] == 2
+    assert stats.as_dict()["values"] == {"residual": 0.5}
+    stats.reset()
+    assert stats.as_dict() == {"counters": {}, "timers": {}, "values": {}}
+
+
+def test_instrument_database():
+    database = _load_database()
+    assert database.get_stats() is None
+
+    with database.instrument() as stats:
+        fit_result = database.simulate_poll_results(POLL, 0.01)
+    assert database.get_stats() is None
+
+    assert stats.get_counter("fits") == 1
+    assert stats.get_counter("fit_iterations") == fit_result.get_iterations()
+    assert stats.get_counter("scale_results_calls") == fit_result.get_iterations()
+    assert stats.get_counter("dhont_passes") == 1
+    assert stats.get_counter("threshold_recomputations") > 0
+    assert stats.get_value("fit_residual_percent") <= 0.01
+    assert set(stats.get_timers()) == {"fit", "dhont"}
+
+    # Nothing is collected outside of the block
+    database.calculate_number_of_mandates_in_all_districts()
+    assert stats.get_counter("dhont_passes") == 1
+
+
+def test_profile_report():
+    report = io.StringIO()
+    with profile(report):
+        _load_database()
+    assert "cumulative" in report.getvalue()
+    assert "_load_parlamentary_election" in report.getvalue()
@@ -0,0 +1,49 @@
+import numpy as np
+
+from ..scripts.district_database import DistrictDatabase
+from ..scripts.monte_carlo import draw_polls
+
+database = DistrictDatabase(
+    districts_path="./data/okregi_sejm.csv",
+    parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+    presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+    list_leaders_path="./data/jedynki.csv",
+    population_path="./data/ludnosc_2022.csv",
+    area_path="./data/powierzchnia.csv",
+)
+
+poll_results_percent = {
+    "PiS": 36,
+    "KO": 31,
+    "Lewica": 9,
+    "TD": 13,
+    "Konfederacja": 8,
+    "MN": 0.17,
+    "Inne": 2.83,
+}
+
+
+def test_draw_polls():
+    rng = np.random.default_rng(0)
+    for error_model in ("dirichlet", "normal"):
+        polls = draw_polls([40, 60, 0], 100, rng, error_model=error_model)
+        assert polls.shape == (100, 3)
+        assert np.allclose(polls.sum(axis=1), 100)
+        assert (polls[:, 2] == 0).all()
+
+
+def test_simulate_many():
+    summary = database.simulate_many(poll_results_percent, 200, n_workers=1, seed=1)
+    assert summary["n_draws"] == 200
+    assert summary["n_failed_draws"] == 0
+
+    quantiles = summary["seat_quantiles"]["PiS"]
+    assert quantiles[0.05] <= quantiles[0.5] <= quantiles[0.95]
+    assert 0 <= summary["majority_probability"]["OPPOSITION"] <= 1
+    assert summary["threshold_probability"]["PiS"] == 1
+    assert summary["threshold_probability"]["Inne"] == 0
+
+    # Same seed gives the same results
+    assert summary == database.simulate_many(
+        poll_results_percent, 200, n_workers=1, seed=1
+    )
@@ -0,0 +1,47 @@
+import pytest
+
+from ..scripts.powiat_index import (
+    AmbiguousPowiatError,
+    PowiatIndex,
+    UnknownPowiatError,
+    normalize_powiat_name,
+)
+
+ROWS = [
+    {"Kod": "0000000", "Nazwa": "POLSKA"},
+    {"Kod": "0200000", "Nazwa": "DOLNOŚLĄSKIE"},
+    {"Kod": "0206000", "Nazwa": "Powiat karkonoski"},
+    {"Kod": "0207000", "Nazwa": "Powiat kłodzki"},
+    {"Kod": "0265000", "Nazwa": "Powiat m. Wałbrzych od 2013"},
+    {"Kod": "1202000", "Nazwa": "Powiat brzeski"},
+    {"Kod": "1210000", "Nazwa": "Powiat limanowski"},
+    {"Kod": "1601000", "Nazwa": "Powiat brzeski"},
+    {"Kod": "0416000", "Nazwa": "Powiat wąbrzeski"},
+]
+
+
+def test_normalize_powiat_name():
+    assert normalize_powiat_name("Powiat m. st. Warszawa") == "Warszawa"
+    assert normalize_powiat_name("Powiat m. Wałbrzych od 2013") == "Wałbrzych"
+    assert normalize_powiat_name("Powiat świdnicki DOL") == "świdnicki DOL"
+
+
+def test_resolve_boundaries():
+    index = PowiatIndex(ROWS)
+    assert index.resolve_boundaries("województwo dolnośląskie") == ["02"]
+    assert index.resolve_boundaries("jeleniogórski, kłodzki, Wałbrzych") == [
+        "0206",
+        "0207",
+        "0265",
+    ]
+    # "brzeski" is not matched with "wąbrzeski" and is resolved by voivodeship
+    assert index.resolve_boundaries("brzeski, limanowski") == ["1202", "1210"]
+    assert index.resolve_boundaries("kłodzki, zagranica, statki") == ["0207"]
+
+
+def test_unknown_and_ambiguous_powiat():
+    index = PowiatIndex(ROWS)
+    with pytest.raises(UnknownPowiatError):
+        index.resolve_boundaries("kłodzki, nieznany")
+    with pytest.raises(AmbiguousPowiatError):
+        index.resolve_boundaries("brzeski")
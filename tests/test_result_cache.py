@@ -0,0 +1,129 @@
+import os
+import time
+
+from ..scripts.district_database import DistrictDatabase
+from ..scripts.result_cache import CachedDatabase, ResultCache, make_key
+
+POLL = {
+    "PiS": 35,
+    "KO": 30,
+    "Lewica": 10,
+    "TD": 10,
+    "Konfederacja": 10,
+    "MN": 0.17,
+    "Inne": 4.83,
+}
+
+
+def _load_database():
+    return DistrictDatabase(
+        districts_path="./data/okregi_sejm.csv",
+        parlamentary2019_election_path="./data/wyniki_gl_na_listy_po_okregach_sejm.csv",
+        presidential2020_election_path="./data/districts_results_2020_AUTO.csv",
+        list_leaders_path="./data/jedynki.csv",
+        population_path="./data/ludnosc_2022.csv",
+        area_path="./data/powierzchnia.csv",
+    )
+
+
+def test_make_key():
+    close_poll = dict(POLL, PiS=35.001)
+    assert make_key("a", "f", "dhont", POLL, 0.01) == make_key(
+        "a", "f", "dhont", close_poll, 0.01
+    )
+    assert make_key("a", "f", "dhont", POLL, 0.01) != make_key(
+        "a", "f", "dhont", dict(POLL, PiS=35.1), 0.01
+    )
+    assert make_key("a", "f", "dhont", POLL, 0.01) != make_key(
+        "a", "f", "hare", POLL, 0.01
+    )
+
+
+def test_lru_and_ttl():
+    cache = ResultCache(max_size=2, ttl_seconds=0.05)
+    calls = []
+
+    def calculate(value):
+        calls.append(value)
+        return value
+
+    assert cache.get("a", lambda: calculate(1)) == 1
+    assert cache.get("a", lambda: calculate(2)) == 1
+    cache.get("b", lambda: calculate(3))
+    cache.get("c", lambda: calculate(4))
+    assert cache.get("a", lambda: calculate(5)) == 5
+    stats = cache.get_stats()
+    assert stats["hits"] == 1 and stats["misses"] == 4
+    assert stats["evictions"] == 2 and stats["size"] == 2
+
+    time.sleep(0.06)
+    assert cache.get("a", lambda: calculate(6)) == 6
+    assert calls == [1, 3, 4, 5, 6]
+
+
+def test_disk_cache(tmp_path):
+    ResultCache(cache_dir=str(tmp_path)).get(("a", 1), lambda: {"PiS": 200})
+    cache = ResultCache(cache_dir=str(tmp_path))
+    assert cache.get(("a", 1), lambda: {"PiS": 0}) == {"PiS": 200}
+    assert cache.get_stats()["disk_hits"] == 1
+
+
+def test_cached_database():
+    database = _load_database()
+    cached_database = CachedDatabase(database)
+
+    mandates = cached_database.get_number_of_mandates(POLL, 0.01)
+    database.reset_all_districts_state()
+    assert cached_database.get_number_of_mandates(POLL, 0.01) == mandates
+    # The database was not fitted again
+    assert database.get_number_of_mandates() != mandates
+
+    assert cached_database.get_number_of_mandates(POLL, 0.01, "sainte_lague") != (
+        mandates
+    )
+    flis = cached_database.get_number_of_mandates_flis(POLL)
+    assert flis == database.get_number_of_mandates_flis(POLL)
+    cached_database.get_number_of_mandates_flis(POLL)
+    assert cached_database.get_cache().get_stats()["hits"] == 2
+
+    fingerprint = database.get_fingerprint()
+    assert fingerprint == _load_database().get_fingerprint()
+    database.simulate_poll_results(POLL, 0.01)
+    database.save_all_districts_state()
+    assert database.get_fingerprint() != fingerprint
+
+
+def test_cached_database_solver_and_order():
+    # Iterative and Newton fits of this poll give different seats
+    poll = {
+        "PiS": 1.97,
+        "KO": 39.06,
+        "Lewica": 30.99,
+        "TD": 5.13,
+        "Konfederacja": 18.05,
+        "MN": 1.11,
+        "Inne": 3.69,
+    }
+    database = _load_database()
+    cached_database = CachedDatabase(database)
+    iterative = cached_database.get_number_of_mandates(poll, 0.01)
+    newton = cached_database.get_number_of_mandates(poll, 0.01, solver="newton")
+    database.reset_all_districts_state()
+    database.simulate_poll_results(poll, 0.01, "newton")
+    assert newton == database.get_number_of_mandates() != iterative
+
+    # Cached seats do not depend on the state left by earlier queries
+    fresh_database = _load_database()
+    fresh_database.simulate_poll_results(POLL, 0.01)
+    assert cached_database.get_number_of_mandates(POLL, 0.01) == (
+        fresh_database.get_number_of_mandates()
+    )
+
+
+def test_disk_cache_write_failure(tmp_path):
+    cache = ResultCache(cache_dir=str(tmp_path))
+    # A directory in place of the entry makes the write fail
+    os.mkdir(cache._get_path(("a", 1)))
+    assert cache.get(("a", 1), lambda: {"PiS": 200}) == {"PiS": 200}
+    assert cache.get(("a", 1), lambda: {"PiS": 0}) == {"PiS": 200}
+    assert [path.suffix for path in tmp_path.iterdir()] == [".json"]
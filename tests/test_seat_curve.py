@@ -0,0 +1,85 @@
+import numpy as np
+
+from ..scripts.apportionment import (
+    allocate_dhont_all_districts,
+    select_parties_over_threshold,
+)
+from ..scripts.batch import load_database
+from ..scripts.seat_curve import calculate_seat_curve
+
+PARTIES = ["PiS", "KO", "Lewica", "TD", "Konfederacja", "MN", "Inne"]
+VOTES = np.array(
+    [
+        [4000, 3000, 1000, 900, 600, 0, 500],
+        [2500, 4200, 1500, 700, 800, 0, 300],
+        [5200, 2100, 600, 1100, 900, 200, 400],
+    ],
+    dtype=np.float64,
+)
+N_SEATS = np.array([7, 9, 12])
+
+
+def test_seat_curve_matches_allocation():
+    grid = np.linspace(0, 40, 401)
+    curve = calculate_seat_curve(VOTES, N_SEATS, PARTIES, "TD", grid)
+
+    # Rescale votes of other parties in districts for every share on the grid
+    td = PARTIES.index("TD")
+    for share, seats in zip(grid[1:], curve["seats"][1:]):
+        low, high = -30.0, 30.0
+        for _ in range(100):
+            scale = np.exp((low + high) / 2)
+            votes = VOTES.copy()
+            votes[:, td] *= scale
+            votes *= (VOTES.sum(axis=1) / votes.sum(axis=1))[:, None]
+            if votes[:, td].sum() / votes.sum() * 100 < share:
+                low = (low + high) / 2
+            else:
+                high = (low + high) / 2
+        results = dict(zip(PARTIES, votes.sum(axis=0)))
+        parties = select_parties_over_threshold(results, votes.sum())
+        eligible = [party in parties for party in PARTIES]
+        expected = allocate_dhont_all_districts(votes, N_SEATS, eligible)[:, td]
+        assert seats == expected.sum()
+
+    assert (curve["seats"][grid <= 8] == 0).all()
+    assert curve["district_seats"].shape == (401, 3)
+
+
+def test_breakpoints():
+    grid = np.linspace(0, 40, 401)
+    curve = calculate_seat_curve(VOTES, N_SEATS, PARTIES, "KO", grid)
+    breakpoints = curve["breakpoints_percent"]
+    assert (np.diff(breakpoints) > 0).all()
+    assert 5 in np.round(curve["threshold_breakpoints_percent"], 6)
+
+    # Seats between breakpoints agree with seats on the grid
+    piece = np.searchsorted(breakpoints, grid, side="right") - 1
+    from_breakpoints = np.where(
+        piece >= 0, curve["seats_after_breakpoints"][np.maximum(piece, 0)], 0
+    )
+    assert (from_breakpoints == curve["seats"]).all()
+
+
+def test_fitted_seat_curve_matches_simulation():
+    database = load_database("./data")
+    grid = np.array([3, 7.5, 12, 25, 40])
+    curve = database.seat_curve("PiS", grid)
+
+    results = database.get_current_overall_results()
+    others = sum(results.values()) - results["PiS"]
+    for share, seats in zip(grid, curve["seats"]):
+        poll = {
+            party: votes / others * (100 - share) for party, votes in results.items()
+        }
+        poll["PiS"] = share
+        database.reset_all_districts_state()
+        database.simulate_poll_results(poll, 0.01)
+        assert seats == database.get_number_of_mandates()["PiS"]
+    database.reset_all_districts_state()
+
+    breakpoints = curve["breakpoints_percent"]
+    assert (np.diff(breakpoints) > 0).all()
+    piece = np.searchsorted(breakpoints, grid, side="right") - 1
+    assert (curve["seats_after_breakpoints"][piece[1:]] == curve["seats"][1:]).all()
+    assert 5 in curve["threshold_breakpoints_percent"]
@@ -0,0 +1,82 @@
+import http.client
+import json
+import multiprocessing
+import threading
+import urllib.error
+import urllib.request
+
+from ..scripts.server import ScoringServer
+
+POLL = {"PiS": 35, "KO": 30, "Lewica": 10, "TD": 10, "Konfederacja": 10, "MN": 0.17}
+
+
+def _request(port, path, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", data=data)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_server():
+    server = ScoringServer(("127.0.0.1", 0), n_workers=1, max_concurrent=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    port = server.server_address[1]
+    try:
+        status, health = _request(port, "/health")
+        assert status == 200 and health["workers"] == 1
+
+        status, answer = _request(port, "/seats", {"poll": POLL})
+        assert status == 200
+        assert sum(answer["seats"].values()) == 460
+        # The second request is answered from the cache
+        assert _request(port, "/seats", {"poll": POLL})[1] == answer
+
+        status, answer = _request(port, "/districts", {"poll": POLL, "method": "hare"})
+        assert status == 200 and len(answer["districts"]) == 41
+
+        status, answer = _request(port, "/flis", {"polls": [POLL, dict(POLL, id="b")]})
+        assert status == 200
+        assert [result["id"] for result in answer["results"]] == [None, "b"]
+
+        assert _request(port, "/seats", {"poll": dict(POLL, KO=-1)})[0] == 400
+        assert _request(port, "/seats", {"poll": POLL, "method": "x"})[0] == 400
+        assert _request(port, "/unknown")[0] == 404
+        assert _request(port, "/seats")[0] == 405
+
+        status, metrics = _request(port, "/metrics")
+        assert metrics["requests"] == 6 and metrics["errors"] == 2
+        assert metrics["endpoints"]["/seats"]["requests"] == 4
+        assert metrics["cache"]["hits"] == 1
+        assert metrics["in_flight"] == 0
+
+        for length in ["abc", "-1"]:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            connection.putrequest("POST", "/seats")
+            connection.putheader("Content-Length", length)
+            connection.endheaders()
+            response = connection.getresponse()
+            assert response.status == 400
+            assert "error" in json.loads(response.read())
+            connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def test_port_in_use():
+    server = ScoringServer(("127.0.0.1", 0), n_workers=1)
+    try:
+        workers = multiprocessing.active_children()
+        try:
+            ScoringServer(server.server_address, n_workers=1)
+            assert False
+        except OSError:
+            # Workers of the server which could not bind are terminated
+            assert multiprocessing.active_children() == workers
+    finally:
+        server.server_close()
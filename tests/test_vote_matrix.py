@@ -0,0 +1,36 @@
+from ..scripts.district import District
+from ..scripts.vote_matrix import VoteMatrix
+
+
+def create_vote_matrix():
+    districts = [
+        District("A", "1", 3, {"X": 100, "Y": 300}, 400),
+        District("B", "2", 2, {"X": 50, "Y": 50}, 100),
+    ]
+    return districts, VoteMatrix.from_districts(districts, ["X", "Y"])
+
+
+def test_overall_results():
+    _, vote_matrix = create_vote_matrix()
+    assert vote_matrix.get_sum_of_votes() == 500
+    assert vote_matrix.get_overall_results() == {"X": 150, "Y": 350}
+    assert vote_matrix.get_results_percent()["X"] == 30
+
+
+def test_scale_and_rescale():
+    _, vote_matrix = create_vote_matrix()
+    vote_matrix.scale_votes({"X": 2})
+    vote_matrix.rescale_votes_to_100_percent()
+    expected = 200 / 500 * 400 + 100 / 150 * 100
+    assert abs(vote_matrix.get_overall_results()["X"] - expected) < 1e-9
+    row_sums = vote_matrix.get_votes().sum(axis=1)
+    assert abs(row_sums[0] - 400) < 1e-9 and abs(row_sums[1] - 100) < 1e-9
+
+
+def test_district_view():
+    districts, vote_matrix = create_vote_matrix()
+    districts[0].bind_results(vote_matrix.get_row_view("1"))
+    districts[0].add_votes("X", 100)
+    assert vote_matrix.get_overall_results()["X"] == 250
+    assert districts[0].get_results_percent()["X"] == 50
+